@@ -0,0 +1,174 @@
+"""
+Batch Position Analysis
+DS 3500 Final Project
+
+Streams an EPD file through a pool of worker processes and writes one JSON line per position,
+in the order of the file. Only a few positions are in flight at once, so memory doesn't grow with
+the file, and a run that was interrupted picks up after the last line it wrote.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import sys
+import time
+
+# Depth to search to when only a node budget is given
+MAX_DEPTH = 64
+# Positions queued per worker, enough to keep every worker busy while results are written in order
+IN_FLIGHT_PER_WORKER = 2
+
+# Game kept by each worker process between positions
+_worker_game = None
+
+
+def _init_worker(hash_size):
+    global _worker_game
+    from chess import Chess
+    _worker_game = Chess(hash_size=hash_size)
+
+
+def parse_epd(line):
+    """ Split an EPD line into its FEN and its operations
+    :param line: i.e. 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - bm e4; id "start";'
+    :return: (fen, {opcode: operand})
+    """
+    fields = line.split(maxsplit=4)
+    if len(fields) < 4:
+        raise ValueError(f'EPD needs placement, side to move, castling and en passant fields: {line!r}')
+    operations = {}
+    if len(fields) == 5:
+        for operation in fields[4].split(';'):
+            opcode, _, operand = operation.strip().partition(' ')
+            if opcode:
+                operations[opcode] = operand.strip().strip('"')
+    return ' '.join(fields[:4]), operations
+
+
+def analyse_position(number, line, depth, node_limit):
+    """ Worker task: search one EPD position
+    :param number: line number of the position in the EPD file
+    :return: dict of the result, written as one JSON line
+    """
+    from chess import Chess
+
+    result = {'line': number}
+    try:
+        fen, operations = parse_epd(line)
+        game = _worker_game
+        game.load_fen(fen)
+    except ValueError as error:
+        result['error'] = str(error)
+        return result
+
+    # Every position starts from an empty table and fresh move ordering, so results don't depend on which
+    # worker got what
+    game.transposition_table.clear()
+    game.engine.orderer.reset()
+    game.engine_color = game.turn
+    search_start = time.perf_counter()
+    try:
+        search = game.engine.search(depth, node_limit=node_limit)
+    except Exception as error:
+        # Written like a malformed position, so one bad line doesn't stop the run (or every run resuming it)
+        result['error'] = f'{type(error).__name__}: {error}'
+        return result
+    stats = game.engine.stats
+    result.update({
+        'id': operations.get('id'),
+        'fen': fen,
+        'move': Chess.uncoordinate(search.move[0]) + Chess.uncoordinate(search.move[1]) if search.move else None,
+        'score': search.score,
+        'depth': search.depth,
+        'seldepth': stats.seldepth,
+        'nodes': search.nodes,
+        'time': time.perf_counter() - search_start,
+        'pv': [Chess.uncoordinate(start) + Chess.uncoordinate(end) for start, end in search.pv],
+        'operations': operations,
+    })
+    return result
+
+
+def positions(path):
+    """ Yield (line number, line) of every position in an EPD file, skipping blank and comment lines """
+    with open(path) as epd:
+        for number, line in enumerate(epd, start=1):
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield number, line
+
+
+def completed_lines(path):
+    """ Count the results already written to path, dropping a last line cut off by an interruption """
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    complete = 0
+    with open(path, 'rb+') as output:
+        for line in output:
+            if not line.endswith(b'\n'):
+                break
+            count += 1
+            complete += len(line)
+        output.truncate(complete)
+    return count
+
+
+def analyse(epd_path, output_path, depth=None, node_limit=None, workers=None, hash_size=16):
+    """ Analyse every position of an EPD file, appending the results to a JSONL file
+    :param depth: depth to search each position to (4 by default, unlimited when a node budget is given)
+    :param node_limit: nodes to search each position for at most
+    :param workers: number of worker processes, defaults to the number of cores
+    :param hash_size: transposition table size of each worker in MB
+    :return: number of positions analysed by this run
+    """
+    if depth is None:
+        depth = MAX_DEPTH if node_limit is not None else 4
+    workers = workers or os.cpu_count() or 1
+    done = completed_lines(output_path)
+    if done:
+        print(f'resuming after {done} positions', file=sys.stderr)
+
+    analysed = 0
+    pending = deque()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(hash_size,)) as executor, \
+            open(output_path, 'a') as output:
+
+        def write(future):
+            output.write(json.dumps(future.result()) + '\n')
+            output.flush()
+
+        for index, (number, line) in enumerate(positions(epd_path)):
+            if index < done:
+                continue
+            pending.append(executor.submit(analyse_position, number, line, depth, node_limit))
+            analysed += 1
+            if len(pending) >= IN_FLIGHT_PER_WORKER * workers:
+                write(pending.popleft())
+        while pending:
+            write(pending.popleft())
+
+    return analysed
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Analyse every position of an EPD file and write the results '
+                                                 'as JSON lines')
+    parser.add_argument('epd', help='EPD file, one position per line')
+    parser.add_argument('output', help='JSONL file to append results to, an existing file is resumed')
+    parser.add_argument('--depth', type=int, default=None, help='depth per position (default: 4)')
+    parser.add_argument('--nodes', type=int, default=None, help='node budget per position')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--hash', type=int, default=16, help='transposition table size per worker in MB')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    analysed = analyse(args.epd, args.output, args.depth, args.nodes, args.workers, args.hash)
+    print(f'{analysed} positions in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
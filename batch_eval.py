@@ -0,0 +1,270 @@
+"""
+Batched Leaf Evaluation
+DS 3500 Final Project
+
+Scores many positions at once with NumPy, matching Chess.evaluate term for term.
+"""
+
+import numpy as np
+from psqt import MIDGAME, ENDGAME, PHASE_WEIGHTS, MAX_PHASE
+from weights import WEIGHTS, DEFAULT_WEIGHTS
+
+# Positions are (N, 64) int8 arrays indexed row * 8 + column like chessboard.board,
+# White pieces are positive codes and Black pieces the same codes negated
+NAMES = ('Pawn', 'Knight', 'Bishop', 'Rook', 'Queen', 'King')
+CODES = {name: code for code, name in enumerate(NAMES, start=1)}
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+# Marks squares past the edge of the board when the board is shifted
+OFFBOARD = 127
+
+VALUES = np.array([0, 1, 3, 3.25, 5, 9, 1000], dtype=np.float64)
+PHASES = np.array([0] + [PHASE_WEIGHTS[name] for name in NAMES], dtype=np.float64)
+
+
+def _tables(tables):
+    """ (13, 64) lookup of piece-square values indexed by code + 6 """
+    lookup = np.zeros((13, 64))
+    for code, name in enumerate(NAMES, start=1):
+        lookup[6 + code] = np.array(tables[('White', name)]).ravel()
+        lookup[6 - code] = -np.array(tables[('Black', name)]).ravel()
+    return lookup
+
+
+MIDGAME_TABLE = _tables(MIDGAME)
+ENDGAME_TABLE = _tables(ENDGAME)
+
+CENTER = np.zeros((8, 8), dtype=bool)
+CENTER[3:5, 2:6] = True
+
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (2, 1), (2, -1), (1, -2), (1, 2))
+KING_STEPS = ((0, -1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (1, 1), (1, 0), (1, -1))
+STRAIGHT_STEPS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+DIAGONAL_STEPS = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+
+
+def encode(board):
+    """ Encode a 2d list of pieces as a (64,) int8 array """
+    codes = np.zeros(64, dtype=np.int8)
+    for row in range(8):
+        for column in range(8):
+            piece = board[row][column]
+            if piece != '--':
+                codes[row * 8 + column] = CODES[piece.name] if piece.color == 'White' else -CODES[piece.name]
+    return codes
+
+
+def _shift(boards, d_row, d_column, fill):
+    """ For every square, what lies d_row, d_column away from it (fill past the edge)
+    :param boards: (N, 8, 8) array
+    :return: (N, 8, 8) array
+    """
+    shifted = np.full_like(boards, fill)
+    rows = slice(max(0, -d_row), min(8, 8 - d_row))
+    columns = slice(max(0, -d_column), min(8, 8 - d_column))
+    target_rows = slice(max(0, d_row), min(8, 8 + d_row))
+    target_columns = slice(max(0, d_column), min(8, 8 + d_column))
+    shifted[:, rows, columns] = boards[:, target_rows, target_columns]
+    return shifted
+
+
+def _shift_mask(mask, d_row, d_column):
+    """ Same as _shift for a single (8, 8) boolean mask """
+    return _shift(mask[np.newaxis], d_row, d_column, False)[0]
+
+
+def mobility(boards, sign):
+    """ Count every possible move of one color, and those that land in the center
+    :param boards: (N, 8, 8) int8 array
+    :param sign: 1 for White, -1 for Black
+    :return: (moves, center moves) arrays of shape (N,)
+    """
+    pieces = boards * sign
+    moves = np.zeros(len(boards), dtype=np.int64)
+    center = np.zeros(len(boards), dtype=np.int64)
+
+    def count(origin, targets, d_row, d_column):
+        landed = origin & targets
+        moves[:] += landed.sum(axis=(1, 2))
+        center[:] += (landed & _shift_mask(CENTER, d_row, d_column)).sum(axis=(1, 2))
+
+    def shifted(d_row, d_column):
+        target = _shift(boards, d_row, d_column, OFFBOARD)
+        empty = target == 0
+        enemy = (target != OFFBOARD) & (target * sign < 0)
+        return empty, enemy
+
+    for steps, code in ((KNIGHT_STEPS, KNIGHT), (KING_STEPS, KING)):
+        origin = pieces == code
+        for d_row, d_column in steps:
+            empty, enemy = shifted(d_row, d_column)
+            count(origin, empty | enemy, d_row, d_column)
+
+    for steps, codes in ((STRAIGHT_STEPS, (ROOK, QUEEN)), (DIAGONAL_STEPS, (BISHOP, QUEEN))):
+        origin = np.isin(pieces, codes)
+        for d_row, d_column in steps:
+            sliding = origin.copy()
+            for distance in range(1, 8):
+                empty, enemy = shifted(d_row * distance, d_column * distance)
+                count(sliding, empty | enemy, d_row * distance, d_column * distance)
+                sliding &= empty
+
+    # Pawns push forward onto empty squares (two from the starting row) and capture diagonally
+    forward = -1 if sign == 1 else 1
+    origin = pieces == PAWN
+    empty_one, _ = shifted(forward, 0)
+    count(origin, empty_one, forward, 0)
+    starting = np.zeros((8, 8), dtype=bool)
+    starting[6 if sign == 1 else 1] = True
+    empty_two, _ = shifted(2 * forward, 0)
+    count(origin & starting, empty_one & empty_two, 2 * forward, 0)
+    for d_column in (-1, 1):
+        _, enemy = shifted(forward, d_column)
+        count(origin, enemy, forward, d_column)
+
+    return moves, center
+
+
+def _front_counts(pawns, white):
+    """ Number of pawns on the rows strictly in front of each square, from the given color's direction """
+    if white:
+        return np.cumsum(pawns, axis=1) - pawns
+    return np.cumsum(pawns[:, ::-1], axis=1)[:, ::-1] - pawns
+
+
+def _adjacent_files(pawns):
+    """ Spread pawns onto the neighbouring files (not their own) """
+    adjacent = np.zeros_like(pawns)
+    adjacent[:, :, 1:] += pawns[:, :, :-1]
+    adjacent[:, :, :-1] += pawns[:, :, 1:]
+    return adjacent
+
+
+def pawn_counts(own, enemy, white):
+    """ Passed, doubled, isolated and backward pawn counts of one color, same rules as pawns.count_structure
+    :param own: (N, 8, 8) int array of this color's pawns
+    :param enemy: (N, 8, 8) int array of the other color's pawns
+    :param white: whether this color is White
+    :return: four (N,) arrays
+    """
+    per_file = own.sum(axis=1)
+    doubled = np.clip(per_file - 1, 0, None).sum(axis=1)
+
+    own_adjacent = _adjacent_files(own)
+    enemy_adjacent = _adjacent_files(enemy)
+    has_neighbours = own_adjacent.sum(axis=1, keepdims=True) > 0
+    isolated = (own * ~has_neighbours).sum(axis=(1, 2))
+
+    passed_squares = (own > 0) & (_front_counts(enemy + enemy_adjacent, white) == 0)
+    passed = passed_squares.sum(axis=(1, 2))
+
+    # Friendly neighbours level with or behind the pawn, and enemy pawns guarding its stop square
+    support = own_adjacent.sum(axis=1, keepdims=True) - _front_counts(own_adjacent, white)
+    guard = _shift(enemy_adjacent, -2 if white else 2, 0, 0)
+    backward = ((own > 0) & ~passed_squares & has_neighbours & (support == 0) & (guard > 0)).sum(axis=(1, 2))
+
+    return passed, doubled, isolated, backward
+
+
+def features(positions):
+    """ Piece-square score and weighted evaluation terms of many positions, from White's point of view
+    The evaluation is the piece-square score plus the terms times their weights, so it's linear in the weights.
+    :param positions: (N, 64) int8 array of encoded positions
+    :return: ((N,) piece-square scores, (N, len(DEFAULT_WEIGHTS)) terms already scaled by their phase weight,
+             in DEFAULT_WEIGHTS order)
+    """
+    positions = np.asarray(positions, dtype=np.int8).reshape(-1, 64)
+    boards = positions.reshape(-1, 8, 8)
+    codes = np.abs(positions)
+    signs = np.sign(positions)
+
+    material = (signs * VALUES[codes]).sum(axis=1)
+    phase = np.minimum(PHASES[codes].sum(axis=1), MAX_PHASE) / MAX_PHASE
+    index = positions.astype(np.int64) + 6
+    squares = np.arange(64)
+    midgame = MIDGAME_TABLE[index, squares].sum(axis=1)
+    endgame = ENDGAME_TABLE[index, squares].sum(axis=1)
+    psqt = midgame * phase + endgame * (1 - phase)
+
+    white_moves, white_center = mobility(boards, 1)
+    black_moves, black_center = mobility(boards, -1)
+    control = white_moves - black_moves
+    center_control = white_center - black_center
+
+    white_pawns = (boards == PAWN).astype(np.int64)
+    black_pawns = (boards == -PAWN).astype(np.int64)
+    white_passed, white_doubled, white_isolated, white_backward = pawn_counts(white_pawns, black_pawns, True)
+    black_passed, black_doubled, black_isolated, black_backward = pawn_counts(black_pawns, white_pawns, False)
+    passed = white_passed - black_passed
+    doubled = black_doubled - white_doubled
+    isolated = black_isolated - white_isolated
+    backward = black_backward - white_backward
+
+    # Rooks and queens on files without pawns of their own color
+    white_files = white_pawns.sum(axis=1) == 0
+    black_files = black_pawns.sum(axis=1) == 0
+    white_heavy = np.isin(boards, (ROOK, QUEEN)).sum(axis=1)
+    black_heavy = np.isin(boards, (-ROOK, -QUEEN)).sum(axis=1)
+    open_files = (white_heavy * white_files).sum(axis=1) - (black_heavy * black_files).sum(axis=1)
+
+    opening = np.maximum(0.0, 2 * phase - 1)
+    end = np.maximum(0.0, 1 - 2 * phase)
+    middle = 1 - opening - end
+    terms = np.stack([opening * material, opening * center_control, opening * control,
+                      middle * material, middle * control, middle * doubled, middle * isolated, middle * backward,
+                      middle * open_files,
+                      end * material, end * control, end * passed], axis=1)
+    return psqt, terms
+
+
+def weight_vector(weights):
+    """ Weights as an array in the order of the terms returned by features """
+    return np.array([weights[name] for name in DEFAULT_WEIGHTS], dtype=np.float64)
+
+
+def evaluate_batch(positions, engine_color='Black', weights=None):
+    """ Evaluate many positions at once, for the engine, like Chess.evaluate
+    :param positions: (N, 64) int8 array of encoded positions
+    :param engine_color: color the scores are from the point of view of
+    :param weights: evaluation weights (see weights.py), the ones loaded at startup by default
+    :return: (N,) float array of scores
+    """
+    psqt, terms = features(positions)
+    side = 1 if engine_color == 'White' else -1
+    return side * (psqt + terms @ weight_vector(weights if weights is not None else WEIGHTS))
+
+
+class LeafBatch:
+    """ Collects positions during a search so they can be scored with one evaluate_batch call """
+
+    def __init__(self, engine_color='Black', weights=None):
+        """
+        Attributes:
+            engine_color (str): color the scores are from the point of view of
+            weights (dict): evaluation weights, the ones loaded at startup when None
+            positions (list): encoded positions waiting to be scored
+            tags (list): what each position belongs to (i.e. the move that led to it)
+        """
+        self.engine_color = engine_color
+        self.weights = weights
+        self.positions = []
+        self.tags = []
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, board, tag=None):
+        """ Defer the position on board (a 2d list of pieces) """
+        self.positions.append(encode(board))
+        self.tags.append(tag)
+
+    def flush(self):
+        """ Score everything collected so far and empty the batch
+        :return: list of (tag, score)
+        """
+        if not self.positions:
+            return []
+        scores = evaluate_batch(np.stack(self.positions), self.engine_color, self.weights)
+        scored = list(zip(self.tags, scores.tolist()))
+        self.positions = []
+        self.tags = []
+        return scored
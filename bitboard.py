@@ -0,0 +1,275 @@
+"""
+Bitboard Move Generator
+DS 3500 Final Project
+"""
+
+# Squares are numbered little-endian rank-file: a1 = 0, h1 = 7, a8 = 56, h8 = 63
+M64 = 0xFFFFFFFFFFFFFFFF
+A_FILE = 0x0101010101010101
+B_FILE = 0x0202020202020202
+DIAG_C7_H2 = 0x0004081020408000
+
+NAMES = ('Pawn', 'Knight', 'Bishop', 'Rook', 'Queen', 'King')
+COLORS = ('White', 'Black')
+
+
+def to_square(pos):
+    """ Turn 2d list indices into a bitboard square (i.e. (7, 0) --> 0) """
+    return (7 - pos[0]) * 8 + pos[1]
+
+
+# 2d list indices of every bitboard square, square 0 is a1 --> (7, 0)
+POSITIONS = tuple((7 - sq // 8, sq % 8) for sq in range(64))
+
+
+def squares(bb):
+    """ Yield the squares of every set bit of a bitboard, lowest first """
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+def _step_attacks(sq, steps):
+    """ Bitboard of the squares one step away from sq in each of the given (rank, file) steps """
+    rank, file = divmod(sq, 8)
+    bb = 0
+    for d_rank, d_file in steps:
+        if 0 <= rank + d_rank < 8 and 0 <= file + d_file < 8:
+            bb |= 1 << ((rank + d_rank) * 8 + file + d_file)
+    return bb
+
+
+def _ray_attacks(sq, occupied, steps):
+    """ Slow reference sliding attacks, only used to fill the lookup tables at import """
+    rank, file = divmod(sq, 8)
+    bb = 0
+    for d_rank, d_file in steps:
+        r, f = rank + d_rank, file + d_file
+        while 0 <= r < 8 and 0 <= f < 8:
+            bb |= 1 << (r * 8 + f)
+            if occupied & (1 << (r * 8 + f)):
+                break
+            r, f = r + d_rank, f + d_file
+    return bb
+
+
+KNIGHT_STEPS = ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2))
+KING_STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+
+KNIGHT_ATTACKS = tuple(_step_attacks(sq, KNIGHT_STEPS) for sq in range(64))
+KING_ATTACKS = tuple(_step_attacks(sq, KING_STEPS) for sq in range(64))
+PAWN_ATTACKS = {'White': tuple(_step_attacks(sq, ((1, 1), (1, -1))) for sq in range(64)),
+                'Black': tuple(_step_attacks(sq, ((-1, 1), (-1, -1))) for sq in range(64))}
+
+# %% Kindergarten Sliding Attack Tables
+
+# Both direction steps of each line through a square
+LINES = {'rank': ((0, 1), (0, -1)),
+         'file': ((1, 0), (-1, 0)),
+         'diagonal': ((1, 1), (-1, -1)),
+         'anti_diagonal': ((1, -1), (-1, 1))}
+
+
+def _line_mask(sq, steps):
+    """ Every square of a line through sq, not counting sq itself """
+    return _ray_attacks(sq, 0, steps)
+
+
+LINE_MASKS = {line: tuple(_line_mask(sq, steps) for sq in range(64)) for line, steps in LINES.items()}
+
+
+def _line_index(line, sq, occupied):
+    """ Squeeze the occupancy of one line into a 6 bit table index by a kindergarten multiplication """
+    if line == 'file':
+        return (((occupied >> (sq & 7)) & A_FILE) * DIAG_C7_H2 & M64) >> 58
+    return ((occupied & LINE_MASKS[line][sq]) * B_FILE & M64) >> 58
+
+
+def _build_line_table(line):
+    """ Attacks along one line for every square and every 6 bit occupancy index """
+    table = []
+    for sq in range(64):
+        mask = LINE_MASKS[line][sq]
+        attacks = [0] * 64
+        # Walk every subset of the line's squares, the index only depends on the inner ones
+        subset = 0
+        while True:
+            index = _line_index(line, sq, subset | (1 << sq))
+            attacks[index] = _ray_attacks(sq, subset, LINES[line])
+            subset = (subset - mask) & mask
+            if not subset:
+                break
+        table.append(tuple(attacks))
+    return tuple(table)
+
+
+LINE_ATTACKS = {line: _build_line_table(line) for line in LINES}
+_RANK, _FILE = LINE_ATTACKS['rank'], LINE_ATTACKS['file']
+_DIAGONAL, _ANTI_DIAGONAL = LINE_ATTACKS['diagonal'], LINE_ATTACKS['anti_diagonal']
+_RANK_MASK, _DIAGONAL_MASK, _ANTI_DIAGONAL_MASK = \
+    LINE_MASKS['rank'], LINE_MASKS['diagonal'], LINE_MASKS['anti_diagonal']
+
+
+def rook_attacks(sq, occupied):
+    """ Squares a rook on sq attacks given the occupied squares """
+    return _RANK[sq][((occupied & _RANK_MASK[sq]) * B_FILE & M64) >> 58] | \
+        _FILE[sq][(((occupied >> (sq & 7)) & A_FILE) * DIAG_C7_H2 & M64) >> 58]
+
+
+def bishop_attacks(sq, occupied):
+    """ Squares a bishop on sq attacks given the occupied squares """
+    return _DIAGONAL[sq][((occupied & _DIAGONAL_MASK[sq]) * B_FILE & M64) >> 58] | \
+        _ANTI_DIAGONAL[sq][((occupied & _ANTI_DIAGONAL_MASK[sq]) * B_FILE & M64) >> 58]
+
+
+def queen_attacks(sq, occupied):
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+
+
+class Bitboards:
+    """ Position stored as one 64 bit integer per piece type and color """
+
+    def __init__(self, pieces=None):
+        """
+        Attributes:
+            pieces (dict): {color: {piece name: bitboard}}
+        """
+        self.pieces = pieces if pieces is not None else {color: {name: 0 for name in NAMES} for color in COLORS}
+
+    @classmethod
+    def from_board(cls, board):
+        """ Build bitboards from a 2d list of pieces (i.e. chessboard.board) """
+        bitboards = cls()
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece != '--':
+                    bitboards.pieces[piece.color][piece.name] |= 1 << to_square((row, col))
+        return bitboards
+
+    def occupancy(self, color):
+        """ Bitboard of every square holding a piece of the given color """
+        pieces = self.pieces[color]
+        return pieces['Pawn'] | pieces['Knight'] | pieces['Bishop'] | \
+            pieces['Rook'] | pieces['Queen'] | pieces['King']
+
+    def attacks(self, color):
+        """ Bitboard of every square the given color attacks """
+        pieces = self.pieces[color]
+        occupied = self.occupancy('White') | self.occupancy('Black')
+        bb = 0
+        for sq in squares(pieces['Pawn']):
+            bb |= PAWN_ATTACKS[color][sq]
+        for sq in squares(pieces['Knight']):
+            bb |= KNIGHT_ATTACKS[sq]
+        for sq in squares(pieces['Bishop'] | pieces['Queen']):
+            bb |= bishop_attacks(sq, occupied)
+        for sq in squares(pieces['Rook'] | pieces['Queen']):
+            bb |= rook_attacks(sq, occupied)
+        for sq in squares(pieces['King']):
+            bb |= KING_ATTACKS[sq]
+        return bb
+
+    def pawn_targets(self, color, sq, own, enemy):
+        """ Pushes (doubled from the starting rank) and captures of a pawn on sq """
+        empty = ~(own | enemy) & M64
+        if color == 'White':
+            single = (1 << (sq + 8)) & empty if sq < 56 else 0
+            double = (single << 8) & empty if 8 <= sq < 16 else 0
+        else:
+            single = (1 << (sq - 8)) & empty if sq >= 8 else 0
+            double = (single >> 8) & empty if 48 <= sq < 56 else 0
+        return single | double | (PAWN_ATTACKS[color][sq] & enemy)
+
+    def possible_moves(self, color):
+        """ Same moves as Chess.get_possible_moves, {starting loc: [ending locs]} """
+        pieces = self.pieces[color]
+        own = self.occupancy(color)
+        enemy = self.occupancy('Black' if color == 'White' else 'White')
+        occupied = own | enemy
+        not_own = ~own & M64
+
+        possible_moves = {}
+        for name, bb in pieces.items():
+            for sq in squares(bb):
+                if name == 'Pawn':
+                    targets = self.pawn_targets(color, sq, own, enemy)
+                elif name == 'Knight':
+                    targets = KNIGHT_ATTACKS[sq] & not_own
+                elif name == 'Bishop':
+                    targets = bishop_attacks(sq, occupied) & not_own
+                elif name == 'Rook':
+                    targets = rook_attacks(sq, occupied) & not_own
+                elif name == 'Queen':
+                    targets = queen_attacks(sq, occupied) & not_own
+                else:
+                    targets = KING_ATTACKS[sq] & not_own
+                if targets:
+                    possible_moves[POSITIONS[sq]] = [POSITIONS[end] for end in squares(targets)]
+
+        return possible_moves
+
+    def count_moves(self, color):
+        """ Number of moves possible_moves would generate, counted with popcounts instead of building lists """
+        pieces = self.pieces[color]
+        own = self.occupancy(color)
+        enemy = self.occupancy('Black' if color == 'White' else 'White')
+        occupied = own | enemy
+        not_own = ~own & M64
+
+        count = 0
+        for sq in squares(pieces['Pawn']):
+            count += self.pawn_targets(color, sq, own, enemy).bit_count()
+        for sq in squares(pieces['Knight']):
+            count += (KNIGHT_ATTACKS[sq] & not_own).bit_count()
+        for sq in squares(pieces['Bishop']):
+            count += (bishop_attacks(sq, occupied) & not_own).bit_count()
+        for sq in squares(pieces['Rook']):
+            count += (rook_attacks(sq, occupied) & not_own).bit_count()
+        for sq in squares(pieces['Queen']):
+            count += (queen_attacks(sq, occupied) & not_own).bit_count()
+        for sq in squares(pieces['King']):
+            count += (KING_ATTACKS[sq] & not_own).bit_count()
+        return count
+
+
+def benchmark(seconds=1.0):
+    """ Print moves generated per second by Chess.get_possible_moves and by the bitboards """
+    import time
+    from chess import Chess
+
+    game = Chess()
+    # A developed position so the sliders have some room
+    for move in (((6, 4), (4, 4)), ((1, 4), (3, 4)), ((7, 6), (5, 5)), ((0, 1), (2, 2)),
+                 ((7, 5), (4, 2)), ((1, 3), (2, 3))):
+        game.make_move(move[0][0], move[0][1], move[1][0], move[1][1])
+
+    def rate(generate):
+        calls = moves = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            moves += sum(len(ends) for ends in generate().values())
+            calls += 1
+        return moves / (time.perf_counter() - start)
+
+    board_rate = rate(game.get_possible_moves)
+    bitboard_rate = rate(lambda: Bitboards.from_board(game.chess_board.board).possible_moves(game.turn))
+    bitboards = Bitboards.from_board(game.chess_board.board)
+    cached_rate = rate(lambda: bitboards.possible_moves(game.turn))
+
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        moves = bitboards.count_moves(game.turn)
+        calls += 1
+    count_rate = calls * moves / (time.perf_counter() - start)
+
+    print(f'Chess.get_possible_moves:         {board_rate:10.0f} moves/s')
+    print(f'Bitboards (built from the board): {bitboard_rate:10.0f} moves/s ({bitboard_rate / board_rate:.1f}x)')
+    print(f'Bitboards (already built):        {cached_rate:10.0f} moves/s ({cached_rate / board_rate:.1f}x)')
+    print(f'Bitboards (counted, no lists):    {count_rate:10.0f} moves/s ({count_rate / board_rate:.1f}x)')
+
+
+if __name__ == '__main__':
+    benchmark()
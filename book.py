@@ -0,0 +1,135 @@
+"""
+Polyglot Opening Book
+DS 3500 Final Project
+
+Reads Polyglot .bin books in place through mmap: entries are 16 bytes sorted by key,
+so a lookup is a binary search over the file and nothing is loaded up front.
+"""
+
+from polyglot_keys import RANDOM64
+import mmap
+import random
+import struct
+
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+
+# Polyglot piece order, the key of a piece on a square is RANDOM64[64 * kind + 8 * rank + file]
+PIECE_KINDS = {(color, name): 2 * index + (color == 'White')
+               for index, name in enumerate(('Pawn', 'Knight', 'Bishop', 'Rook', 'Queen', 'King'))
+               for color in ('Black', 'White')}
+# Castling rights by FEN letter, as (king square, rook square), a normal game would still have them with both unmoved
+CASTLING_RIGHTS = {'K': ((7, 4), (7, 7)), 'Q': ((7, 4), (7, 0)), 'k': ((0, 4), (0, 7)), 'q': ((0, 4), (0, 0))}
+# Castling keys by (king square, rook square), in the same order
+CASTLING_KEYS = dict(zip(CASTLING_RIGHTS.values(), range(768, 772)))
+TURN_KEY = 780
+QUEEN_PROMOTION = 4
+
+
+def polyglot_key(board, turn):
+    """ Polyglot key of a position
+    The game can't castle, but books are made from games that can, so a king and rook that haven't moved
+    still count as castling rights or no book position after the first move would match. Chess.load_fen only
+    leaves those the FEN's castling field gives unmoved. There's no en passant.
+    :param board: 2d list of pieces, row 0 is the 8th rank
+    :param turn: side to move
+    :return: 64 bit key
+    """
+    key = 0
+    for row in range(8):
+        for column in range(8):
+            piece = board[row][column]
+            if piece != '--':
+                key ^= RANDOM64[64 * PIECE_KINDS[(piece.color, piece.name)] + 8 * (7 - row) + column]
+    for ((king_row, king_column), (rook_row, rook_column)), index in CASTLING_KEYS.items():
+        king = board[king_row][king_column]
+        rook = board[rook_row][rook_column]
+        if king != '--' and rook != '--' and king.name == 'King' and rook.name == 'Rook' and \
+                king.color == rook.color and king.first_move and rook.first_move:
+            key ^= RANDOM64[index]
+    if turn == 'White':
+        key ^= RANDOM64[TURN_KEY]
+    return key
+
+
+def decode_move(move):
+    """ Polyglot move to ((start row, start column), (end row, end column)), None for an underpromotion """
+    promotion = (move >> 12) & 7
+    if promotion and promotion != QUEEN_PROMOTION:
+        return None
+    start = (7 - ((move >> 9) & 7), (move >> 6) & 7)
+    end = (7 - ((move >> 3) & 7), move & 7)
+    return start, end
+
+
+class OpeningBook:
+
+    def __init__(self, path):
+        """ Polyglot book mapped into memory
+        Attributes:
+            path (str): .bin file of the book
+            entries (int): number of 16 byte entries
+        """
+        self.path = path
+        self.file = open(path, 'rb')
+        size = self.file.seek(0, 2)
+        # mmap can't map an empty file
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.entries = size // ENTRY.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.entries
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def first_entry(self, key):
+        """ Index of the first entry with key, or of where it would be """
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def moves(self, key):
+        """ Book moves of a position
+        :param key: polyglot_key of the position
+        :return: list of (move, weight), moves the game can't play (underpromotions) left out
+        """
+        found = []
+        index = self.first_entry(key)
+        while index < self.entries:
+            entry_key, move, weight, _ = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            move = decode_move(move)
+            if move is not None:
+                found.append((move, weight))
+            index += 1
+        return found
+
+    def choose(self, board, turn, legal_moves=None, rng=random):
+        """ Pick a book move for a position at random, weighted by the book's weights
+        :param board: 2d list of pieces
+        :param turn: side to move
+        :param legal_moves: moves the game allows, book moves outside of it (i.e. castling) are skipped
+        :param rng: random number generator to choose with
+        :return: (start, end) or None when the position isn't in the book
+        """
+        candidates = [(move, weight) for move, weight in self.moves(polyglot_key(board, turn))
+                      if weight and (legal_moves is None or move in legal_moves)]
+        if not candidates:
+            return None
+        moves, weights = zip(*candidates)
+        return rng.choices(moves, weights)[0]
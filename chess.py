@@ -1,26 +1,61 @@
 from pieces import Queen
 from chessboard import chessboard
-from collections import defaultdict
+from collections import namedtuple
 from engine import Engine
-import copy
-import random as rnd
+from parallel import ParallelSearch
+from book import CASTLING_RIGHTS, OpeningBook
+from tablebase import Tablebases
+from transposition import TranspositionTable, PawnHashTable
+from pawns import pawn_structure
+from psqt import MAX_PHASE
+from weights import WEIGHTS, load_weights
+import zobrist
+
+# Everything unmake_move needs to put the position back the way it was before a move
+Undo = namedtuple('Undo', ['start', 'end', 'piece', 'captured', 'first_move', 'promoted',
+                           'previous_piece_moved', 'status', 'hash', 'pawn_hash', 'evaluation',
+                           'halfmove_clock', 'valid_moves'])
+# Half moves without a capture or pawn move after which the game is drawn
+FIFTY_MOVE_PLIES = 100
+
+# (row, column) steps pieces attack along
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (2, 1), (2, -1), (1, -2), (1, 2))
+KING_STEPS = ((0, -1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (1, 1), (1, 0), (1, -1))
+STRAIGHT_STEPS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+DIAGONAL_STEPS = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
 
 
 class Chess:
 
-    def __init__(self, depth: int = 2):
+    def __init__(self, depth: int = 2, hash_size: int = 16, workers: int = 1, book: str = None,
+                 tablebases: str = None, weights: str = None):
         """ Chess class that enables one to play a game of chess against their computer
         Attributes:
             chess_board (obj): chess baord from chessboard class, instantiated with regular starting position
-            Engine (obj): chess engine from engine class
+            engine (obj): chess engine from engine class
             depth (int): depth at which the engine plays at (num of moves it looks ahead by)
             turn (str): which color's turn it is (white or black)
             previous_piece_moved (obj): object representation of last piece that moved
             move_log (list): list of game moves
-            valid_moves (list): valid moves for the current position
+            ply (int): half moves played in the game, kept up to date by make_move
+            halfmove_clock (int): half moves since the last capture or pawn move, kept up to date by make_move
+            key_history (list): hash of every position before the current one, oldest first
+            predicted_move (tuple): reply the engine expects to its last move, from its principal variation
+            valid_moves (dict): valid moves for the position in valid_moves_key, computed at most once per position
+            valid_moves_key (tuple): (hash, turn) of the position valid_moves belongs to, None before it's computed
             checkmate (bool): whether either side has been checkmated
             stalemate (bool): whether either side has been stalemated
             draw (bool): whether game is a draw
+            hash (int): Zobrist key of the current position, kept up to date by make_move
+            transposition_table (obj): searched positions, kept for the whole game (hash_size MB)
+            pawn_hash (int): Zobrist key of only the pawns, kept up to date by make_move
+            pawn_table (obj): pawn structure evaluations keyed by pawn_hash
+            workers (int): processes the engine searches with, more than 1 splits the root moves between them
+            book (obj): Polyglot opening book the engine plays from while it has the position, if a path was given
+            tablebases (obj): endgame tablebases the engine probes, if a directory was given
+            weights (dict): evaluation weights, from the weights file given or the ones loaded at startup
         """
         self.black_pawn_locs = None
         self.white_pawn_locs = None
@@ -31,11 +66,27 @@ class Chess:
         self.depth = depth
         self.previous_piece_moved = ''
         self.move_log = []
-        self.valid_moves = []
+        self.ply = 0
+        self.halfmove_clock = 0
+        self.key_history = []
+        self.predicted_move = None
+        self.valid_moves = {}
+        self.valid_moves_key = None
         self.move_evaluations = {}
+        self.search_stats = None
         self.checkmate = False
         self.stalemate = False
         self.draw = False
+        self.hash = zobrist.hash_board(self.chess_board.board, self.turn)
+        self.transposition_table = TranspositionTable(hash_size)
+        self.pawn_hash = zobrist.hash_pawns(self.chess_board.board)
+        self.pawn_table = PawnHashTable()
+        self.weights = load_weights(weights) if weights is not None else WEIGHTS
+        self.engine = Engine(self)
+        self.workers = workers
+        self.parallel_search = None
+        self.book = OpeningBook(book) if book is not None else None
+        self.tablebases = Tablebases(tablebases) if tablebases is not None else None
 
     # %% Helpful Chess Static Methods
 
@@ -58,32 +109,172 @@ class Chess:
         return piece_column + str(piece_row)
 
     @staticmethod
-    def in_check(board, moves, turn):
-        """ Check if king can be taken by any of the pieces on the board
-        :param board: board position
-        :param moves: list of possible moves
-        :param turn: whose turn it is
+    def opponent(color):
+        """ Color of the other side """
+        return 'Black' if color == 'White' else 'White'
+
+    # %% Attack Maps
+
+    def is_square_attacked(self, square, by_color):
+        """ Check if any piece of by_color attacks a square, looking outward from the square itself
+        :param square: (row, column) of the square
+        :param by_color: color of the attacking side
         :return: boolean
         """
-        # Go through all ending locations, if king_loc is in there,
-        # return True (results in check)
-        possible_takes = [x for move in moves.values() for x in move]
-        king_loc = Chess.locate_piece(board, turn, 'King')
-        if king_loc in possible_takes:
-            return True
+        board = self.chess_board.board
+        row, column = square
+
+        # Pawns attack diagonally forward, so a White pawn attacks from the row below the square
+        pawn_row = row + 1 if by_color == 'White' else row - 1
+        if 0 <= pawn_row < 8:
+            for pawn_column in (column - 1, column + 1):
+                if 0 <= pawn_column < 8:
+                    piece = board[pawn_row][pawn_column]
+                    if piece != '--' and piece.color == by_color and piece.name == 'Pawn':
+                        return True
+
+        for steps, name in ((KNIGHT_STEPS, 'Knight'), (KING_STEPS, 'King')):
+            for d_row, d_column in steps:
+                end_row, end_column = row + d_row, column + d_column
+                if 0 <= end_row < 8 and 0 <= end_column < 8:
+                    piece = board[end_row][end_column]
+                    if piece != '--' and piece.color == by_color and piece.name == name:
+                        return True
+
+        for steps, slider in ((STRAIGHT_STEPS, 'Rook'), (DIAGONAL_STEPS, 'Bishop')):
+            for d_row, d_column in steps:
+                end_row, end_column = row + d_row, column + d_column
+                while 0 <= end_row < 8 and 0 <= end_column < 8:
+                    piece = board[end_row][end_column]
+                    if piece != '--':
+                        if piece.color == by_color and piece.name in (slider, 'Queen'):
+                            return True
+                        break
+                    end_row, end_column = end_row + d_row, end_column + d_column
+
         return False
 
-    @staticmethod
-    def locate_piece(board, color, piece):
-        """ Locate piece given board position, piece color, and piece name """
-        for row in board:
-            for square in row:
-                if square != '--':
-                    if square.name == piece and square.color == color:
-                        return square.pos
+    def checks_and_pins(self, color):
+        """ Find every piece giving check to color's king and every piece of color pinned to it
+        :param color: color of the king
+        :return: list of checks (set of squares that capture the checker or block the check),
+                 dict of pinned piece locations to the set of squares they can still move to
+        """
+        board = self.chess_board.board
+        king_row, king_column = self.chess_board.king_square(color)
+        enemy = Chess.opponent(color)
+        checks = []
+        pins = {}
+
+        # Sliders: walk out from the king, remembering the first friendly piece in the way
+        for steps, slider in ((STRAIGHT_STEPS, 'Rook'), (DIAGONAL_STEPS, 'Bishop')):
+            for d_row, d_column in steps:
+                ray = set()
+                blocker = None
+                end_row, end_column = king_row + d_row, king_column + d_column
+                while 0 <= end_row < 8 and 0 <= end_column < 8:
+                    ray.add((end_row, end_column))
+                    piece = board[end_row][end_column]
+                    if piece != '--':
+                        if piece.color == color:
+                            if blocker is not None:
+                                break
+                            blocker = piece.pos
+                        else:
+                            if piece.name in (slider, 'Queen'):
+                                if blocker is None:
+                                    checks.append(ray)
+                                else:
+                                    pins[blocker] = ray
+                            break
+                    end_row, end_column = end_row + d_row, end_column + d_column
+
+        # Knights and pawns can only be answered by capturing them
+        for d_row, d_column in KNIGHT_STEPS:
+            end_row, end_column = king_row + d_row, king_column + d_column
+            if 0 <= end_row < 8 and 0 <= end_column < 8:
+                piece = board[end_row][end_column]
+                if piece != '--' and piece.color == enemy and piece.name == 'Knight':
+                    checks.append({(end_row, end_column)})
+        pawn_row = king_row - 1 if color == 'White' else king_row + 1
+        if 0 <= pawn_row < 8:
+            for pawn_column in (king_column - 1, king_column + 1):
+                if 0 <= pawn_column < 8:
+                    piece = board[pawn_row][pawn_column]
+                    if piece != '--' and piece.color == enemy and piece.name == 'Pawn':
+                        checks.append({(pawn_row, pawn_column)})
+
+        return checks, pins
+
+    def king_in_check(self, color):
+        """ Check if color's king is attacked """
+        return self.is_square_attacked(self.chess_board.king_square(color), Chess.opponent(color))
 
     # %% Methods Inherent to a Chess Game
 
+    def load_board(self, board, turn='White', halfmove_clock=0, ply=0):
+        """ Set the game up from a position instead of the regular starting position
+        :param board: 2d list of pieces and '--' blanks
+        :param turn: side to move
+        :param halfmove_clock: half moves already played since the last capture or pawn move
+        :param ply: half moves already played in the game
+        """
+        self.chess_board.board = board
+        self.chess_board.flattened = sum(board, [])
+        self.chess_board.recount()
+        self.turn = turn
+        self.previous_piece_moved = ''
+        self.move_log = []
+        self.ply = ply
+        self.halfmove_clock = halfmove_clock
+        self.key_history = []
+        self.predicted_move = None
+        self.valid_moves = {}
+        self.valid_moves_key = None
+        self.move_evaluations = {}
+        self.checkmate = False
+        self.stalemate = False
+        self.draw = False
+        self.hash = zobrist.hash_board(board, turn)
+        self.pawn_hash = zobrist.hash_pawns(board)
+
+    def load_fen(self, fen):
+        """ Set the game up from a FEN (or the first four fields of an EPD)
+        The game has no castling or en passant. The castling field only decides which kings and rooks count as
+        unmoved, which is what the opening book reads castling rights from. The move counters are optional and
+        start from 0 and 1 when they're missing.
+        """
+        fields = fen.split()
+        if len(fields) < 2 or fields[1] not in ('w', 'b'):
+            raise ValueError(f'FEN needs a piece placement and a side to move: {fen!r}')
+        board = chessboard()
+        board.load_fen(fields[0])
+        for color in ('White', 'Black'):
+            if len(board.piece_lists[color]['King']) != 1:
+                raise ValueError(f'FEN needs exactly one {color} king: {fen!r}')
+        castling = fields[2] if len(fields) > 2 else '-'
+        unmoved = {square for right, squares in CASTLING_RIGHTS.items() if right in castling for square in squares}
+        for name in ('King', 'Rook'):
+            for color in ('White', 'Black'):
+                for piece in board.piece_lists[color][name]:
+                    piece.first_move = piece.pos in unmoved
+        counters = fields[4:6] if len(fields) >= 6 and all(field.isdigit() for field in fields[4:6]) else ['0', '1']
+        halfmove_clock, fullmove = int(counters[0]), max(int(counters[1]), 1)
+        turn = 'White' if fields[1] == 'w' else 'Black'
+        self.load_board(board.board, turn, halfmove_clock, 2 * (fullmove - 1) + (turn == 'Black'))
+
+    def fen(self):
+        """ FEN of the current position, with the castling rights of the kings and rooks that haven't moved """
+        castling = ''
+        for right, squares in CASTLING_RIGHTS.items():
+            color = 'White' if right.isupper() else 'Black'
+            pieces = [self.chess_board.board[row][column] for row, column in squares]
+            if all(piece != '--' and piece.color == color and piece.first_move for piece in pieces) and \
+                    [piece.name for piece in pieces] == ['King', 'Rook']:
+                castling += right
+        return f'{self.chess_board.fen()} {self.turn[0].lower()} {castling or "-"} - {self.halfmove_clock} ' \
+               f'{self.ply // 2 + 1}'
+
     def change_turn(self):
         """ Change turn: White --> Black, Black --> White"""
         if self.turn == 'White':
@@ -92,73 +283,111 @@ class Chess:
             self.turn = 'White'
 
     def check_mates(self):
-        """ Check if player or engine has been checkmated or stalemated """
-        moves = self.get_valid_moves()
-        # Check player's current moves, if they don't have any...
-        if not moves:
-            self.change_turn()
-            opp_moves = self.get_valid_moves()
-            self.change_turn()
-
-            # and they're in check, opponent has gotten checkmated
-            if Chess.in_check(self.chess_board.board, opp_moves, self.turn):
-                self.checkmate = True
-            # if not, it's a stalemate
-            else:
-                self.stalemate = True
+        """ Check if the side to move, which has no moves, has been checkmated or stalemated """
+        # In check, they've been checkmated
+        if self.king_in_check(self.turn):
+            self.checkmate = True
+        # if not, it's a stalemate
+        else:
+            self.stalemate = True
+
+    def repetition(self, search_plies=0):
+        """ Check whether the current position is drawn by repetition
+        Only positions since the last capture or pawn move can come up again, and only every other one has the
+        same side to move, so this looks at halfmove_clock / 2 earlier positions at most.
+        :param search_plies: half moves searched since the root; a position that comes up again within them is
+                             scored as a draw straight away, since whichever side gains from it could repeat again
+        :return: whether the position occurred twice before (or once, within the search)
+        """
+        history = self.key_history
+        count = 0
+        search_start = len(history) - search_plies
+        for index in range(len(history) - 2, max(len(history) - self.halfmove_clock, 0) - 1, -2):
+            if history[index] == self.hash:
+                if index >= search_start:
+                    return True
+                count += 1
+                if count == 2:
+                    return True
+        return False
+
+    def fifty_moves(self):
+        """ Check for the fifty-move rule: fifty moves each without a capture or pawn move """
+        return self.halfmove_clock >= FIFTY_MOVE_PLIES
 
     def draw_by_rep(self):
-        """ Check for draw by three-move repetition (player and engine repeat the same moves 3 times in a row) """
-        if len(self.move_log) > 6:
-            if self.move_log[-6] == self.move_log[-4] == self.move_log[-2] and \
-                    self.move_log[-5] == self.move_log[-3] == self.move_log[1]:
-                self.draw = True
+        """ Check for draw by threefold repetition or the fifty-move rule (checkmate on the last move counts) """
+        if self.repetition() or (self.fifty_moves() and not self.checkmate):
+            self.draw = True
 
     def check_gameover(self):
         """ Check if the game is over """
-        self.check_mates()
+        # The legal moves are cached, so whoever plays next gets them for free
+        if not self.get_valid_moves():
+            self.check_mates()
         self.draw_by_rep()
 
-    def promotion(self):
-        """ Check for any promotions, automatically turn Pawns into Queens """
-        self.chess_board.board[0] = [Queen('White', (0, i)) if piece != '--' and piece.name == 'Pawn' else piece
-                                     for i, piece in enumerate(self.chess_board.board[0])]
-        self.chess_board.board[7] = [Queen('Black', (7, i)) if piece != '--' and piece.name == 'Pawn' else piece
-                                     for i, piece in enumerate(self.chess_board.board[7])]
+    def promotion(self, piece):
+        """ Check if the piece that just moved promotes, automatically turn Pawns into Queens
+        :param piece: piece that just moved
+        :return: the promoted Pawn (so the move can be undone), or None
+        """
+        row, column = piece.pos
+        if piece.name == 'Pawn' and row in (0, 7):
+            self.chess_board.board[row][column] = Queen(piece.color, (row, column))
+            return piece
+        return None
 
     # %% Move Methods
     def try_move(self, start, end):
-        """ Try a move on copy of the board
+        """ Play a move in place and collect the replies to it, take it back with unmake_move
         :param start: piece's starting location
         :param end: piece's ending location
-        :return: return new board position, player's control after the move,
+        :return: undo record of the move, player's control after the move,
                  and the opponent's possible responses to the move
         """
-        # Create deep bopy of board position
-        new_board = copy.deepcopy(self)
-
-        # Try moving the piece from starting loc to ending loc, update piece loc
-        piece = new_board.chess_board.board[start[0]][start[1]]
-        new_board.chess_board.board[end[0]][end[1]] = piece
-        new_board.chess_board.board[start[0]][start[1]] = "--"
-        piece.pos = (end[0], end[1])
-        piece.first_move = False
-        player_control = new_board.get_possible_moves()
+        undo = self.make_move(start[0], start[1], end[0], end[1], update_status=False)
 
-        # Get and return opponent's possible responses
-        new_board.change_turn()
-        opponent_responses = new_board.get_possible_moves()
+        # Get opponent's possible responses, then the mover's control of the board
+        opponent_responses = self.get_possible_moves()
+        self.change_turn()
+        player_control = self.get_possible_moves()
+        self.change_turn()
 
-        return new_board, player_control, opponent_responses
+        return undo, player_control, opponent_responses
 
-    def make_move(self, start_row, start_col, end_row, end_col):
-        """ Make a move on the board given starting pos and ending pos """
-        # Find the piece at the starting location
-        piece = self.chess_board.board[start_row][start_col]
+    def make_move(self, start_row, start_col, end_row, end_col, update_status=True):
+        """ Make a move on the board given starting pos and ending pos
+        :param update_status: run the game over checks after the move (the search turns this off)
+        :return: undo record to pass to unmake_move
+        """
+        board = self.chess_board.board
+        # Find the piece at the starting location and whatever it captures
+        piece = board[start_row][start_col]
+        captured = board[end_row][end_col]
+        undo = Undo((start_row, start_col), (end_row, end_col), piece, captured, piece.first_move, None,
+                    self.previous_piece_moved, (self.checkmate, self.stalemate, self.draw), self.hash,
+                    self.pawn_hash, self.chess_board.eval_state(), self.halfmove_clock,
+                    (self.valid_moves, self.valid_moves_key))
+        self.key_history.append(self.hash)
+        self.halfmove_clock = 0 if piece.name == 'Pawn' or captured != '--' else self.halfmove_clock + 1
+
+        # Update the position's key: the mover leaves its square, whatever it captured leaves the board
+        self.hash ^= zobrist.piece_key(piece, start_row, start_col) ^ zobrist.piece_key(piece, end_row, end_col) \
+            ^ zobrist.BLACK_TO_MOVE
+        if piece.name == 'Pawn':
+            self.pawn_hash ^= zobrist.piece_key(piece, start_row, start_col) ^ \
+                zobrist.piece_key(piece, end_row, end_col)
+        if captured != '--':
+            self.hash ^= zobrist.piece_key(captured, end_row, end_col)
+            if captured.name == 'Pawn':
+                self.pawn_hash ^= zobrist.piece_key(captured, end_row, end_col)
+            self.chess_board.remove_piece(captured, end_row, end_col)
+        self.chess_board.move_piece(piece, (start_row, start_col), (end_row, end_col))
 
         # Override location with new piece, and place a blank where it left
-        self.chess_board.board[end_row][end_col] = piece
-        self.chess_board.board[start_row][start_col] = "--"
+        board[end_row][end_col] = piece
+        board[start_row][start_col] = "--"
 
         # Update piece's position and first_move attribute
         piece.pos = (end_row, end_col)
@@ -166,46 +395,122 @@ class Chess:
 
         # Make final adjustments after the move
         self.previous_piece_moved = piece
-        self.promotion()
+        promoted = self.promotion(piece)
+        if promoted:
+            undo = undo._replace(promoted=promoted)
+            self.hash ^= zobrist.piece_key(promoted, end_row, end_col) ^ \
+                zobrist.piece_key(board[end_row][end_col], end_row, end_col)
+            self.pawn_hash ^= zobrist.piece_key(promoted, end_row, end_col)
+            self.chess_board.remove_piece(promoted, end_row, end_col)
+            self.chess_board.add_piece(board[end_row][end_col], end_row, end_col)
+        self.ply += 1
+        self.change_turn()
+        if update_status:
+            self.check_gameover()
+
+        return undo
+
+    def unmake_move(self, undo):
+        """ Take back a move made with make_move, restoring the position from its undo record """
+        board = self.chess_board.board
+        start_row, start_col = undo.start
+        end_row, end_col = undo.end
+
+        # Put the mover (the Pawn itself if it promoted) back and restore whatever it captured
+        if undo.promoted:
+            self.chess_board.unlist_piece(board[end_row][end_col])
+            self.chess_board.list_piece(undo.piece)
+        if undo.captured != '--':
+            self.chess_board.list_piece(undo.captured)
+        board[start_row][start_col] = undo.piece
+        board[end_row][end_col] = undo.captured
+        undo.piece.pos = undo.start
+        undo.piece.first_move = undo.first_move
+
+        self.previous_piece_moved = undo.previous_piece_moved
+        self.checkmate, self.stalemate, self.draw = undo.status
+        self.hash = undo.hash
+        self.pawn_hash = undo.pawn_hash
+        self.chess_board.restore_eval_state(undo.evaluation)
+        self.halfmove_clock = undo.halfmove_clock
+        # The position's legal moves come back with it instead of being generated again
+        self.valid_moves, self.valid_moves_key = undo.valid_moves
+        self.key_history.pop()
+        self.ply -= 1
         self.change_turn()
-        self.check_gameover()
 
     def get_possible_moves(self):
         """ Get a list of all the possible moves that can be played """
-        all_possible_moves = {}
-        # Iterate through chessboard to find all the pieces
-        for i in range(8):
-            for j in range(8):
-                if self.chess_board.board[i][j] != '--' and self.chess_board.board[i][j].color == self.turn:
-                    piece = self.chess_board.board[i][j]
-                    # Use each piece's valid_moves method to return their possible moves
-                    piece_moves = self.chess_board.board[i][j].valid_moves(self.chess_board.board)
-                    # Add piece's starting loc as key and their ending loc as value to possible moves
-                    all_possible_moves[piece.pos] = []
-                    for move in piece_moves:
-                        all_possible_moves[piece.pos].append(move[1])
-
-        possible_moves = {k: v for k, v in all_possible_moves.items() if len(v) > 0}
+        board = self.chess_board.board
+        possible_moves = {}
+        # Only the side to move's pieces, from the piece lists
+        for piece in self.chess_board.color_pieces(self.turn):
+            # Use each piece's valid_moves method to return their possible moves
+            piece_moves = piece.valid_moves(board)
+            # Add piece's starting loc as key and their ending loc as value to possible moves
+            if piece_moves:
+                possible_moves[piece.pos] = [move[1] for move in piece_moves]
 
         return possible_moves
 
+    def get_possible_captures(self):
+        """ Get only the possible captures and promotions, without generating any quiet moves """
+        board = self.chess_board.board
+        possible_captures = {}
+        for piece in self.chess_board.color_pieces(self.turn):
+            captures = piece.capture_moves(board)
+            if captures:
+                possible_captures[piece.pos] = [move[1] for move in captures]
+
+        return possible_captures
+
     def get_valid_moves(self):
-        """ Return only valid moves that can be played, (no moves that endanger the king) """
-        # Get list of all possible moves
-        all_moves = self.get_possible_moves()
+        """ Return only valid moves that can be played, (no moves that endanger the king)
+        They're generated once per position and kept until the position changes, so the dict must not be modified.
+        """
+        key = (self.hash, self.turn)
+        if self.valid_moves_key != key:
+            # Get list of all possible moves
+            self.valid_moves = self.legal_filter(self.get_possible_moves())
+            self.valid_moves_key = key
+        return self.valid_moves
 
-        valid_moves = defaultdict(list)
+    def get_valid_captures(self):
+        """ Return only valid captures and promotions (used by the quiescence search) """
+        return self.legal_filter(self.get_possible_captures())
+
+    def legal_filter(self, all_moves):
+        """ Filter out possible moves that leave the mover's king in check
+        :param all_moves: dict of starting loc to list of ending locs
+        :return: dict of the legal moves
+        """
+        board = self.chess_board.board
+        king_row, king_column = king = self.chess_board.king_square(self.turn)
+        checks, pins = self.checks_and_pins(self.turn)
+
+        valid_moves = {}
         # Ensure that any of our possible moves do not result in check, filter those that do out
         for start, possible_moves in all_moves.items():
-            for move in possible_moves:
-                board_copy, control, opp_moves = self.try_move(start, move)
-                # Retrieve current player's king location
-                if not Chess.in_check(board_copy.chess_board.board, opp_moves, self.turn):
-                    valid_moves[start].append(move)
-
-        # Get rid of default dict tag
-        self.valid_moves = {k: v for k, v in valid_moves.items()}
-        return self.valid_moves
+            if start == king:
+                # Lift the king off the board so it can't hide behind itself on a checking ray
+                king_piece = board[king_row][king_column]
+                board[king_row][king_column] = '--'
+                enemy = Chess.opponent(self.turn)
+                moves = [move for move in possible_moves if not self.is_square_attacked(move, enemy)]
+                board[king_row][king_column] = king_piece
+            elif len(checks) > 1:
+                # Only the king can answer a double check
+                continue
+            else:
+                moves = possible_moves
+                if checks:
+                    moves = [move for move in moves if move in checks[0]]
+                if start in pins:
+                    moves = [move for move in moves if move in pins[start]]
+            if moves:
+                valid_moves[start] = moves
+
+        return valid_moves
 
     # %% Methods to Determine Best Move
     @staticmethod
@@ -221,131 +526,111 @@ class Chess:
         return len([square for moves in list(engine_moves.values()) for square in moves if square in center]) - \
                len([square for moves in list(player_moves.values()) for square in moves if square in center])
 
+    def phase_weights(self):
+        """ How much the opening, middle game and end game evaluations count, sliding smoothly with the phase
+        :return: (opening weight, middle game weight, end game weight), adding up to 1
+        """
+        # 1 with every piece on the board, 0 with only kings and pawns
+        phase = min(self.chess_board.phase, MAX_PHASE) / MAX_PHASE
+        opening = max(0.0, 2 * phase - 1)
+        end = max(0.0, 1 - 2 * phase)
+        return opening, 1 - opening - end, end
+
     def game_phase(self):
-        """ Extremely oversimplified way of determining the phase of the game """
-        if self.chess_board.minor_pieces + self.chess_board.major_pieces > 11:
+        """ Name of the phase the game is mostly in """
+        opening, middle, end = self.phase_weights()
+        if opening >= middle:
             return 'opening'
-        elif self.chess_board.minor_pieces + self.chess_board.major_pieces > 5:
+        elif middle >= end:
             return 'middle'
         else:
             return 'end'
 
     def material_eval(self):
-        """ Return the pure piece evaluation of board """
-        return self.chess_board.material_eval
+        """ Return the pure piece evaluation of board for the engine """
+        if self.engine_color == 'White':
+            return self.chess_board.material_eval
+        return -self.chess_board.material_eval
+
+    def psqt_eval(self):
+        """ Piece-square table evaluation for the engine, tapered between the middle and end game tables """
+        phase = min(self.chess_board.phase, MAX_PHASE) / MAX_PHASE
+        score = self.chess_board.midgame_psqt * phase + self.chess_board.endgame_psqt * (1 - phase)
+        return score if self.engine_color == 'White' else -score
 
     def get_pawn_locs(self):
-        white_pawns = []
-        black_pawns = []
-        for i in range(0, 8):
-            for j in range(0, 8):
-                piece = self.chess_board.board[i][j]
-                if piece != '--':
-                    if piece.name == 'Pawn' and piece.color == 'White':
-                        white_pawns.append(piece.pos)
-                    elif piece.name == 'Pawn' and piece.color == 'Black':
-                        black_pawns.append(piece.pos)
-
-        self.white_pawn_locs = white_pawns
-        self.black_pawn_locs = black_pawns
+        piece_lists = self.chess_board.piece_lists
+        self.white_pawn_locs = [pawn.pos for pawn in piece_lists['White']['Pawn']]
+        self.black_pawn_locs = [pawn.pos for pawn in piece_lists['Black']['Pawn']]
+
+    def pawn_structure(self):
+        """ Pawn structure of the board, from the pawn hash table when these pawns have been seen before """
+        structure = self.pawn_table.probe(self.pawn_hash)
+        if structure is None:
+            self.get_pawn_locs()
+            structure = pawn_structure(self.white_pawn_locs, self.black_pawn_locs)
+            self.pawn_table.store(self.pawn_hash, structure)
+        return structure
+
+    def pawn_term(self, field):
+        """ Engine's count of a pawn structure feature minus the player's """
+        structure = self.pawn_structure()
+        white, black = getattr(structure.white, field), getattr(structure.black, field)
+        return white - black if self.engine_color == 'White' else black - white
 
     def passed_pawns(self):
         """ Count the number of passed pawns """
-        black_passers = 0
-        white_passers = 0
-
-        if len(self.white_pawn_locs) > 0:
-            for row, file in self.white_pawn_locs:
-                black_in_front = []
-                for i in range(0, row):
-                    if file - 1 >= 0:
-                        left_piece = self.chess_board.board[i][file - 1]
-                        if left_piece != '--':
-                            black_in_front.append((left_piece.color, left_piece.name))
-                    if file + 1 <= 7:
-                        right_piece = self.chess_board.board[i][file + 1]
-                        if right_piece != '--':
-                            black_in_front.append((right_piece.color, right_piece.name))
-                    front_piece = self.chess_board.board[i][file]
-                    if front_piece != '--':
-                        black_in_front.append((front_piece.color, front_piece.name))
-                if ('Black', 'Pawn') not in black_in_front:
-                    white_passers += 1
-        if len(self.black_pawn_locs) > 0:
-            for row, file in self.black_pawn_locs:
-                white_in_front = []
-                for i in range(row + 1, 8):
-                    if file - 1 >= 0:
-                        left_piece = self.chess_board.board[i][file - 1]
-                        if left_piece != '--':
-                            white_in_front.append((left_piece.color, left_piece.name))
-                    if file + 1 <= 7:
-                        right_piece = self.chess_board.board[i][file + 1]
-                        if right_piece != '--':
-                            white_in_front.append((right_piece.color, right_piece.name))
-                    front_piece = self.chess_board.board[i][file]
-                    if front_piece != '--':
-                        white_in_front.append((front_piece.color, front_piece.name))
-                if ('White', 'Pawn') not in white_in_front:
-                    black_passers += 1
-
-        if self.engine_color == 'White':
-            return white_passers - black_passers
-        else:
-            return black_passers - white_passers
+        return self.pawn_term('passed')
 
     def doubled_pawns(self):
-        """ Count number of doubled pawns on the board """
-        doubled_black = 0
-        doubled_white = 0
-
-        if len(self.white_pawn_locs) > 0:
-            for row, file in self.white_pawn_locs:
-                pieces_in_front = []
-                for i in range(0, 8):
-                    if i != row:
-                        piece = self.chess_board.board[i][file]
-                        if piece != '--':
-                            pieces_in_front.append((piece.color, piece.name))
-
-                if ('White', 'Pawn') not in pieces_in_front:
-                    doubled_white += 1
-
-        if len(self.black_pawn_locs) > 0:
-            for row, file in self.black_pawn_locs:
-                pieces_in_front = []
-                for i in range(0, 8):
-                    if i != row:
-                        piece = self.chess_board.board[i][file]
-                        if piece != '--':
-                            pieces_in_front.append((piece.color, piece.name))
-
-                if ('Black', 'Pawn') not in pieces_in_front:
-                    doubled_black += 1
+        """ Count number of doubled pawns on the board (positive when the player has more of them) """
+        return -self.pawn_term('doubled')
 
-        if self.engine_color == 'White':
-            return doubled_black - doubled_white
-        else:
-            return doubled_white - doubled_black
+    def isolated_pawns(self):
+        """ Count number of isolated pawns on the board (positive when the player has more of them) """
+        return -self.pawn_term('isolated')
+
+    def backward_pawns(self):
+        """ Count number of backward pawns on the board (positive when the player has more of them) """
+        return -self.pawn_term('backward')
 
     def open_files(self):
-        """ Return evaluation of open files on the board """
-        pass
+        """ Return evaluation of open files on the board: rooks and queens on open or half-open files """
+        structure = self.pawn_structure()
+        files = {'White': structure.open_files | structure.white.half_open_files,
+                 'Black': structure.open_files | structure.black.half_open_files}
+        score = 0
+        for color, pieces in self.chess_board.piece_lists.items():
+            sign = 1 if color == self.engine_color else -1
+            for name in ('Rook', 'Queen'):
+                for piece in pieces[name]:
+                    if files[color] & (1 << piece.pos[1]):
+                        score += sign
+        return score
 
     def opening(self, engine_moves, player_moves):
         """ If in the opening phase, engine will value center control more """
-        return self.material_eval() + Chess.center_control(engine_moves, player_moves) * .15 \
-               + Chess.control(engine_moves, player_moves) * .1
+        weights = self.weights
+        return self.material_eval() * weights['opening_material'] \
+            + Chess.center_control(engine_moves, player_moves) * weights['opening_center_control'] \
+            + Chess.control(engine_moves, player_moves) * weights['opening_control']
 
     def middle_game(self, engine_moves, player_moves):
         """ If in the middle game, engine will value positional principals more """
-        return self.material_eval() + Chess.control(engine_moves, player_moves) * .2 + self.doubled_pawns() * .1
+        weights = self.weights
+        return self.material_eval() * weights['middle_material'] \
+            + Chess.control(engine_moves, player_moves) * weights['middle_control'] \
+            + self.doubled_pawns() * weights['middle_doubled'] + self.isolated_pawns() * weights['middle_isolated'] \
+            + self.backward_pawns() * weights['middle_backward'] + self.open_files() * weights['middle_open_files']
 
     def end_game(self, engine_moves, player_moves):
         """ If in the end game, engine will value king activity and passed pawns more """
-        return self.material_eval() * 1.2 + Chess.control(engine_moves, player_moves) * .1 + self.passed_pawns() * .25
+        weights = self.weights
+        return self.material_eval() * weights['end_material'] \
+            + Chess.control(engine_moves, player_moves) * weights['end_control'] \
+            + self.passed_pawns() * weights['end_passed']
 
-    def get_eval(self, phase, engine_moves, player_moves):
+    def get_eval(self, engine_moves, player_moves):
         """ Get evaluation of board based on game state/game phase """
         self.check_gameover()
         if self.checkmate and self.turn == 'Black' and self.engine_color == 'White':
@@ -357,52 +642,68 @@ class Chess:
         elif self.checkmate and self.turn == 'White' and self.engine_color == 'White':
             return -100
 
-        if phase == 'opening':
-            return self.opening(engine_moves, player_moves)
-        elif phase == 'middle':
-            return self.middle_game(engine_moves, player_moves)
+        return self.phase_eval(engine_moves, player_moves)
+
+    def phase_eval(self, engine_moves, player_moves):
+        """ Get evaluation of board, blending the phase evaluations by how far the game has progressed """
+        opening, middle, end = self.phase_weights()
+        score = self.psqt_eval()
+        if opening:
+            score += opening * self.opening(engine_moves, player_moves)
+        if middle:
+            score += middle * self.middle_game(engine_moves, player_moves)
+        if end:
+            score += end * self.end_game(engine_moves, player_moves)
+        return score
+
+    def evaluate(self):
+        """ Get evaluation of board for the engine without the game over checks (the search finds mates itself) """
+        turn_moves = self.get_possible_moves()
+        self.change_turn()
+        other_moves = self.get_possible_moves()
+        self.change_turn()
+        if self.turn == self.engine_color:
+            engine_moves, player_moves = turn_moves, other_moves
         else:
-            return self.end_game(engine_moves, player_moves)
+            engine_moves, player_moves = other_moves, turn_moves
+
+        return self.phase_eval(engine_moves, player_moves)
 
     # %% Engine Movement Methods
     def remove_dominated(self):
         pass
 
-    def calculate_moves(self, moves, depth, worst_move = None):
-        """ Do deep analysis of possible moves. Return evaluations of each move. """
-        # Make our engine choose a move to play
-        for start, move_list in moves.items():
-            for move in move_list:
-                new_board, engine_control, player_moves = self.try_move(start, move)
-                self.get_pawn_locs()
-                phase = self.game_phase()
-                move_evaluation = self.get_eval(phase, engine_control, player_moves)
-                if not worst_move:
-                    worst_move = move_evaluation
-                if move_evaluation <= worst_move:
-                    continue
-                else:
-                    if depth == 0:
-                        return move_evaluation
-                    else:
-                        self.move_evaluations[(start, move)] = new_board.calculate_moves(player_moves, depth - 1, worst_move)
-
     def evaluate_moves(self):
-        """ Out of the new dictionary created, find which move produces the best results """
-        self.calculate_moves(self.get_valid_moves(), copy.copy(self.depth))
-        print(self.move_evaluations)
-        return self.move_evaluations
-
-    def make_engine_move(self):
-        """ Get the move with the best eval, play it on the board """
-        if self.engine_color == 'White':
-            if len(self.move_log) == 0:
-                return rnd.choice([((6, 2), (4, 2)), ((6, 3), (4, 3)), ((6, 4), (4, 4))])
+        """ Search the position with the engine, record the evaluation of every move it looked at """
+        if self.workers > 1:
+            if self.parallel_search is None:
+                self.parallel_search = ParallelSearch(self, self.workers)
+            result = self.parallel_search.search(self.depth)
+            self.move_evaluations = dict(self.parallel_search.root_scores)
+            self.search_stats = self.parallel_search.stats
         else:
-            if len(self.move_log) == 1:
-                return rnd.choice([((1, 2), (3, 2)), ((1, 3), (3, 3)), ((1, 4), (3, 4))])
-
-        best_move = self.evaluate_moves()
+            result = self.engine.search(self.depth)
+            self.move_evaluations = dict(self.engine.root_scores)
+            self.search_stats = self.engine.stats
+        print(self.search_stats)
+        return result
+
+    def make_engine_move(self, result=None):
+        """ Get the move with the best eval (or a book move while the book has the position), play it on the board
+        :param result: SearchResult already found for the current position (i.e. by pondering) to play instead
+        """
+        best_move = None
+        if result is None and self.book is not None:
+            legal_moves = [(start, end) for start, ends in self.get_valid_moves().items() for end in ends]
+            best_move = self.book.choose(self.chess_board.board, self.turn, legal_moves)
+
+        self.predicted_move = None
+        if best_move is None:
+            if result is None:
+                result = self.evaluate_moves()
+            best_move = result.move
+            if len(result.pv) > 1 and result.pv[0] == best_move:
+                self.predicted_move = result.pv[1]
         piece_start = best_move[0]
         piece_end = best_move[1]
 
@@ -1,4 +1,11 @@
 from chess import Chess
+from ponder import Ponderer
+import os
+
+# Polyglot opening book the engine plays from, if there is one next to the driver
+BOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin')
+# Endgame tablebases made by tablebase_gen.py
+TABLEBASES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebases')
 
 
 def player_move(chessgame):
@@ -40,7 +47,7 @@ def player_move(chessgame):
 
 
 def check_game_over(chess_game):
-    """ Check if chess game object is over, i.e. draw by repetition, stalemate, or checkmate
+    """ Check if chess game object is over, i.e. draw by repetition or the fifty-move rule, stalemate, or checkmate
 
     :param chess_game: chess game object
     :return: Boolean
@@ -55,12 +62,20 @@ def check_game_over(chess_game):
         print('Draw by stalemate')
         return True
     elif chess_game.draw:
-        print('Draw by 3-move Repetition')
+        print('Draw by the fifty-move rule' if chess_game.fifty_moves() else 'Draw by 3-move Repetition')
         return True
 
     return False
 
 
+def engine_move(chessgame, ponderer):
+    """ Make the engine's move, taking the ponder search's result if the player made the expected move """
+    result = ponderer.finish() if ponderer is not None else None
+    if result is not None:
+        print('Ponder hit:', chessgame.search_stats)
+    chessgame.make_engine_move(result)
+
+
 def chess_inputs():
     player_color = input('Which color would you like to play?\n').lower()
     while player_color != 'white' and player_color != 'black':
@@ -79,9 +94,12 @@ def chess_inputs():
 
 
 def main():
-    chessgame = Chess()
+    chessgame = Chess(book=BOOK if os.path.exists(BOOK) else None,
+                      tablebases=TABLEBASES if os.path.isdir(TABLEBASES) else None)
 
     player_color, depth = chess_inputs()
+    ponder = input('Should the engine think while you do? (y/n)\n').lower().startswith('y')
+    ponderer = Ponderer(chessgame) if ponder else None
 
     chessgame.chess_board.print_board()
 
@@ -94,19 +112,23 @@ def main():
             if check_game_over(chessgame):
                 break
             chessgame.chess_board.print_board()
-            chessgame.make_engine_move()
+            engine_move(chessgame, ponderer)
             if check_game_over(chessgame):
                 break
             chessgame.chess_board.print_board()
+            if ponderer is not None:
+                ponderer.start()
     else:
         chessgame.engine_color = 'White'
         chessgame.player_color = 'Black'
         chessgame.depth = depth
         while True:
-            chessgame.make_engine_move()
+            engine_move(chessgame, ponderer)
             if check_game_over(chessgame):
                 break
             chessgame.chess_board.print_board()
+            if ponderer is not None:
+                ponderer.start()
             player_move(chessgame)
             if check_game_over(chessgame):
                 break
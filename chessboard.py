@@ -3,10 +3,15 @@ Chessboard Class
 DS 3500 Final Project
 """
 
-from pieces import King, Queen, Rook, Bishop, Knight, Pawn
+from pieces import Piece, King, Queen, Rook, Bishop, Knight, Pawn
+from psqt import MIDGAME, ENDGAME, PHASE_WEIGHTS
 from tabulate import tabulate
 
 pieces = ['', Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]
+# FEN letters of each piece, lowercase (White's are uppercase)
+FEN_PIECES = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King}
+FEN_LETTERS = {'Pawn': 'p', 'Knight': 'n', 'Bishop': 'b', 'Rook': 'r', 'Queen': 'q', 'King': 'k'}
+PIECE_NAMES = ('Pawn', 'Knight', 'Bishop', 'Rook', 'Queen', 'King')
 
 
 class chessboard():
@@ -20,7 +25,14 @@ class chessboard():
 
         Attributes:
             board: 2d list containing the pieces
-            material_eval: strict material evaluation of the board
+            material_eval: strict material evaluation of the board (White minus Black)
+            minor_pieces, major_pieces, pawns: piece counts of both colors
+            phase: game phase, 24 with every piece on the board down to 0 with only kings and pawns
+            midgame_psqt, endgame_psqt: piece-square table sums (White minus Black)
+            piece_lists: {color: {name: {piece: None}}}, every piece on the board by color and type
+            kings: {color: King}, so finding a king is a lookup instead of a scan
+
+        The counters and piece lists are kept up to date by add_piece/remove_piece/move_piece as moves are made.
         """
         self.board = [[pieces[file + 1]('Black', (rank, file)) if rank == 0
                        else Pawn('Black', (rank, file)) if rank == 1
@@ -29,9 +41,127 @@ class chessboard():
                        else '--' for file in range(0, 8)] for rank in range(0, 8)]
 
         self.flattened = sum(self.board, [])
-        self.material_eval = self.piece_eval()
-        self.minor_pieces = self.num_minor()
-        self.major_pieces = self.num_major()
+        self.recount()
+
+    def recount(self):
+        """ Recompute every counter and piece list from scratch, only needed after setting up a new position """
+        self.piece_lists = {color: {name: {} for name in PIECE_NAMES} for color in ('White', 'Black')}
+        self.kings = {}
+        self.material_eval = 0
+        self.minor_pieces = 0
+        self.major_pieces = 0
+        self.pawns = 0
+        self.phase = 0
+        self.midgame_psqt = 0
+        self.endgame_psqt = 0
+        for row in range(8):
+            for column in range(8):
+                if self.board[row][column] != '--':
+                    self.add_piece(self.board[row][column], row, column)
+
+    def eval_state(self):
+        """ Snapshot of the counters, so taking a move back can restore them exactly """
+        return (self.material_eval, self.minor_pieces, self.major_pieces, self.pawns, self.phase,
+                self.midgame_psqt, self.endgame_psqt)
+
+    def restore_eval_state(self, state):
+        self.material_eval, self.minor_pieces, self.major_pieces, self.pawns, self.phase, \
+            self.midgame_psqt, self.endgame_psqt = state
+
+    def add_piece(self, piece, row, column, sign=1):
+        """ Count a piece arriving on (row, column), or leaving it when sign is -1 """
+        if sign > 0:
+            self.list_piece(piece)
+        else:
+            self.unlist_piece(piece)
+        weight = sign if piece.color == 'White' else -sign
+        self.material_eval += weight * piece.val
+        if piece.name == 'Knight' or piece.name == 'Bishop':
+            self.minor_pieces += sign
+        elif piece.name == 'Rook' or piece.name == 'Queen':
+            self.major_pieces += sign
+        elif piece.name == 'Pawn':
+            self.pawns += sign
+        self.phase += sign * PHASE_WEIGHTS[piece.name]
+        self.midgame_psqt += weight * MIDGAME[(piece.color, piece.name)][row][column]
+        self.endgame_psqt += weight * ENDGAME[(piece.color, piece.name)][row][column]
+
+    def remove_piece(self, piece, row, column):
+        self.add_piece(piece, row, column, -1)
+
+    def list_piece(self, piece):
+        """ Add a piece to the piece lists (the counters are left alone) """
+        self.piece_lists[piece.color][piece.name][piece] = None
+        if piece.name == 'King':
+            self.kings[piece.color] = piece
+
+    def unlist_piece(self, piece):
+        """ Take a piece off the piece lists (the counters are left alone) """
+        del self.piece_lists[piece.color][piece.name][piece]
+
+    def color_pieces(self, color):
+        """ Every piece of a color, in board order (row by row) like a scan of the board would find them """
+        pieces = [piece for same_type in self.piece_lists[color].values() for piece in same_type]
+        pieces.sort(key=Piece.get_pos)
+        return pieces
+
+    def king_square(self, color):
+        return self.kings[color].pos
+
+    def move_piece(self, piece, start, end):
+        """ Count a piece moving from start to end, only its piece-square values change """
+        weight = 1 if piece.color == 'White' else -1
+        midgame = MIDGAME[(piece.color, piece.name)]
+        endgame = ENDGAME[(piece.color, piece.name)]
+        self.midgame_psqt += weight * (midgame[end[0]][end[1]] - midgame[start[0]][start[1]])
+        self.endgame_psqt += weight * (endgame[end[0]][end[1]] - endgame[start[0]][start[1]])
+
+    def load_fen(self, placement):
+        """ Set the board up from the piece placement field of a FEN (i.e. 'rnbqkbnr/pppppppp/8/8/...') """
+        ranks = placement.split('/')
+        if len(ranks) != 8:
+            raise ValueError(f'FEN placement needs 8 ranks: {placement!r}')
+        board = []
+        for rank, letters in enumerate(ranks):
+            row = []
+            for letter in letters:
+                if letter.isdigit():
+                    row += ['--'] * int(letter)
+                elif letter.lower() in FEN_PIECES:
+                    color = 'White' if letter.isupper() else 'Black'
+                    if letter.lower() == 'p' and rank in (0, 7):
+                        raise ValueError(f'Pawn on rank {8 - rank} in FEN placement: {placement!r}')
+                    piece = FEN_PIECES[letter.lower()](color, (rank, len(row)))
+                    # Only pawns still on their starting rank can move two squares
+                    piece.first_move = piece.name != 'Pawn' or rank == (6 if color == 'White' else 1)
+                    row.append(piece)
+                else:
+                    raise ValueError(f'Unknown piece {letter!r} in FEN placement: {placement!r}')
+            if len(row) != 8:
+                raise ValueError(f'FEN rank {8 - rank} does not have 8 squares: {placement!r}')
+            board.append(row)
+
+        self.board = board
+        self.flattened = sum(board, [])
+        self.recount()
+
+    def fen(self):
+        """ Piece placement field of the board's FEN """
+        ranks = []
+        for row in self.board:
+            letters = ''
+            empty = 0
+            for piece in row:
+                if piece == '--':
+                    empty += 1
+                    continue
+                if empty:
+                    letters += str(empty)
+                    empty = 0
+                letter = FEN_LETTERS[piece.name]
+                letters += letter.upper() if piece.color == 'White' else letter
+            ranks.append(letters + (str(empty) if empty else ''))
+        return '/'.join(ranks)
 
     def print_board(self):
         board_rep = [[piece for piece in self.board[i]] + [8 - i] for i in range(0, 8)]
@@ -39,18 +169,14 @@ class chessboard():
         print(tabulate(board_rep, headers='firstrow', tablefmt='fancy_grid', stralign='center'))
 
     def piece_eval(self):
-        return sum([piece.val for piece in self.flattened if piece != '--' and piece.color == 'White']) - \
-               sum([piece.val for piece in self.flattened if piece != '--' and piece.color == 'Black'])
+        return self.material_eval
 
     def num_minor(self):
-        return len([piece for piece in self.flattened if piece != '--' and
-                    (piece.name == 'Knight' or piece.name == 'Bishop')])
+        return self.minor_pieces
 
     def num_major(self):
-        return len([piece for piece in self.flattened if piece != '--' and
-                    (piece.name == 'Rook' or piece.name == 'Queen')])
+        return self.major_pieces
 
     def pawn_count(self):
-        return len([piece for piece in self.flattened if piece != '--' and
-                    (piece.name == 'Pawn')])
+        return self.pawns
 
@@ -0,0 +1,146 @@
+"""
+Mailbox Board Class
+DS 3500 Final Project
+"""
+
+from pieces import King, Queen, Rook, Bishop, Knight, Pawn
+from chessboard import chessboard
+
+# Piece codes, black pieces carry the BLACK bit on top of the white code
+EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, OFFBOARD = range(8)
+BLACK = 8
+
+PIECE_CODES = {'Pawn': PAWN, 'Knight': KNIGHT, 'Bishop': BISHOP, 'Rook': ROOK, 'Queen': QUEEN, 'King': KING}
+PIECE_CLASSES = {PAWN: Pawn, KNIGHT: Knight, BISHOP: Bishop, ROOK: Rook, QUEEN: Queen, KING: King}
+
+# Castling right bits
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+
+
+def square(row, col):
+    """ Turn 2d list indices into a 10x12 mailbox index (i.e. (0, 0) --> 21) """
+    return 21 + row * 10 + col
+
+
+def unsquare(index):
+    """ Turn a 10x12 mailbox index into 2d list indices (i.e. 21 --> (0, 0)) """
+    return (index - 21) // 10, (index - 21) % 10
+
+
+def piece_code(piece):
+    """ Code of a Piece object (or '--') """
+    if piece == '--':
+        return EMPTY
+    return PIECE_CODES[piece.name] | (BLACK if piece.color == 'Black' else 0)
+
+
+class State:
+    """ Everything about a position that isn't on the squares, kept in one small struct """
+    __slots__ = ('turn', 'castling', 'en_passant', 'halfmove_clock')
+
+    def __init__(self, turn='White', castling=0, en_passant=0, halfmove_clock=0):
+        """
+        Attributes:
+            turn (str): side to move (White or Black)
+            castling (int): castling right bits
+            en_passant (int): mailbox index of the en passant square, 0 if there is none
+            halfmove_clock (int): plies since the last capture or pawn move
+        """
+        self.turn = turn
+        self.castling = castling
+        self.en_passant = en_passant
+        self.halfmove_clock = halfmove_clock
+
+    def __eq__(self, other):
+        return isinstance(other, State) and self.key() == other.key()
+
+    def __repr__(self):
+        return f'State({self.turn!r}, {self.castling}, {self.en_passant}, {self.halfmove_clock})'
+
+    def copy(self):
+        return State(self.turn, self.castling, self.en_passant, self.halfmove_clock)
+
+    def key(self):
+        """ Bytes that identify the state (the halfmove clock does not change the position) """
+        return bytes((self.turn == 'Black', self.castling, self.en_passant))
+
+
+class Mailbox:
+    """Generate a 10x12 mailbox chessboard stored in a flat bytearray"""
+    """Rows 0-1 and 10-11 and columns 0 and 9 are OFFBOARD sentinels, so
+    move generators can step off the edge of the board without bounds checks"""
+
+    def __init__(self, squares=None, state=None):
+        """ Mailbox constructor. Defaults to the regular starting position
+
+        Attributes:
+            squares: bytearray of 120 piece codes
+            state: side to move, castling rights, en passant square and halfmove clock
+        """
+        if squares is None:
+            squares = Mailbox.from_chessboard(chessboard()).squares
+        self.squares = squares
+        self.state = state if state is not None else State()
+
+    @classmethod
+    def from_chessboard(cls, chess_board, turn='White'):
+        """ Build a mailbox from a chessboard object (or anything with a 2d list of pieces) """
+        squares = bytearray([OFFBOARD]) * 120
+        for row in range(8):
+            for col in range(8):
+                squares[square(row, col)] = piece_code(chess_board.board[row][col])
+        return cls(squares, State(turn))
+
+    def __eq__(self, other):
+        return isinstance(other, Mailbox) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def copy(self):
+        """ Copy of the position, 120 bytes for the squares plus the state struct """
+        return Mailbox(self.squares[:], self.state.copy())
+
+    def key(self):
+        """ Bytes that uniquely identify the position """
+        return bytes(self.squares) + self.state.key()
+
+    def piece_at(self, row, col):
+        return self.squares[square(row, col)]
+
+    def occupied(self, color):
+        """ Mailbox indices of every piece of the given color """
+        black = BLACK if color == 'Black' else 0
+        return [index for index, code in enumerate(self.squares)
+                if code not in (EMPTY, OFFBOARD) and code & BLACK == black]
+
+    # %% Adapter to the 2d list of pieces
+
+    @property
+    def board(self):
+        """ 2d list of Piece objects and '--' blanks, so existing code can read the mailbox like a chessboard """
+        rows = []
+        for row in range(8):
+            rank = []
+            for col in range(8):
+                code = self.squares[square(row, col)]
+                if code == EMPTY:
+                    rank.append('--')
+                else:
+                    piece = PIECE_CLASSES[code & 7]('Black' if code & BLACK else 'White', (row, col))
+                    # Pawns off their starting rank have already moved
+                    piece.first_move = piece.name != 'Pawn' or row == (1 if code & BLACK else 6)
+                    rank.append(piece)
+            rows.append(rank)
+        return rows
+
+    def to_chessboard(self):
+        """ Build a chessboard object holding the same position """
+        chess_board = chessboard()
+        chess_board.board = self.board
+        chess_board.flattened = sum(chess_board.board, [])
+        chess_board.recount()
+        return chess_board
+
+    def print_board(self):
+        chessboard.print_board(self)
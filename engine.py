@@ -0,0 +1,467 @@
+"""
+Chess Engine
+DS 3500 Final Project
+"""
+
+from collections import namedtuple
+from transposition import EXACT, LOWER, UPPER
+from move_ordering import MoveOrderer
+from search_stats import SearchStats, StageTimers
+from tablebase import WIN, LOSS
+import time
+
+INFINITY = 100000
+# Mates are scored MATE minus the number of plies to the mate, so quicker mates score higher
+MATE = 10000
+MATE_BOUND = MATE - 1000
+# Tablebase wins found inside the search, below every mate score so a mate the search can see is still preferred
+TABLEBASE_WIN = MATE_BOUND - 1000
+# Half width of the first window tried around the previous iteration's score, in pawns
+ASPIRATION_WINDOW = 0.5
+# Scores are fractions of a pawn, so a null window is a sliver instead of a whole point
+NULL_WINDOW = 1e-6
+# Captures that can't bring the score within this many pawns of alpha aren't worth searching
+DELTA_MARGIN = 2
+PROMOTION_GAIN = 8
+
+SearchResult = namedtuple('SearchResult', ['move', 'score', 'pv', 'depth', 'nodes'])
+
+
+class Engine:
+
+    def __init__(self, game, orderer=None, batch_root=False, timers=False, profile=False, on_iteration=None):
+        """ Engine that searches a Chess game in place with make_move/unmake_move
+        Attributes:
+            game (obj): Chess game to search
+            transposition_table (obj): the game's transposition table, shared with every search of the game
+            orderer (obj): move ordering heuristics, MoveOrderer with everything switched on by default
+            batch_root (bool): score every root move with one NumPy batch evaluation and search them best first
+            timers (bool): time move generation, legality checks and evaluation (adds a little overhead)
+            profile (bool): run every search under cProfile, the pstats.Stats end up in self.profile_stats
+            on_iteration (function): called with (SearchResult, SearchStats) after every completed iteration
+            aspiration_window (float): half width of the first aspiration window, ASPIRATION_WINDOW by default
+            delta_margin (float): delta pruning margin of the quiescence search, DELTA_MARGIN by default
+            nodes (int): positions visited by the current search
+            qnodes (int): positions visited by the current search's quiescence search
+            seldepth (int): deepest ply the current search reached
+            tb_hits (int): positions the current search scored from the endgame tablebases
+            stats (obj): SearchStats of the last search
+            root_scores (dict): score of every root move from the last completed iteration
+                                (only the best one is exact, the rest are upper bounds)
+            stopped (bool): whether the current search ran out of time or was stopped
+            stop_requested (bool): set by stop(), possibly from another thread, and kept until clear_stop() so a
+                                   stop that comes in before the search starts isn't lost
+            deadline_requested (float): deadline set by set_deadline(), kept until clear_stop() like stop_requested
+        """
+        self.game = game
+        self.transposition_table = game.transposition_table
+        self.orderer = orderer if orderer is not None else MoveOrderer()
+        self.batch_root = batch_root
+        self.timers = timers
+        self.profile = profile
+        self.on_iteration = on_iteration
+        self.aspiration_window = ASPIRATION_WINDOW
+        self.delta_margin = DELTA_MARGIN
+        self.root_moves = []
+        self.nodes = 0
+        self.qnodes = 0
+        self.seldepth = 0
+        self.tb_hits = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.stage_timers = None
+        self.stats = SearchStats()
+        self.profile_stats = None
+        self.root_scores = {}
+        self.pv_table = []
+        self.deadline = None
+        self.node_limit = None
+        self.stopped = False
+        self.stop_requested = False
+        self.deadline_requested = None
+
+    # %% Helpers
+
+    @staticmethod
+    def score_to_tt(score, ply):
+        """ Store mate scores relative to the stored position instead of the root """
+        if score >= MATE_BOUND:
+            return score + ply
+        if score <= -MATE_BOUND:
+            return score - ply
+        return score
+
+    @staticmethod
+    def score_from_tt(score, ply):
+        if score >= MATE_BOUND:
+            return score - ply
+        if score <= -MATE_BOUND:
+            return score + ply
+        return score
+
+    def legal_moves(self):
+        """ Legal moves of the side to move as a flat list of (start, end) """
+        if self.stage_timers is not None:
+            valid_moves = self.timed_legal(self.game.get_possible_moves)
+            self.game.valid_moves = valid_moves
+            self.game.valid_moves_key = (self.game.hash, self.game.turn)
+        else:
+            valid_moves = self.game.get_valid_moves()
+        return [(start, end) for start, ends in valid_moves.items() for end in ends]
+
+    def legal_captures(self):
+        """ Legal captures and promotions of the side to move as a flat list of (start, end) """
+        if self.stage_timers is not None:
+            valid_captures = self.timed_legal(self.game.get_possible_captures)
+        else:
+            valid_captures = self.game.get_valid_captures()
+        return [(start, end) for start, ends in valid_captures.items() for end in ends]
+
+    def timed_legal(self, generate):
+        """ Generate moves and filter them for legality, timing each stage """
+        possible_moves = self.stage_timers.time('movegen', generate)
+        return self.stage_timers.time('legality', self.game.legal_filter, possible_moves)
+
+    def evaluate(self):
+        """ Static evaluation from the side to move's point of view """
+        if self.stage_timers is not None:
+            score = self.stage_timers.time('eval', self.game.evaluate)
+        else:
+            score = self.game.evaluate()
+        return score if self.game.turn == self.game.engine_color else -score
+
+    def static_move_scores(self, moves):
+        """ Score the position after every move with one batched evaluation (needs NumPy)
+        :param moves: list of (start, end) moves of the side to move
+        :return: {move: static score for the side to move}
+        """
+        from batch_eval import LeafBatch
+
+        game = self.game
+        batch = LeafBatch(game.engine_color, game.weights)
+        for start, end in moves:
+            undo = game.make_move(start[0], start[1], end[0], end[1], update_status=False)
+            batch.add(game.chess_board.board, (start, end))
+            game.unmake_move(undo)
+        sign = 1 if game.turn == game.engine_color else -1
+        return {move: sign * score for move, score in batch.flush()}
+
+    def piece_count(self):
+        """ Pieces on the board, kings included """
+        chess_board = self.game.chess_board
+        return chess_board.pawns + chess_board.minor_pieces + chess_board.major_pieces + 2
+
+    def in_tablebases(self):
+        tablebases = self.game.tablebases
+        return tablebases is not None and self.piece_count() <= tablebases.max_pieces
+
+    def tablebase_root(self, moves):
+        """ Pick the root move by distance to mate
+        :return: SearchResult, or None if a move leads out of the tablebases
+        """
+        game = self.game
+        best = None
+        for start, end in moves:
+            undo = game.make_move(start[0], start[1], end[0], end[1], update_status=False)
+            probed = game.tablebases.probe_dtm(game.chess_board.board, game.turn)
+            game.unmake_move(undo)
+            if probed is None:
+                return None
+            self.tb_hits += 1
+            # Results are for the opponent, mates are a ply further away from the root
+            result, plies = probed
+            if result == LOSS:
+                score = MATE - plies - 1
+            elif result == WIN:
+                score = -MATE + plies + 1
+            else:
+                score = 0
+            self.root_scores[(start, end)] = score
+            if best is None or score > best.score:
+                best = SearchResult((start, end), score, [(start, end)], 1, len(moves))
+        return best
+
+    def stop(self):
+        """ Ask the running search (or the next one, if it hasn't started yet) to return as soon as possible """
+        self.stop_requested = True
+        self.stopped = True
+
+    def clear_stop(self):
+        """ Forget an earlier stop or deadline, called by whoever starts a search before handing it to a thread """
+        self.stop_requested = False
+        self.deadline_requested = None
+
+    def set_deadline(self, time_limit):
+        """ End the running search (or the next one, if it hasn't started yet) time_limit seconds from now """
+        self.deadline_requested = time.perf_counter() + time_limit
+        self.deadline = self.deadline_requested
+
+    def check_time(self):
+        """ Stop once the time or node budget runs out (checked every 1024 nodes) """
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.stopped = True
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            self.stopped = True
+
+    # %% Search
+
+    def search(self, depth, time_limit=None, window=None, node_limit=None, moves=None):
+        """ Iterative deepening search of the game's current position
+        :param depth: maximum depth in plies
+        :param time_limit: seconds to search for, the last completed iteration is returned when it runs out
+        :param node_limit: nodes to search at most, the last completed iteration is returned when they run out
+        :param moves: legal root moves to choose between, all of them by default
+        :param window: (alpha, beta) to search every iteration with instead of aspiration windows
+        :return: SearchResult of the best move, its score for the side to move, the principal variation,
+                 the depth it was found at and the nodes searched
+        """
+        if not self.profile:
+            return self.iterative_deepening(depth, time_limit, window, node_limit, moves)
+
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        result = profiler.runcall(self.iterative_deepening, depth, time_limit, window, node_limit, moves)
+        self.profile_stats = pstats.Stats(profiler)
+        return result
+
+    def iterative_deepening(self, depth, time_limit, window, node_limit, moves):
+        self.nodes = self.qnodes = self.seldepth = self.tb_hits = 0
+        self.cutoffs = self.first_move_cutoffs = 0
+        self.stage_timers = StageTimers() if self.timers else None
+        # Running out of time only ends one search, a stop stays in force until it's cleared
+        self.stopped = self.stop_requested
+        start_time = time.perf_counter()
+        self.deadline = start_time + time_limit if time_limit is not None else self.deadline_requested
+        self.node_limit = node_limit
+        tt_hits, tt_misses = self.transposition_table.hits, self.transposition_table.misses
+        self.transposition_table.new_search()
+        self.orderer.new_search(self.game.ply)
+        iteration_nodes = []
+
+        def current_stats(completed_depth):
+            return SearchStats(completed_depth, self.nodes, self.qnodes, self.seldepth,
+                               time.perf_counter() - start_time, self.cutoffs, self.first_move_cutoffs,
+                               self.transposition_table.hits - tt_hits, self.transposition_table.misses - tt_misses,
+                               list(iteration_nodes),
+                               dict(self.stage_timers.totals) if self.stage_timers is not None else {},
+                               self.tb_hits)
+
+        moves = self.legal_moves() if moves is None else list(moves)
+        if not moves:
+            # Nothing to search: checkmated or stalemated
+            score = -MATE if self.game.king_in_check(self.game.turn) else 0
+            self.stats = current_stats(0)
+            return SearchResult(None, score, [], 0, 0)
+        if self.in_tablebases():
+            self.root_scores = {}
+            result = self.tablebase_root(moves)
+            if result is not None:
+                self.nodes = len(moves)
+                self.stats = current_stats(result.depth)
+                return result
+
+        result = SearchResult(moves[0], 0, [], 0, 0)
+        if self.batch_root:
+            scores = self.static_move_scores(moves)
+            moves.sort(key=scores.get, reverse=True)
+        self.root_moves = moves
+
+        score = 0
+        for current_depth in range(1, depth + 1):
+            iteration_start = self.nodes
+            if window is None:
+                score = self.aspiration(current_depth, score)
+            else:
+                score = self.search_root(current_depth, window[0], window[1])
+            if self.stopped:
+                break
+            iteration_nodes.append(self.nodes - iteration_start)
+            pv = self.pv_table[0]
+            result = SearchResult(pv[0] if pv else result.move, score, pv, current_depth, self.nodes)
+            if self.on_iteration is not None:
+                self.on_iteration(result, current_stats(current_depth))
+
+        self.stats = current_stats(result.depth)
+        return result._replace(nodes=self.nodes)
+
+    def aspiration(self, depth, previous_score):
+        """ Search the root inside a small window around the previous score, widening it whenever it fails """
+        if depth < 3 or abs(previous_score) >= MATE_BOUND:
+            return self.search_root(depth, -INFINITY, INFINITY)
+
+        window = self.aspiration_window
+        alpha, beta = previous_score - window, previous_score + window
+        while True:
+            score = self.search_root(depth, alpha, beta)
+            if self.stopped:
+                return score
+            if score <= alpha:
+                alpha = max(score - window, -INFINITY)
+            elif score >= beta:
+                beta = min(score + window, INFINITY)
+            else:
+                return score
+            window *= 2
+
+    def search_root(self, depth, alpha, beta):
+        """ Negamax from the root, recording every root move's score """
+        self.pv_table = [[] for _ in range(depth + 1)]
+        self.root_scores = {}
+        return self.negamax(depth, alpha, beta, 0)
+
+    def negamax(self, depth, alpha, beta, ply):
+        """ Fail-soft negamax alpha-beta with principal variation search
+        :param depth: remaining depth in plies
+        :param alpha: lower bound of the window
+        :param beta: upper bound of the window
+        :param ply: distance from the root
+        :return: score of the position for the side to move (a bound if it falls outside the window)
+        """
+        game = self.game
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_time()
+        if self.stopped:
+            return 0
+        if ply > self.seldepth:
+            self.seldepth = ply
+        if ply < len(self.pv_table):
+            self.pv_table[ply] = []
+
+        # Repetitions and the fifty-move rule end the game in a draw, the search can claim or steer clear of them
+        if ply > 0 and (game.fifty_moves() or game.repetition(ply)):
+            return 0
+
+        # Solved endings don't need searching (never at the root so there's always a move to play)
+        if ply > 0 and self.in_tablebases():
+            result = game.tablebases.probe_wdl(game.chess_board.board, game.turn)
+            if result is not None:
+                self.tb_hits += 1
+                return result * (TABLEBASE_WIN - ply)
+
+        # Transposition table cutoffs, never at the root so there's always a move to play
+        key = game.hash
+        hash_move = None
+        entry = self.transposition_table.probe(key)
+        if entry is not None:
+            entry_depth, bound, entry_score, hash_move = entry
+            entry_score = Engine.score_from_tt(entry_score, ply)
+            if ply > 0 and entry_depth >= depth:
+                if bound == EXACT or (bound == LOWER and entry_score >= beta) or \
+                        (bound == UPPER and entry_score <= alpha):
+                    return entry_score
+
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+
+        # The root's moves were generated (and maybe batch scored) once in search
+        moves = list(self.root_moves) if ply == 0 else self.legal_moves()
+        if not moves:
+            # Checkmated or stalemated
+            return -MATE + ply if game.king_in_check(game.turn) else 0
+
+        moves = self.orderer.order(moves, game.chess_board.board, game.turn, ply, hash_move)
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        for index, (start, end) in enumerate(moves):
+            undo = game.make_move(start[0], start[1], end[0], end[1], update_status=False)
+            if index == 0:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            else:
+                # Prove the move is no better than the first with a null window, re-search if it is
+                score = -self.negamax(depth - 1, -alpha - NULL_WINDOW, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            game.unmake_move(undo)
+            if self.stopped:
+                return 0
+
+            if ply == 0:
+                self.root_scores[(start, end)] = score
+            if score > best_score:
+                best_score = score
+                best_move = (start, end)
+                if score > alpha:
+                    alpha = score
+                    if ply + 1 < len(self.pv_table):
+                        self.pv_table[ply] = [best_move] + self.pv_table[ply + 1]
+                    else:
+                        self.pv_table[ply] = [best_move]
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        if index == 0:
+                            self.first_move_cutoffs += 1
+                        self.orderer.cutoff(best_move, game.chess_board.board, game.turn, depth, ply)
+                        break
+
+        if best_score >= beta:
+            bound = LOWER
+        elif best_score > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        self.transposition_table.store(key, depth, bound, Engine.score_to_tt(best_score, ply), best_move)
+
+        return best_score
+
+    def quiescence(self, alpha, beta, ply):
+        """ Extend a leaf through captures and promotions until the position is quiet
+        :param alpha: lower bound of the window
+        :param beta: upper bound of the window
+        :param ply: distance from the root
+        :return: score of the position for the side to move
+        """
+        game = self.game
+        board = game.chess_board.board
+        self.nodes += 1
+        self.qnodes += 1
+        if ply > self.seldepth:
+            self.seldepth = ply
+        if self.nodes & 1023 == 0:
+            self.check_time()
+        if self.stopped:
+            return 0
+
+        # A side in check can't stand pat, it has to get out of check with any legal move
+        in_check = game.king_in_check(game.turn)
+        if in_check:
+            moves = self.legal_moves()
+            if not moves:
+                return -MATE + ply
+            best_score = -INFINITY
+        else:
+            # Stand pat: the side to move can always decline to capture
+            best_score = stand_pat = self.evaluate()
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            moves = self.legal_captures()
+
+        for start, end in self.orderer.order(moves, board, game.turn, ply):
+            if not in_check:
+                # Delta pruning: even winning the victim outright wouldn't raise alpha
+                victim = board[end[0]][end[1]]
+                gain = victim.val if victim != '--' else 0
+                if board[start[0]][start[1]].name == 'Pawn' and end[0] in (0, 7):
+                    gain += PROMOTION_GAIN
+                if stand_pat + gain + self.delta_margin < alpha:
+                    continue
+
+            undo = game.make_move(start[0], start[1], end[0], end[1], update_status=False)
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            game.unmake_move(undo)
+            if self.stopped:
+                return 0
+
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        return best_score
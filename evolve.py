@@ -0,0 +1,253 @@
+"""
+Evolutionary Parameter Search
+DS 3500 Final Project
+
+Evolves the evaluation weights (weights.py) and the quiescence search's delta pruning margin, which
+applies even at the shallow fixed depths the fitness games are played at, with a CMA-ES style
+evolution strategy: each generation samples a population around a mean, scores every individual by
+a short self-play match against the starting parameters, and moves the mean and the per-parameter
+step sizes towards the best individuals. Games of a whole generation are played at once in a pool
+of worker processes.
+
+The state is checkpointed after every generation so a long run picks up where it stopped, and
+fitness is cached by a hash of the parameters so an individual that comes up again is never replayed.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from match import CONFIG_DEFAULTS, openings, play_game
+from weights import DEFAULT_WEIGHTS, WEIGHTS, save_weights
+import hashlib
+import json
+import os
+import sys
+import time
+import numpy as np
+
+# name: (lowest, highest) value it can evolve to
+PARAMETERS = dict(
+    {name: (0.5, 2.0) if name.endswith('material') else (-0.5, 1.0) for name in DEFAULT_WEIGHTS},
+    delta_margin=(0.5, 5.0),
+)
+NAMES = tuple(PARAMETERS)
+LOWER = np.array([PARAMETERS[name][0] for name in NAMES])
+UPPER = np.array([PARAMETERS[name][1] for name in NAMES])
+# Values are rounded to this many decimals, so individuals that only differ by noise count as duplicates
+DECIMALS = 3
+# Starting step size, as a share of each parameter's range
+INITIAL_SIGMA = 0.15
+# How quickly the step sizes follow the spread of the selected individuals
+SIGMA_LEARNING_RATE = 0.3
+# Step sizes never shrink below this share of a parameter's range
+MIN_SIGMA = 0.005
+
+
+def baseline(depth, nodes):
+    """ Configuration with the weights the engine loaded and the engine's own delta margin """
+    return dict(CONFIG_DEFAULTS, name='baseline', depth=depth, nodes=nodes, weights=dict(WEIGHTS))
+
+
+def starting_point(config):
+    """ Parameter vector of a configuration """
+    return np.array([config['weights'][name] if name in DEFAULT_WEIGHTS else config[name] for name in NAMES])
+
+
+def parameter_key(values):
+    """ Hash of a rounded parameter vector, the key of the fitness cache """
+    text = json.dumps([round(float(value), DECIMALS) for value in values])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def configuration(values, depth, nodes):
+    """ Match configuration playing with a parameter vector """
+    parameters = {name: round(float(value), DECIMALS) for name, value in zip(NAMES, values)}
+    return dict(CONFIG_DEFAULTS, name=parameter_key(values)[:12], depth=depth, nodes=nodes,
+                weights={name: parameters[name] for name in DEFAULT_WEIGHTS},
+                delta_margin=parameters['delta_margin'])
+
+
+def recombination_weights(parents):
+    """ Log-rank weights of the selected individuals, best first, adding up to 1 """
+    weights = np.log(parents + 0.5) - np.log(np.arange(1, parents + 1))
+    return weights / weights.sum()
+
+
+class Evolution:
+
+    def __init__(self, checkpoint, population=12, parents=None, games=4, depth=1, nodes=None, openings_path=None,
+                 workers=None, seed=0):
+        """ Evolution strategy over PARAMETERS, resumed from checkpoint when the file exists
+        Attributes:
+            checkpoint (str): JSON file the state is written to after every generation
+            population (int): individuals sampled per generation
+            parents (int): best individuals the next mean and step sizes are taken from
+            games (int): games each individual plays against the baseline, half of them with each color
+            depth (int): search depth of both sides in the fitness games
+            nodes (int): node budget per move of both sides, if any
+            generation (int): generations completed
+            mean (array): centre of the search distribution, in PARAMETERS order
+            sigma (array): step size of every parameter
+            cache (dict): {parameter hash: fitness} of every individual played so far
+            history (list): best individual and fitness of every generation
+        """
+        self.checkpoint = checkpoint
+        self.population = population
+        self.parents = parents or max(1, population // 2)
+        self.games = games
+        self.depth = depth
+        self.nodes = nodes
+        self.fens = openings(openings_path)
+        self.workers = workers or os.cpu_count() or 1
+        self.opponent = baseline(depth, nodes)
+
+        self.generation = 0
+        self.mean = starting_point(self.opponent)
+        self.sigma = (UPPER - LOWER) * INITIAL_SIGMA
+        self.cache = {}
+        self.history = []
+        self.rng = np.random.default_rng(seed)
+        if os.path.exists(checkpoint):
+            self.load()
+
+    # %% Checkpoints
+
+    def save(self):
+        """ Write the state to the checkpoint file, replacing the old one only once the new one is complete """
+        state = {'generation': self.generation, 'names': list(NAMES), 'mean': self.mean.tolist(),
+                 'sigma': self.sigma.tolist(), 'rng': self.rng.bit_generator.state, 'cache': self.cache,
+                 'history': self.history, 'settings': self.settings()}
+        partial = self.checkpoint + '.tmp'
+        with open(partial, 'w') as file:
+            json.dump(state, file)
+        os.replace(partial, self.checkpoint)
+
+    def load(self):
+        with open(self.checkpoint) as file:
+            state = json.load(file)
+        if state['names'] != list(NAMES) or state['settings'] != self.settings():
+            raise ValueError(f'{self.checkpoint} was made with other parameters or match settings')
+        self.generation = state['generation']
+        self.mean = np.array(state['mean'])
+        self.sigma = np.array(state['sigma'])
+        self.rng.bit_generator.state = state['rng']
+        self.cache = state['cache']
+        self.history = state['history']
+        print(f'resuming after generation {self.generation}', file=sys.stderr)
+
+    def settings(self):
+        """ Everything fitness depends on besides the parameters, cached fitness is only valid for the same """
+        return {'games': self.games, 'depth': self.depth, 'nodes': self.nodes,
+                'openings': hashlib.sha1('\n'.join(self.fens).encode()).hexdigest(),
+                'opponent': starting_point(self.opponent).tolist()}
+
+    # %% Generations
+
+    def sample(self):
+        """ Population of rounded parameter vectors around the mean, the mean itself first """
+        samples = self.mean + self.sigma * self.rng.standard_normal((self.population - 1, len(NAMES)))
+        individuals = np.vstack([self.mean, samples])
+        return np.round(np.clip(individuals, LOWER, UPPER), DECIMALS)
+
+    def fitness(self, individuals, executor):
+        """ Score of every individual against the baseline, from 0 to 1, playing only those not in the cache """
+        keys = [parameter_key(values) for values in individuals]
+        unplayed = {}
+        for key, values in zip(keys, individuals):
+            if key not in self.cache and key not in unplayed:
+                unplayed[key] = values
+
+        tasks = []
+        for key, values in unplayed.items():
+            config = configuration(values, self.depth, self.nodes)
+            for number in range(1, self.games + 1):
+                # Each opening twice, the individual taking White first
+                fen = self.fens[(number - 1) // 2 % len(self.fens)]
+                white, black = (config, self.opponent) if number % 2 else (self.opponent, config)
+                tasks.append((key, executor.submit(play_game, number, fen, white, black)))
+
+        points = dict.fromkeys(unplayed, 0.0)
+        for key, future in tasks:
+            game = future.result()
+            score = {'1-0': 1.0, '0-1': 0.0}.get(game['result'], 0.5)
+            points[key] += score if game['white'] != 'baseline' else 1 - score
+        for key, total in points.items():
+            self.cache[key] = total / self.games
+        return [self.cache[key] for key in keys], len(unplayed)
+
+    def step(self, executor):
+        """ Play one generation and move the distribution towards its best individuals
+        :return: (best parameter vector, its fitness, individuals played rather than found in the cache)
+        """
+        individuals = self.sample()
+        scores, played = self.fitness(individuals, executor)
+        # Best first, the earlier individual first on ties so the mean keeps its place
+        order = sorted(range(len(individuals)), key=lambda index: (-scores[index], index))
+        selected = individuals[order[:self.parents]]
+        weights = recombination_weights(len(selected))
+
+        new_mean = weights @ selected
+        spread = np.sqrt(weights @ (selected - self.mean) ** 2)
+        self.sigma = np.maximum((1 - SIGMA_LEARNING_RATE) * self.sigma + SIGMA_LEARNING_RATE * spread,
+                                (UPPER - LOWER) * MIN_SIGMA)
+        self.mean = np.clip(new_mean, LOWER, UPPER)
+
+        self.generation += 1
+        best = individuals[order[0]]
+        self.history.append({'generation': self.generation, 'fitness': scores[order[0]],
+                             'parameters': dict(zip(NAMES, best.tolist()))})
+        return best, scores[order[0]], played
+
+    def run(self, generations):
+        """ Evolve until generations have been completed in total, checkpointing after each one
+        :return: best individual found, (parameters dict, fitness), None if nothing was played
+        """
+        with ProcessPoolExecutor(self.workers) as executor:
+            while self.generation < generations:
+                start = time.perf_counter()
+                best, score, played = self.step(executor)
+                self.save()
+                elapsed = time.perf_counter() - start
+                print(f'generation {self.generation}: best {score:.3f}, {played} played '
+                      f'({self.population - played} cached), {played * self.games / elapsed * 60:.1f} games/min, '
+                      f'mean step {np.mean(self.sigma / (UPPER - LOWER)):.3f}', file=sys.stderr)
+        return self.best()
+
+    def best(self):
+        """ Fittest individual of any generation """
+        if not self.history:
+            return None
+        best = max(self.history, key=lambda entry: entry['fitness'])
+        return best['parameters'], best['fitness']
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Evolve the evaluation weights and delta margin by self-play')
+    parser.add_argument('checkpoint', help='JSON checkpoint, an existing one is resumed')
+    parser.add_argument('--generations', type=int, default=20, help='generations to reach in total')
+    parser.add_argument('--population', type=int, default=12, help='individuals per generation')
+    parser.add_argument('--parents', type=int, default=None, help='individuals selected (default: half)')
+    parser.add_argument('--games', type=int, default=4, help='games per individual against the baseline')
+    parser.add_argument('--depth', type=int, default=1, help='search depth of the fitness games')
+    parser.add_argument('--nodes', type=int, default=None, help='node budget per move of the fitness games')
+    parser.add_argument('--openings', default=None, help='FEN/EPD file of opening positions (default: start)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of a new run')
+    parser.add_argument('--weights', default=None, help="weights file to write the best individual's weights to")
+    args = parser.parse_args()
+
+    evolution = Evolution(args.checkpoint, args.population, args.parents, args.games, args.depth, args.nodes,
+                          args.openings, args.workers, args.seed)
+    best = evolution.run(args.generations)
+    if best is None:
+        return
+    parameters, fitness = best
+    print(f'best fitness {fitness:.3f}')
+    for name in NAMES:
+        print(f'{name:24} {parameters[name]:8.3f}')
+    if args.weights:
+        save_weights({name: parameters[name] for name in DEFAULT_WEIGHTS}, args.weights)
+
+
+if __name__ == '__main__':
+    main()
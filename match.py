@@ -0,0 +1,398 @@
+"""
+Self-play Matches
+DS 3500 Final Project
+
+Plays two engine configurations against each other in a pool of worker processes, every opening
+once with each colour. Games are written as PGN as they finish, and the match stops early once a
+sequential probability ratio test (SPRT) can tell which of its two Elo hypotheses holds.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from chess import START_FEN
+from engine import ASPIRATION_WINDOW, DELTA_MARGIN
+import datetime
+import json
+import math
+import os
+import sys
+import time
+
+# Games queued per worker, enough to keep every worker busy
+IN_FLIGHT_PER_WORKER = 2
+# Games still going after this many half moves are drawn
+MAX_PLIES = 300
+# A side this many pawns of material ahead for ADJUDICATE_PLIES half moves in a row is given the win
+ADJUDICATE_MATERIAL = 6
+ADJUDICATE_PLIES = 8
+# Endings decided by the match rather than the rules of chess
+ADJUDICATED = {'move limit', 'White up material', 'Black up material'}
+# Positions nobody can win, by the pieces on the board
+INSUFFICIENT = ({'King', 'Bishop'}, {'King', 'Knight'}, {'King'})
+
+SAN_LETTERS = {'King': 'K', 'Queen': 'Q', 'Rook': 'R', 'Bishop': 'B', 'Knight': 'N'}
+# Settings a configuration can have and their defaults
+CONFIG_DEFAULTS = {'name': None, 'depth': 2, 'nodes': None, 'time': None, 'hash': 16, 'weights': None,
+                   'aspiration_window': ASPIRATION_WINDOW, 'delta_margin': DELTA_MARGIN}
+# Settings read as numbers with a fraction
+FLOAT_SETTINGS = ('time', 'aspiration_window', 'delta_margin')
+
+# Games kept by each worker process between games, by the color they play
+_worker_players = {}
+
+
+# %% Elo and SPRT
+
+def expected_score(elo):
+    """ Score expected against an opponent elo points weaker """
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo(score):
+    """ Elo difference that a score between 0 and 1 corresponds to """
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def score_stats(wins, draws, losses):
+    """ Mean and variance of the score of one game, None without any games """
+    games = wins + draws + losses
+    if not games:
+        return None
+    score = (wins + draws / 2) / games
+    variance = (wins + draws / 4) / games - score ** 2
+    return score, variance
+
+
+def elo_interval(wins, draws, losses, z=1.96):
+    """ Elo difference and the margin of its 95% confidence interval, (0, inf) without any games """
+    stats = score_stats(wins, draws, losses)
+    if stats is None:
+        return 0.0, math.inf
+    score, variance = stats
+    deviation = math.sqrt(variance / (wins + draws + losses))
+    return elo(score), (elo(score + z * deviation) - elo(score - z * deviation)) / 2
+
+
+def sprt_bounds(alpha=0.05, beta=0.05):
+    """ Log likelihood ratios below which H0 and above which H1 is accepted """
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    """ Log likelihood ratio of H1 (elo1) against H0 (elo0), with the score of a game taken as normally distributed
+    Stays 0 until both a win and a loss have been seen, before that there's no variance to go on.
+    """
+    stats = score_stats(wins, draws, losses)
+    if stats is None or not wins or not losses:
+        return 0.0
+    score, variance = stats
+    if variance <= 0:
+        return 0.0
+    score0, score1 = expected_score(elo0), expected_score(elo1)
+    return (wins + draws + losses) * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+# %% Playing games
+
+def parse_config(text):
+    """ Engine configuration from 'key=value,...', i.e. 'name=deep,depth=3,nodes=20000'
+    Keys are name, depth, nodes (node budget per move), time (seconds per move), hash (MB), weights
+    (evaluation weights file, see weights.py), aspiration_window and delta_margin (see engine.py).
+    """
+    config = dict(CONFIG_DEFAULTS)
+    for setting in filter(None, text.split(',')):
+        key, _, value = setting.partition('=')
+        key = key.strip()
+        if key not in config:
+            raise ValueError(f'unknown engine setting {key!r}, expected one of {", ".join(CONFIG_DEFAULTS)}')
+        if key in ('name', 'weights'):
+            config[key] = value.strip()
+        elif key in FLOAT_SETTINGS:
+            config[key] = float(value)
+        else:
+            config[key] = int(value)
+    if config['name'] is None:
+        config['name'] = text or 'default'
+    return config
+
+
+def player(config, color):
+    """ The worker's game for one side, set up with a configuration for a new game
+    :param config: configuration dict, its weights a weights file, a dict of weights or None for the defaults
+    """
+    from chess import Chess
+    from weights import WEIGHTS, load_weights
+
+    game = _worker_players.get(color)
+    if game is None or game.transposition_table.size_mb != config['hash']:
+        game = _worker_players[color] = Chess(hash_size=config['hash'])
+    else:
+        game.transposition_table.clear()
+    game.depth = config['depth']
+    weights = config['weights']
+    game.weights = load_weights(weights) if isinstance(weights, str) else weights if weights is not None else WEIGHTS
+    engine = game.engine
+    engine.aspiration_window = config['aspiration_window']
+    engine.delta_margin = config['delta_margin']
+    engine.orderer.reset()
+    return game
+
+
+def san(game, move):
+    """ Standard algebraic notation of a move, without the check or mate suffix (i.e. 'Nbd7', 'exd5', 'e8=Q') """
+    from chess import Chess
+
+    start, end = move
+    board = game.chess_board.board
+    piece = board[start[0]][start[1]]
+    capture = 'x' if board[end[0]][end[1]] != '--' else ''
+    target = Chess.uncoordinate(end)
+    if piece.name == 'Pawn':
+        name = (Chess.uncoordinate(start)[0] + capture if capture else '') + target
+        return name + '=Q' if end[0] in (0, 7) else name
+
+    # Name the start file, rank or both when another piece of the same kind can go to the same square
+    others = [other for other, ends in game.get_valid_moves().items()
+              if other != start and end in ends and board[other[0]][other[1]].name == piece.name]
+    square = Chess.uncoordinate(start)
+    if not others:
+        origin = ''
+    elif all(other[1] != start[1] for other in others):
+        origin = square[0]
+    elif all(other[0] != start[0] for other in others):
+        origin = square[1]
+    else:
+        origin = square
+    return SAN_LETTERS[piece.name] + origin + capture + target
+
+
+def insufficient_material(board):
+    """ Check if neither side has the pieces to mate, i.e. a lone king, or a king and one minor piece each """
+    pieces = {'White': [], 'Black': []}
+    for row in board:
+        for piece in row:
+            if piece != '--':
+                pieces[piece.color].append(piece.name)
+    return all(len(names) <= 2 and set(names) in INSUFFICIENT for names in pieces.values())
+
+
+def play_game(number, fen, white, black):
+    """ Worker task: play one game between two configurations
+    :param number: game number in the match
+    :param fen: opening position
+    :param white: configuration playing White
+    :param black: configuration playing Black
+    :return: dict of the game, with its moves in SAN
+    """
+    from chess import Chess
+
+    players = {'White': player(white, 'White'), 'Black': player(black, 'Black')}
+    referee = Chess(hash_size=1)
+    referee.load_fen(fen)
+    # Written back out in full, whether the opening was a FEN or an EPD
+    fen = referee.fen()
+    for color, game in players.items():
+        game.load_fen(fen)
+        game.engine_color = color
+    configs = {'White': white, 'Black': black}
+
+    moves = []
+    nodes = 0
+    ahead = 0
+    result, reason = '1/2-1/2', 'move limit'
+    start_ply = referee.ply
+    while referee.ply - start_ply < MAX_PLIES:
+        config = configs[referee.turn]
+        search = players[referee.turn].engine.search(config['depth'], time_limit=config['time'],
+                                                     node_limit=config['nodes'])
+        nodes += search.nodes
+        (start_row, start_col), (end_row, end_col) = move = search.move
+
+        name = san(referee, move)
+        referee.make_move(start_row, start_col, end_row, end_col)
+        for game in players.values():
+            game.make_move(start_row, start_col, end_row, end_col, update_status=False)
+        if referee.checkmate:
+            moves.append(name + '#')
+            result, reason = ('0-1', 'Black mates') if referee.turn == 'White' else ('1-0', 'White mates')
+            break
+        moves.append(name + '+' if referee.king_in_check(referee.turn) else name)
+        if referee.stalemate:
+            reason = 'stalemate'
+            break
+        if referee.draw:
+            reason = 'fifty-move rule' if referee.fifty_moves() else 'threefold repetition'
+            break
+        if insufficient_material(referee.chess_board.board):
+            reason = 'insufficient material'
+            break
+
+        # Adjudicate a win once one side has kept a large material lead for a while
+        material = referee.chess_board.material_eval
+        leader = 1 if material >= ADJUDICATE_MATERIAL else -1 if material <= -ADJUDICATE_MATERIAL else 0
+        ahead = ahead + leader if leader and (ahead > 0) == (leader > 0) else leader
+        if abs(ahead) >= ADJUDICATE_PLIES:
+            result, reason = ('1-0', 'White up material') if ahead > 0 else ('0-1', 'Black up material')
+            break
+
+    return {'number': number, 'white': white['name'], 'black': black['name'], 'fen': fen,
+            'start_ply': start_ply, 'moves': moves, 'result': result, 'reason': reason, 'nodes': nodes}
+
+
+# %% Output
+
+def pgn(game, date):
+    """ PGN of a game returned by play_game """
+    tags = [('Event', 'Self-play match'), ('Site', '?'), ('Date', date), ('Round', game['number']),
+            ('White', game['white']), ('Black', game['black']), ('Result', game['result'])]
+    if game['fen'] != START_FEN:
+        tags += [('FEN', game['fen']), ('SetUp', '1')]
+    termination = 'adjudication' if game['reason'] in ADJUDICATED else 'normal'
+    tags += [('PlyCount', len(game['moves'])), ('Termination', termination)]
+
+    tokens = []
+    for index, name in enumerate(game['moves']):
+        ply = game['start_ply'] + index
+        if ply % 2 == 0:
+            tokens.append(f'{ply // 2 + 1}.')
+        elif index == 0:
+            tokens.append(f'{ply // 2 + 1}...')
+        tokens.append(name)
+    tokens += [f'{{{game["reason"]}}}', game['result']]
+
+    # Movetext lines are kept under 80 characters
+    lines, line = [], ''
+    for token in tokens:
+        if line and len(line) + len(token) + 1 > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    lines.append(line)
+    return '\n'.join(f'[{tag} "{value}"]' for tag, value in tags) + '\n\n' + '\n'.join(lines) + '\n\n'
+
+
+def openings(path):
+    """ FENs (or EPDs) to start games from, just the starting position without a file """
+    if path is None:
+        return [START_FEN]
+    from analyse import positions
+    fens = [line for number, line in positions(path)]
+    if not fens:
+        raise ValueError(f'no positions in {path}')
+    return fens
+
+
+# %% Match
+
+def match(first, second, pgn_path, openings_path=None, games=1000, workers=None, elo0=0.0, elo1=10.0, alpha=0.05,
+          beta=0.05):
+    """ Play first against second until the SPRT decides or the games run out
+    Each opening is played twice, with the configurations swapping colours.
+    :param first: configuration being tested, results are from its point of view
+    :param second: configuration it's tested against
+    :param pgn_path: file the games are appended to
+    :param openings_path: FEN or EPD file of opening positions, used in order and repeated as needed
+    :param games: most games to play
+    :param workers: number of worker processes, defaults to the number of cores
+    :param elo0: Elo difference of H0, the change isn't an improvement
+    :param elo1: Elo difference of H1, the change is at least this much better
+    :param alpha: chance of accepting H1 when H0 holds
+    :param beta: chance of accepting H0 when H1 holds
+    :return: dict summarising the match
+    """
+    if first['name'] == second['name']:
+        second = dict(second, name=second['name'] + '-2')
+    fens = openings(openings_path)
+    workers = workers or os.cpu_count() or 1
+    lower, upper = sprt_bounds(alpha, beta)
+    date = datetime.date.today().strftime('%Y.%m.%d')
+
+    wins = draws = losses = 0
+    nodes = 0
+    llr = 0.0
+    verdict = 'inconclusive'
+    start = time.perf_counter()
+    pending = set()
+    executor = ProcessPoolExecutor(workers)
+    try:
+        with open(pgn_path, 'a') as output:
+            tasks = ((number, fens[(number - 1) // 2 % len(fens)]) for number in range(1, games + 1))
+            for number, fen in tasks:
+                white, black = (first, second) if number % 2 else (second, first)
+                pending.add(executor.submit(play_game, number, fen, white, black))
+
+                # Record finished games until there's room for more, or until the last game is in
+                while pending and (len(pending) >= IN_FLIGHT_PER_WORKER * workers or number == games):
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        game = future.result()
+                        output.write(pgn(game, date))
+                        nodes += game['nodes']
+                        points = {'1-0': 1, '0-1': -1}.get(game['result'], 0)
+                        if game['black'] == first['name']:
+                            points = -points
+                        wins += points == 1
+                        draws += points == 0
+                        losses += points == -1
+                    output.flush()
+
+                    llr = sprt_llr(wins, draws, losses, elo0, elo1)
+                    if llr >= upper or llr <= lower:
+                        verdict = 'H1 accepted' if llr >= upper else 'H0 accepted'
+                        break
+                if verdict != 'inconclusive':
+                    break
+    finally:
+        # Games still queued when the test decides aren't needed
+        executor.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    played = wins + draws + losses
+    elo_difference, margin = elo_interval(wins, draws, losses)
+    return {'first': first['name'], 'second': second['name'], 'games': played, 'wins': wins, 'draws': draws,
+            'losses': losses, 'score': (wins + draws / 2) / played if played else 0.0, 'elo': elo_difference,
+            'elo_margin': margin, 'llr': llr, 'llr_bounds': (lower, upper), 'elo0': elo0, 'elo1': elo1,
+            'verdict': verdict, 'elapsed': elapsed, 'nodes': nodes, 'workers': workers,
+            'games_per_minute_per_core': played / (elapsed / 60) / workers if elapsed else 0.0}
+
+
+def summary_text(summary):
+    return (f'{summary["first"]} vs {summary["second"]}: {summary["games"]} games '
+            f'+{summary["wins"]} ={summary["draws"]} -{summary["losses"]} ({summary["score"]:.1%})\n'
+            f'Elo {summary["elo"]:+.1f} +/- {summary["elo_margin"]:.1f} (95%)\n'
+            f'SPRT [{summary["elo0"]}, {summary["elo1"]}] LLR {summary["llr"]:.2f} '
+            f'({summary["llr_bounds"][0]:.2f}, {summary["llr_bounds"][1]:.2f}) {summary["verdict"]}\n'
+            f'{summary["elapsed"]:.1f}s, {summary["games_per_minute_per_core"]:.2f} games/min/core '
+            f'on {summary["workers"]} workers')
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Play two engine configurations against each other with an SPRT')
+    parser.add_argument('first', type=parse_config,
+                        help="configuration being tested, i.e. 'name=new,depth=3' (keys: name, depth, nodes, time, "
+                             "hash, weights, aspiration_window, delta_margin)")
+    parser.add_argument('second', type=parse_config, help='configuration it plays against')
+    parser.add_argument('--pgn', default='match.pgn', help='PGN file to append the games to')
+    parser.add_argument('--openings', default=None, help='FEN/EPD file of opening positions (default: start)')
+    parser.add_argument('--games', type=int, default=1000, help='most games to play')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--elo0', type=float, default=0.0, help='Elo difference of the null hypothesis')
+    parser.add_argument('--elo1', type=float, default=10.0, help='Elo difference of the alternative hypothesis')
+    parser.add_argument('--alpha', type=float, default=0.05, help='false positive rate')
+    parser.add_argument('--beta', type=float, default=0.05, help='false negative rate')
+    parser.add_argument('--summary', default=None, help='JSON file to write the summary to')
+    args = parser.parse_args()
+
+    summary = match(args.first, args.second, args.pgn, args.openings, args.games, args.workers, args.elo0,
+                    args.elo1, args.alpha, args.beta)
+    print(summary_text(summary), file=sys.stderr)
+    if args.summary:
+        with open(args.summary, 'w') as output:
+            json.dump(summary, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Move Ordering
+DS 3500 Final Project
+"""
+
+# Sort key tiers, every move in a tier sorts ahead of the whole tier below it
+HASH_MOVE = 1000000000
+CAPTURE = 100000000
+KILLER = 10000000
+# History scores are capped below the killer tier
+HISTORY_MAX = KILLER - 1
+
+PROMOTION_VALUE = 9
+
+
+class MoveOrderer:
+
+    def __init__(self, hash_move=True, mvv_lva=True, killers=True, history=True):
+        """ Orders moves between generation and search so alpha-beta finds cutoffs early
+        Each heuristic can be switched off to measure what it's worth.
+        Attributes:
+            use_hash_move (bool): try the transposition table's best move first
+            use_mvv_lva (bool): try captures next, most valuable victim first, then least valuable attacker
+            use_killers (bool): try the two quiet moves that last caused a cutoff at the same ply next
+            use_history (bool): sort the remaining quiet moves by how often they caused cutoffs
+            killers (list): two killer move slots per ply
+            history (dict): {(color, start, end): score}
+        """
+        self.use_hash_move = hash_move
+        self.use_mvv_lva = mvv_lva
+        self.use_killers = killers
+        self.use_history = history
+        self.killers = []
+        self.history = {}
+        self.root_ply = None
+
+    def __repr__(self):
+        enabled = [name for name, used in (('hash_move', self.use_hash_move), ('mvv_lva', self.use_mvv_lva),
+                                           ('killers', self.use_killers), ('history', self.use_history)) if used]
+        return f'MoveOrderer({", ".join(enabled) or "none"})'
+
+    def reset(self):
+        """ Forget every killer and history score, for a new game or an unrelated position """
+        self.killers = []
+        self.history = {}
+        self.root_ply = None
+
+    def new_search(self, root_ply=None):
+        """ Line the killers up with the new root and age the history so old cutoffs count for less
+        :param root_ply: plies played in the game before the search's root, killers found from an earlier root
+                         of the same game are kept for the same positions in the game (forgotten without it)
+        """
+        if root_ply is not None and self.root_ply is not None and root_ply >= self.root_ply:
+            self.killers = self.killers[root_ply - self.root_ply:]
+        else:
+            self.killers = []
+        self.root_ply = root_ply
+        self.history = {key: score // 2 for key, score in self.history.items() if score > 1}
+
+    def killer_moves(self, ply):
+        while len(self.killers) <= ply:
+            self.killers.append([None, None])
+        return self.killers[ply]
+
+    @staticmethod
+    def capture_value(board, move):
+        """ MVV-LVA value of a move, 0 for a quiet move (promotions count as capturing a queen) """
+        (start_row, start_col), (end_row, end_col) = move
+        attacker = board[start_row][start_col]
+        victim = board[end_row][end_col]
+        value = 0
+        if victim != '--':
+            value += victim.val * 10000
+        if attacker.name == 'Pawn' and end_row in (0, 7):
+            value += PROMOTION_VALUE * 10000
+        if value:
+            value -= attacker.val
+        return value
+
+    def order(self, moves, board, turn, ply, hash_move=None):
+        """ Sort moves best first
+        :param moves: list of (start, end) moves
+        :param board: 2d list of pieces the moves are played on
+        :param turn: side to move
+        :param ply: distance from the root
+        :param hash_move: best move stored in the transposition table for this position
+        :return: sorted list of moves
+        """
+        killers = self.killer_moves(ply) if self.use_killers else ()
+        history = self.history if self.use_history else {}
+
+        def key(move):
+            if self.use_hash_move and move == hash_move:
+                return HASH_MOVE
+            capture = MoveOrderer.capture_value(board, move)
+            if capture:
+                return CAPTURE + capture if self.use_mvv_lva else 0
+            if move in killers:
+                return KILLER + (1 if move == killers[0] else 0)
+            return history.get((turn, move[0], move[1]), 0)
+
+        return sorted(moves, key=key, reverse=True)
+
+    def cutoff(self, move, board, turn, depth, ply):
+        """ Record a move that caused a beta cutoff, quiet moves become killers and gain history """
+        if MoveOrderer.capture_value(board, move):
+            return
+        if self.use_killers:
+            killers = self.killer_moves(ply)
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        if self.use_history:
+            key = (turn, move[0], move[1])
+            self.history[key] = min(self.history.get(key, 0) + depth * depth, HISTORY_MAX)
+
+
+def compare(depth=4):
+    """ Print nodes to reach a fixed depth with each heuristic switched off in turn """
+    from chess import Chess
+
+    configurations = [MoveOrderer(False, False, False, False), MoveOrderer(),
+                      MoveOrderer(hash_move=False), MoveOrderer(mvv_lva=False),
+                      MoveOrderer(killers=False), MoveOrderer(history=False)]
+    for orderer in configurations:
+        game = Chess()
+        for move in (((6, 4), (4, 4)), ((1, 4), (3, 4)), ((7, 6), (5, 5)), ((0, 1), (2, 2))):
+            game.make_move(move[0][0], move[0][1], move[1][0], move[1][1])
+        game.engine.orderer = orderer
+        result = game.engine.search(depth)
+        print(f'{orderer!r:55} {result.nodes:8} nodes to depth {result.depth}')
+
+
+if __name__ == '__main__':
+    compare()
@@ -0,0 +1,202 @@
+"""
+Parallel Root Search
+DS 3500 Final Project
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from engine import SearchResult, INFINITY, MATE_BOUND, NULL_WINDOW
+from search_stats import SearchStats
+import copy
+import os
+import time
+
+# Positions to time the parallel search on, as moves played from the starting position
+BENCHMARK_SUITE = {
+    'start': [],
+    'open game': [((6, 4), (4, 4)), ((1, 4), (3, 4)), ((7, 6), (5, 5)), ((0, 1), (2, 2)), ((7, 5), (4, 2))],
+    'queen pawn': [((6, 3), (4, 3)), ((1, 3), (3, 3)), ((6, 2), (4, 2)), ((1, 4), (2, 4)), ((7, 1), (5, 2))],
+    'sicilian': [((6, 4), (4, 4)), ((1, 2), (3, 2)), ((7, 6), (5, 5)), ((1, 3), (2, 3)), ((6, 3), (4, 3)),
+                 ((3, 2), (4, 3))],
+}
+
+# Game kept by each worker process between tasks, so its transposition table stays warm
+_worker_game = None
+
+
+def _init_worker(hash_size, tablebases, weights, aspiration_window, delta_margin):
+    global _worker_game
+    from chess import Chess
+    _worker_game = Chess(hash_size=hash_size, tablebases=tablebases)
+    _worker_game.weights = weights
+    _worker_game.engine.aspiration_window = aspiration_window
+    _worker_game.engine.delta_margin = delta_margin
+
+
+def _search_root_move(board, turn, engine_color, move, depth, alpha, beta, history):
+    """ Worker task: play one root move and search the reply to depth - 1
+    :param alpha: lower bound of the root window
+    :param beta: upper bound of the root window
+    :param history: (halfmove clock, hashes of the positions since the last capture or pawn move) at the root
+    :return: (move, score for the side to move at the root, principal variation, nodes)
+    """
+    game = _worker_game
+    halfmove_clock, key_history = history
+    game.load_board(board, turn, halfmove_clock)
+    game.key_history = list(key_history)
+    game.engine_color = engine_color
+    (start_row, start_col), (end_row, end_col) = move
+    game.make_move(start_row, start_col, end_row, end_col, update_status=False)
+
+    if depth > 1:
+        result = game.engine.search(depth - 1, window=(-beta, -alpha))
+        score, pv, nodes = -result.score, [move] + result.pv, result.nodes
+    else:
+        game.engine.nodes = 0
+        game.engine.stopped = False
+        score, pv, nodes = -game.engine.quiescence(-beta, -alpha, 1), [move], game.engine.nodes
+    # Mates are one ply further away from the root than from the reply
+    if score >= MATE_BOUND:
+        score -= 1
+    elif score <= -MATE_BOUND:
+        score += 1
+    return move, score, pv, nodes
+
+
+class ParallelSearch:
+
+    def __init__(self, game, workers=None, hash_size=None):
+        """ Splits the root moves of a game's position across a pool of processes
+        The first root move is searched with a full window, then every other move is searched in parallel
+        with a null window at its score and only the moves that beat it are searched again with a full window.
+        Each window only depends on the previous round, so the result doesn't depend on timing.
+        With one worker the game's own engine searches instead, exactly as it would without this class.
+        Attributes:
+            game (obj): Chess game to search
+            workers (int): number of worker processes, defaults to the number of cores
+            hash_size (int): transposition table size of each worker in MB, the game's table size by default
+            stats (obj): SearchStats of the last search (only nodes and time when the pool searched)
+        """
+        self.game = game
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.hash_size = hash_size if hash_size is not None else game.transposition_table.size_mb
+        self.root_scores = {}
+        self.stats = SearchStats()
+        self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def search(self, depth):
+        """ Search the game's current position
+        :param depth: depth in plies
+        :return: SearchResult like Engine.search
+        """
+        if self.workers == 1:
+            result = self.game.engine.search(depth)
+            self.root_scores = dict(self.game.engine.root_scores)
+            self.stats = self.game.engine.stats
+            return result
+
+        if self.executor is None:
+            # Workers map the same tablebase files, so they share them through the page cache
+            tablebases = self.game.tablebases.directory if self.game.tablebases is not None else None
+            engine = self.game.engine
+            self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                                initargs=(self.hash_size, tablebases, self.game.weights,
+                                                          engine.aspiration_window, engine.delta_margin))
+
+        game = self.game
+        start_time = time.perf_counter()
+        moves = game.engine.legal_moves()
+        if not moves:
+            result = game.engine.search(depth)
+            self.stats = game.engine.stats
+            return result
+
+        # The engine's ordering (hash move from the last search first) decides which move goes first
+        moves = game.engine.orderer.order(moves, game.chess_board.board, game.turn, 0, self.hash_move())
+        # Send a copy of the board, not the game with its transposition table
+        board = copy.deepcopy(game.chess_board.board)
+        # Only positions since the last irreversible move can repeat
+        history = (game.halfmove_clock, game.key_history[max(len(game.key_history) - game.halfmove_clock, 0):])
+
+        def run(batch, alpha, beta):
+            """ Search a batch of root moves in the pool with the same window, in root move order """
+            count = len(batch)
+            return list(self.executor.map(_search_root_move, [board] * count, [game.turn] * count,
+                                          [game.engine_color] * count, batch, [depth] * count,
+                                          [alpha] * count, [beta] * count, [history] * count))
+
+        results = run(moves[:1], -INFINITY, INFINITY)
+        best_score = results[0][1]
+        scouted = run(moves[1:], best_score, best_score + NULL_WINDOW)
+        better = [move for move, score, pv, nodes in scouted if score > best_score]
+        researched = {result[0]: result for result in run(better, best_score, INFINITY)}
+        results += [researched.get(result[0], result) for result in scouted]
+
+        best = None
+        total_nodes = sum(result[3] for result in scouted) + sum(result[3] for result in researched.values()) \
+            + results[0][3]
+        self.root_scores = {}
+        # Results are in root move order, so ties always go to the same move
+        for move, score, pv, nodes in results:
+            self.root_scores[move] = score
+            if best is None or score > best.score:
+                best = SearchResult(move, score, pv, depth, 0)
+
+        self.stats = SearchStats(depth, total_nodes, elapsed=time.perf_counter() - start_time)
+        return best._replace(nodes=total_nodes)
+
+    def hash_move(self):
+        """ Best move the game's transposition table has for the position, if any """
+        entry = self.game.transposition_table.probe(self.game.hash)
+        return entry[3] if entry is not None else None
+
+
+def benchmark(depth=3, max_workers=None):
+    """ Time the search of every suite position with 1, 2, 4, ... workers and print the speedup """
+    from chess import Chess
+
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_workers:
+        counts.append(max_workers)
+
+    baseline = None
+    for workers in counts:
+        elapsed = 0.0
+        nodes = 0
+        with ParallelSearch(Chess(), workers) as searcher:
+            # Start the worker processes before the clock does
+            searcher.search(1)
+            for name, moves in BENCHMARK_SUITE.items():
+                game = Chess()
+                for (start_row, start_col), (end_row, end_col) in moves:
+                    game.make_move(start_row, start_col, end_row, end_col)
+                searcher.game = game
+                start = time.perf_counter()
+                result = searcher.search(depth)
+                elapsed += time.perf_counter() - start
+                nodes += result.nodes
+        baseline = baseline or elapsed
+        print(f'{workers:3} workers: {elapsed:8.2f}s  {nodes / elapsed:9.0f} nodes/s  speedup {baseline / elapsed:.2f}x')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Time the parallel root search on a fixed set of positions')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=None, help='largest worker count to try (default: all cores)')
+    args = parser.parse_args()
+    benchmark(args.depth, args.workers)
@@ -0,0 +1,78 @@
+"""
+Pawn Structure Evaluation
+DS 3500 Final Project
+"""
+
+from collections import namedtuple
+
+# Pawn structure of one color, each field counts pawns except half_open_files (a file bitmask)
+PawnCounts = namedtuple('PawnCounts', ['passed', 'doubled', 'isolated', 'backward', 'half_open_files'])
+# Both colors' counts plus the bitmask of files with no pawns at all
+PawnStructure = namedtuple('PawnStructure', ['white', 'black', 'open_files'])
+
+
+def file_masks(pawn_locs):
+    """ Turn pawn locations into one row bitmask per file (bit r set if there's a pawn on row r) """
+    masks = [0] * 8
+    for row, file in pawn_locs:
+        masks[file] |= 1 << row
+    return masks
+
+
+def count_structure(own, enemy, white):
+    """ Count one color's passed, doubled, isolated and backward pawns from the file masks
+    :param own: row bitmasks per file of this color's pawns
+    :param enemy: row bitmasks per file of the other color's pawns
+    :param white: whether this color is White (White pawns move towards row 0)
+    :return: PawnCounts
+    """
+    passed = doubled = isolated = backward = 0
+    half_open = 0
+    for file in range(8):
+        rows = own[file]
+        if not rows:
+            if enemy[file]:
+                half_open |= 1 << file
+            continue
+
+        count = bin(rows).count('1')
+        doubled += count - 1
+        neighbours = (own[file - 1] if file > 0 else 0) | (own[file + 1] if file < 7 else 0)
+        enemy_neighbours = (enemy[file - 1] if file > 0 else 0) | (enemy[file + 1] if file < 7 else 0)
+        if not neighbours:
+            isolated += count
+
+        for row in range(8):
+            if not rows & (1 << row):
+                continue
+            if white:
+                ahead = (1 << row) - 1
+                # Squares the pawn would have to pass, and the rows where enemy pawns guard its stop square
+                behind_or_level = 0xFF & ~ahead
+                stop_guard = 1 << (row - 2) if row >= 2 else 0
+            else:
+                ahead = 0xFF & ~((1 << (row + 1)) - 1)
+                behind_or_level = (1 << (row + 1)) - 1
+                stop_guard = 1 << (row + 2) if row <= 5 else 0
+            if not (enemy[file] | enemy_neighbours) & ahead:
+                passed += 1
+            elif neighbours and not neighbours & behind_or_level and enemy_neighbours & stop_guard:
+                # No friendly pawn can come up to support it and an enemy pawn stops it advancing
+                backward += 1
+
+    return PawnCounts(passed, doubled, isolated, backward, half_open)
+
+
+def pawn_structure(white_pawn_locs, black_pawn_locs):
+    """ Evaluate the pawn structure of both colors
+    :param white_pawn_locs: list of (row, file) of White's pawns
+    :param black_pawn_locs: list of (row, file) of Black's pawns
+    :return: PawnStructure
+    """
+    white = file_masks(white_pawn_locs)
+    black = file_masks(black_pawn_locs)
+    open_files = 0
+    for file in range(8):
+        if not white[file] and not black[file]:
+            open_files |= 1 << file
+    return PawnStructure(count_structure(white, black, True), count_structure(black, white, False), open_files)
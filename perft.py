@@ -0,0 +1,118 @@
+"""
+Perft Move Generation Checker
+DS 3500 Final Project
+
+Counts the leaf nodes of the legal move tree and compares them against known counts.
+This game has no castling, no en passant and always promotes to a queen, so a position
+only gets the depths where none of those moves can appear yet.
+"""
+
+from chess import Chess, START_FEN
+import sys
+import time
+
+# Position name: (FEN, {depth: node count})
+SUITE = {
+    'startpos': (START_FEN, {1: 20, 2: 400, 3: 8902, 4: 197281}),
+    'position 3': ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', {1: 14, 2: 191}),
+    'position 6': ('r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+                   {1: 46, 2: 2079, 3: 89890}),
+}
+
+
+def perft(game, depth):
+    """ Count the leaf nodes of the legal move tree below the game's position
+    :param game: Chess game, left unchanged
+    :param depth: depth in plies
+    :return: number of leaf nodes
+    """
+    if depth == 0:
+        return 1
+    valid_moves = game.get_valid_moves()
+    # Bulk count the last ply instead of playing every move
+    if depth == 1:
+        return sum(len(ends) for ends in valid_moves.values())
+
+    nodes = 0
+    for start, ends in valid_moves.items():
+        for end in ends:
+            undo = game.make_move(start[0], start[1], end[0], end[1], update_status=False)
+            nodes += perft(game, depth - 1)
+            game.unmake_move(undo)
+    return nodes
+
+
+def divide(game, depth):
+    """ Perft split by root move, to find which move's subtree is off
+    :return: {move in coordinate notation (i.e. 'e2e4'): leaf nodes}
+    """
+    counts = {}
+    for start, ends in game.get_valid_moves().items():
+        for end in ends:
+            undo = game.make_move(start[0], start[1], end[0], end[1], update_status=False)
+            counts[Chess.uncoordinate(start) + Chess.uncoordinate(end)] = perft(game, depth - 1)
+            game.unmake_move(undo)
+    return counts
+
+
+def setup(fen):
+    """ Game set up from a FEN """
+    game = Chess()
+    game.load_fen(fen)
+    return game
+
+
+def run_suite(max_depth=None):
+    """ Run every suite position to its known depths (or max_depth), printing nodes per second
+    :return: list of (position name, depth, expected, counted) for every mismatch
+    """
+    mismatches = []
+    total_nodes = 0
+    total_time = 0.0
+    for name, (fen, counts) in SUITE.items():
+        game = setup(fen)
+        for depth, expected in sorted(counts.items()):
+            if max_depth is not None and depth > max_depth:
+                break
+            start = time.perf_counter()
+            nodes = perft(game, depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            status = 'ok' if nodes == expected else f'MISMATCH, expected {expected}'
+            print(f'{name:12} depth {depth}: {nodes:10} nodes {elapsed:8.2f}s {nodes / max(elapsed, 1e-9):10.0f} nps'
+                  f'  {status}')
+            if nodes != expected:
+                mismatches.append((name, depth, expected, nodes))
+
+    print(f'total: {total_nodes} nodes in {total_time:.2f}s, {total_nodes / max(total_time, 1e-9):.0f} nps')
+    return mismatches
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Check and time the move generator against known perft counts')
+    parser.add_argument('--depth', type=int, default=None, help='deepest depth to run (default: every known depth)')
+    parser.add_argument('--divide', type=int, default=None, metavar='DEPTH',
+                        help='print the perft of every root move instead')
+    parser.add_argument('--fen', default=START_FEN, help='position to divide (default: the starting position)')
+    args = parser.parse_args()
+
+    if args.divide is not None:
+        game = setup(args.fen)
+        counts = divide(game, args.divide)
+        for move, nodes in sorted(counts.items()):
+            print(f'{move}: {nodes}')
+        print(f'total: {sum(counts.values())}')
+        return
+
+    mismatches = run_suite(args.depth)
+    if mismatches:
+        for name, depth, expected, nodes in mismatches:
+            print(f'PERFT MISMATCH: {name} depth {depth} expected {expected} got {nodes}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -110,6 +110,54 @@ class Piece:
 
         return move_list
 
+    def slide_captures(self, board, directions):
+        """
+        Compute captures along sliding directions, skipping the empty squares on the way
+        Args:
+            board: the current board/piece locations
+            directions: (row, column) steps to slide along
+        Returns:
+            move_list: list of capturing moves
+        """
+        x = self.pos[0]
+        y = self.pos[1]
+
+        move_list = []
+        for direction in directions:
+            end_x = x + direction[0]
+            end_y = y + direction[1]
+            while 0 <= end_x < 8 and 0 <= end_y < 8:
+                if board[end_x][end_y] != '--':
+                    if board[end_x][end_y].color != self.color:
+                        move_list.append((self.pos, (end_x, end_y)))
+                    break
+                end_x += direction[0]
+                end_y += direction[1]
+
+        return move_list
+
+    def step_captures(self, board, directions):
+        """
+        Compute captures a single step away
+        Args:
+            board: the current board/piece locations
+            directions: (row, column) steps
+        Returns:
+            move_list: list of capturing moves
+        """
+        x = self.pos[0]
+        y = self.pos[1]
+
+        move_list = []
+        for direction in directions:
+            end_x = x + direction[0]
+            end_y = y + direction[1]
+            if 0 <= end_x < 8 and 0 <= end_y < 8:
+                if board[end_x][end_y] != '--' and board[end_x][end_y].color != self.color:
+                    move_list.append((self.pos, (end_x, end_y)))
+
+        return move_list
+
 
 class King(Piece):
     """
@@ -153,6 +201,9 @@ class King(Piece):
 
         return self.moves
 
+    def capture_moves(self, board):
+        return self.step_captures(board, [(0, -1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (1, 1), (1, 0), (1, -1)])
+
     def castle(self, board, start, to, direction):
         pass
 
@@ -183,6 +234,9 @@ class Queen(Piece):
         self.moves = self.vert_moves(board) + self.diag_moves(board)
         return self.moves
 
+    def capture_moves(self, board):
+        return self.slide_captures(board, ((-1, 0), (0, -1), (1, 0), (0, 1), (1, 1), (-1, 1), (1, -1), (-1, -1)))
+
 
 class Rook(Piece):
     """
@@ -207,6 +261,9 @@ class Rook(Piece):
         self.moves = self.vert_moves(board)
         return self.moves
 
+    def capture_moves(self, board):
+        return self.slide_captures(board, ((-1, 0), (0, -1), (1, 0), (0, 1)))
+
 
 class Bishop(Piece):
     """
@@ -239,6 +296,9 @@ class Bishop(Piece):
         self.moves = self.diag_moves(board)
         return self.moves
 
+    def capture_moves(self, board):
+        return self.slide_captures(board, [(1, 1), (-1, 1), (1, -1), (-1, -1)])
+
 
 class Knight(Piece):
     """
@@ -288,6 +348,9 @@ class Knight(Piece):
         self.moves = move_list
         return self.moves
 
+    def capture_moves(self, board):
+        return self.step_captures(board, [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (2, 1), (2, -1), (1, -2), (1, 2)])
+
 
 class Pawn(Piece):
     """
@@ -349,4 +412,25 @@ class Pawn(Piece):
 
         self.moves = move_list
 
-        return self.moves
\ No newline at end of file
+        return self.moves
+
+    def capture_moves(self, board):
+        """
+        Returns a list of the pawn's captures and promotions, the only pawn moves that change material
+        """
+        x = self.pos[0]
+        y = self.pos[1]
+
+        if self.color == 'White':
+            forward = -1
+            last_row = 0
+        else:
+            forward = 1
+            last_row = 7
+
+        move_list = self.step_captures(board, [(forward, -1), (forward, 1)])
+        # Pushing onto the last row promotes
+        if x + forward == last_row and board[x + forward][y] == '--':
+            move_list.append((self.pos, (x + forward, y)))
+
+        return move_list
@@ -0,0 +1,79 @@
+"""
+Pondering
+DS 3500 Final Project
+"""
+
+from chess import Chess
+import copy
+import threading
+
+
+class Ponderer:
+
+    def __init__(self, game):
+        """ Thinks on the player's time: searches the position after the reply the engine expects in the background
+        The search runs on a copy of the game that shares its transposition table, pawn table and move ordering
+        tables, so everything it finds is still there for the engine's own search when the guess is wrong.
+        Attributes:
+            game (obj): Chess game being played
+            ponder_game (obj): copy of the game with the expected reply played, searched by the background thread
+            ponder_key (int): hash of the position after the expected reply, taken before the search moves the
+                              copy's own hash around
+            thread (obj): background search thread, None when not pondering
+            result (obj): SearchResult of the background search once it completes
+        """
+        self.game = game
+        self.ponder_game = None
+        self.ponder_key = None
+        self.thread = None
+        self.result = None
+
+    def start(self):
+        """ Start searching the expected reply to the engine's last move, if it has one """
+        game = self.game
+        if self.thread is not None or game.predicted_move is None:
+            return
+
+        ponder_game = Chess(depth=game.depth, hash_size=1)
+        ponder_game.transposition_table = ponder_game.engine.transposition_table = game.transposition_table
+        ponder_game.pawn_table = game.pawn_table
+        ponder_game.engine.orderer = game.engine.orderer
+        ponder_game.tablebases = game.tablebases
+        ponder_game.weights = game.weights
+        ponder_game.load_board(copy.deepcopy(game.chess_board.board), game.turn, game.halfmove_clock, game.ply)
+        ponder_game.key_history = list(game.key_history)
+        ponder_game.engine_color = game.engine_color
+        (start_row, start_col), (end_row, end_col) = game.predicted_move
+        ponder_game.make_move(start_row, start_col, end_row, end_col, update_status=False)
+
+        self.ponder_game = ponder_game
+        self.ponder_key = ponder_game.hash
+        self.result = None
+        self.thread = threading.Thread(target=self.search, daemon=True)
+        self.thread.start()
+
+    def search(self):
+        engine = self.ponder_game.engine
+        result = engine.search(self.ponder_game.depth)
+        if not engine.stopped:
+            self.result = result
+
+    def finish(self):
+        """ Stop pondering now that the player has moved
+        If the player made the expected move the background search carries on to the full depth instead of
+        starting over, otherwise it's stopped.
+        :return: SearchResult for the game's current position, or None if the player made another move
+        """
+        if self.thread is None:
+            return None
+        hit = self.ponder_key == self.game.hash
+        if not hit:
+            self.ponder_game.engine.stop()
+        self.thread.join()
+        self.thread = None
+
+        if not hit or self.result is None:
+            return None
+        self.game.move_evaluations = dict(self.ponder_game.engine.root_scores)
+        self.game.search_stats = self.ponder_game.engine.stats
+        return self.result
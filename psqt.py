@@ -0,0 +1,94 @@
+"""
+Piece-Square Tables
+DS 3500 Final Project
+"""
+
+# Tables are laid out like chessboard.board from White's side (row 0 is the 8th rank), in centipawns.
+# Black pieces read the table flipped top to bottom.
+MIDGAME_CENTIPAWNS = {
+    'Pawn': [[0, 0, 0, 0, 0, 0, 0, 0],
+             [50, 50, 50, 50, 50, 50, 50, 50],
+             [10, 10, 20, 30, 30, 20, 10, 10],
+             [5, 5, 10, 25, 25, 10, 5, 5],
+             [0, 0, 0, 20, 20, 0, 0, 0],
+             [5, -5, -10, 0, 0, -10, -5, 5],
+             [5, 10, 10, -20, -20, 10, 10, 5],
+             [0, 0, 0, 0, 0, 0, 0, 0]],
+    'Knight': [[-50, -40, -30, -30, -30, -30, -40, -50],
+               [-40, -20, 0, 0, 0, 0, -20, -40],
+               [-30, 0, 10, 15, 15, 10, 0, -30],
+               [-30, 5, 15, 20, 20, 15, 5, -30],
+               [-30, 0, 15, 20, 20, 15, 0, -30],
+               [-30, 5, 10, 15, 15, 10, 5, -30],
+               [-40, -20, 0, 5, 5, 0, -20, -40],
+               [-50, -40, -30, -30, -30, -30, -40, -50]],
+    'Bishop': [[-20, -10, -10, -10, -10, -10, -10, -20],
+               [-10, 0, 0, 0, 0, 0, 0, -10],
+               [-10, 0, 5, 10, 10, 5, 0, -10],
+               [-10, 5, 5, 10, 10, 5, 5, -10],
+               [-10, 0, 10, 10, 10, 10, 0, -10],
+               [-10, 10, 10, 10, 10, 10, 10, -10],
+               [-10, 5, 0, 0, 0, 0, 5, -10],
+               [-20, -10, -10, -10, -10, -10, -10, -20]],
+    'Rook': [[0, 0, 0, 0, 0, 0, 0, 0],
+             [5, 10, 10, 10, 10, 10, 10, 5],
+             [-5, 0, 0, 0, 0, 0, 0, -5],
+             [-5, 0, 0, 0, 0, 0, 0, -5],
+             [-5, 0, 0, 0, 0, 0, 0, -5],
+             [-5, 0, 0, 0, 0, 0, 0, -5],
+             [-5, 0, 0, 0, 0, 0, 0, -5],
+             [0, 0, 0, 5, 5, 0, 0, 0]],
+    'Queen': [[-20, -10, -10, -5, -5, -10, -10, -20],
+              [-10, 0, 0, 0, 0, 0, 0, -10],
+              [-10, 0, 5, 5, 5, 5, 0, -10],
+              [-5, 0, 5, 5, 5, 5, 0, -5],
+              [0, 0, 5, 5, 5, 5, 0, -5],
+              [-10, 5, 5, 5, 5, 5, 0, -10],
+              [-10, 0, 5, 0, 0, 0, 0, -10],
+              [-20, -10, -10, -5, -5, -10, -10, -20]],
+    'King': [[-30, -40, -40, -50, -50, -40, -40, -30],
+             [-30, -40, -40, -50, -50, -40, -40, -30],
+             [-30, -40, -40, -50, -50, -40, -40, -30],
+             [-30, -40, -40, -50, -50, -40, -40, -30],
+             [-20, -30, -30, -40, -40, -30, -30, -20],
+             [-10, -20, -20, -20, -20, -20, -20, -10],
+             [20, 20, 0, 0, 0, 0, 20, 20],
+             [20, 30, 10, 0, 0, 10, 30, 20]],
+}
+
+# In the end game pawns are worth more the closer they get to promoting and the king belongs in the center
+ENDGAME_CENTIPAWNS = dict(MIDGAME_CENTIPAWNS)
+ENDGAME_CENTIPAWNS['Pawn'] = [[0, 0, 0, 0, 0, 0, 0, 0],
+                              [80, 80, 80, 80, 80, 80, 80, 80],
+                              [50, 50, 50, 50, 50, 50, 50, 50],
+                              [30, 30, 30, 30, 30, 30, 30, 30],
+                              [20, 20, 20, 20, 20, 20, 20, 20],
+                              [10, 10, 10, 10, 10, 10, 10, 10],
+                              [10, 10, 10, 10, 10, 10, 10, 10],
+                              [0, 0, 0, 0, 0, 0, 0, 0]]
+ENDGAME_CENTIPAWNS['King'] = [[-50, -40, -30, -20, -20, -30, -40, -50],
+                              [-30, -20, -10, 0, 0, -10, -20, -30],
+                              [-30, -10, 20, 30, 30, 20, -10, -30],
+                              [-30, -10, 30, 40, 40, 30, -10, -30],
+                              [-30, -10, 30, 40, 40, 30, -10, -30],
+                              [-30, -10, 20, 30, 30, 20, -10, -30],
+                              [-30, -30, 0, 0, 0, 0, -30, -30],
+                              [-50, -30, -30, -30, -30, -30, -30, -50]]
+
+
+def _in_pawns(tables):
+    """ Convert tables to pawns (the unit of Piece.val) and add the flipped tables for Black """
+    converted = {}
+    for name, table in tables.items():
+        white = [[value / 100 for value in row] for row in table]
+        converted[('White', name)] = white
+        converted[('Black', name)] = white[::-1]
+    return converted
+
+
+MIDGAME = _in_pawns(MIDGAME_CENTIPAWNS)
+ENDGAME = _in_pawns(ENDGAME_CENTIPAWNS)
+
+# How much each piece counts towards the game phase, 24 with all of them on the board
+PHASE_WEIGHTS = {'Pawn': 0, 'Knight': 1, 'Bishop': 1, 'Rook': 2, 'Queen': 4, 'King': 0}
+MAX_PHASE = 24
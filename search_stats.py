@@ -0,0 +1,95 @@
+"""
+Search Statistics
+DS 3500 Final Project
+"""
+
+import time
+
+# Stages the search can time when timers are switched on
+STAGES = ('movegen', 'legality', 'eval')
+
+
+class SearchStats:
+
+    def __init__(self, depth=0, nodes=0, qnodes=0, seldepth=0, elapsed=0.0, cutoffs=0, first_move_cutoffs=0,
+                 tt_hits=0, tt_misses=0, iteration_nodes=None, timers=None, tb_hits=0):
+        """ Counters of one search (or of the search so far, when streamed after each iteration)
+        Attributes:
+            depth (int): last completed iteration
+            nodes (int): positions visited, quiescence included
+            qnodes (int): positions visited by the quiescence search
+            seldepth (int): deepest ply reached, quiescence included
+            elapsed (float): seconds spent searching
+            cutoffs (int): beta cutoffs in the main search
+            first_move_cutoffs (int): beta cutoffs caused by the first move searched
+            tt_hits (int): transposition table probes that found the position
+            tt_misses (int): transposition table probes that didn't
+            iteration_nodes (list): nodes searched by each iteration, in order
+            timers (dict): {stage: seconds} for movegen, legality and eval, empty unless timers were switched on
+            tb_hits (int): positions scored by the endgame tablebases instead of searched
+        """
+        self.depth = depth
+        self.nodes = nodes
+        self.qnodes = qnodes
+        self.seldepth = seldepth
+        self.elapsed = elapsed
+        self.cutoffs = cutoffs
+        self.first_move_cutoffs = first_move_cutoffs
+        self.tt_hits = tt_hits
+        self.tt_misses = tt_misses
+        self.iteration_nodes = iteration_nodes if iteration_nodes is not None else []
+        self.timers = timers if timers is not None else {}
+        self.tb_hits = tb_hits
+
+    @property
+    def nps(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def ebf(self):
+        """ Effective branching factor: how many times more nodes the last iteration took than the one before """
+        if len(self.iteration_nodes) >= 2 and self.iteration_nodes[-2]:
+            return self.iteration_nodes[-1] / self.iteration_nodes[-2]
+        if self.depth:
+            return self.nodes ** (1 / self.depth)
+        return 0.0
+
+    @property
+    def first_move_cutoff_rate(self):
+        """ Share of cutoffs found by the first move, close to 1 when move ordering works """
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    @property
+    def tt_hit_rate(self):
+        probes = self.tt_hits + self.tt_misses
+        return self.tt_hits / probes if probes else 0.0
+
+    def as_dict(self):
+        return {'depth': self.depth, 'seldepth': self.seldepth, 'nodes': self.nodes, 'qnodes': self.qnodes,
+                'elapsed': self.elapsed, 'nps': self.nps, 'ebf': self.ebf,
+                'first_move_cutoff_rate': self.first_move_cutoff_rate, 'tt_hit_rate': self.tt_hit_rate,
+                'tb_hits': self.tb_hits, 'timers': dict(self.timers)}
+
+    def __str__(self):
+        line = f'depth {self.depth}/{self.seldepth} nodes {self.nodes} ({self.qnodes} q) {self.elapsed:.2f}s ' \
+               f'{self.nps:.0f} nps ebf {self.ebf:.2f} first move cutoffs {self.first_move_cutoff_rate:.0%} ' \
+               f'tt hits {self.tt_hit_rate:.0%}'
+        if self.tb_hits:
+            line += f' tb hits {self.tb_hits}'
+        if self.timers:
+            line += ' ' + ' '.join(f'{stage} {self.timers[stage]:.2f}s' for stage in STAGES if stage in self.timers)
+        return line
+
+
+class StageTimers:
+    """ Cumulative perf_counter time per search stage """
+
+    def __init__(self):
+        self.totals = dict.fromkeys(STAGES, 0.0)
+
+    def time(self, stage, function, *args):
+        """ Call function(*args) and add its running time to stage """
+        start = time.perf_counter()
+        result = function(*args)
+        self.totals[stage] += time.perf_counter() - start
+        return result
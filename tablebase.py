@@ -0,0 +1,157 @@
+"""
+Endgame Tablebase Probing
+DS 3500 Final Project
+
+Looks positions up in the tables written by tablebase_gen.py. The files are memory-mapped read only,
+so nothing is loaded up front and every process probing the same files shares one copy in the page cache.
+"""
+
+import mmap
+import os
+import struct
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebases')
+MAGIC = b'PYTB'
+# magic, bits per entry, number of pieces, reserved, number of entries
+HEADER = struct.Struct('<4sBBHI')
+# Order of the pieces in an ending's name and in its index
+PIECE_ORDER = 'QRBNP'
+LETTERS = {'Queen': 'Q', 'Rook': 'R', 'Bishop': 'B', 'Knight': 'N', 'Pawn': 'P'}
+# Tables only store the strong king on the a-d files, positions with it on e-h are mirrored
+HALF_BOARD = [square for square in range(64) if square % 8 < 4]
+HALF_INDEX = {square: index for index, square in enumerate(HALF_BOARD)}
+# Endings nobody can win, known without a table
+TRIVIAL_DRAWS = {'KK', 'KBK', 'KNK'}
+
+WIN, DRAW, LOSS = 1, 0, -1
+
+
+class TableFile:
+
+    def __init__(self, path):
+        """ One bit-packed table file mapped into memory
+        Attributes:
+            bits (int): bits per entry
+            entries (int): number of entries
+        """
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.bits, _, _, self.entries = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a tablebase file')
+        self.mask = (1 << self.bits) - 1
+        self.span = (self.bits + 14) // 8
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def value(self, index):
+        position = index * self.bits
+        start = HEADER.size + (position >> 3)
+        return (int.from_bytes(self.data[start:start + self.span], 'little') >> (position & 7)) & self.mask
+
+
+class Tablebases:
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        """ Every ending found in a directory of tablebase files, opened the first time it's probed
+        Only endings of a king and pieces against a lone king are covered (see tablebase_gen.py).
+        Attributes:
+            directory (str): where the .wdl and .dtm files are
+            endings (set): names of the endings with both files, i.e. {'KQK', 'KBNK'}
+            max_pieces (int): most pieces (kings included) of any ending with a table
+        """
+        self.directory = directory
+        names = os.listdir(directory) if os.path.isdir(directory) else []
+        self.endings = {name[:-4] for name in names if name.endswith('.wdl') and name[:-4] + '.dtm' in names}
+        self.max_pieces = max([len(name) for name in self.endings], default=0)
+        self.files = {}
+
+    def __len__(self):
+        return len(self.endings)
+
+    def close(self):
+        for table in self.files.values():
+            table.close()
+        self.files = {}
+
+    def table(self, name, extension):
+        key = (name, extension)
+        if key not in self.files:
+            self.files[key] = TableFile(os.path.join(self.directory, f'{name}.{extension}'))
+        return self.files[key]
+
+    @staticmethod
+    def locate(board, turn):
+        """ Name and table index of a position
+        :param board: 2d list of pieces
+        :param turn: side to move
+        :return: (name, index, whether the strong side is to move), (name, None, None) for a trivially drawn
+                 ending, or None when it isn't a king and pieces against a lone king
+        """
+        kings = {}
+        pieces = {'White': [], 'Black': []}
+        for row in range(8):
+            for column in range(8):
+                piece = board[row][column]
+                if piece == '--':
+                    continue
+                if piece.name == 'King':
+                    kings[piece.color] = (row, column)
+                else:
+                    pieces[piece.color].append((LETTERS[piece.name], row, column))
+
+        if pieces['White'] and pieces['Black']:
+            return None
+        strong = 'Black' if pieces['Black'] else 'White'
+        weak = 'White' if strong == 'Black' else 'Black'
+        own = sorted(pieces[strong], key=lambda piece: PIECE_ORDER.index(piece[0]))
+        name = 'K' + ''.join(letter for letter, row, column in own) + 'K'
+        if name in TRIVIAL_DRAWS:
+            return name, None, None
+
+        # Tables have the strong side as White, flip the board when it's Black
+        squares = [kings[strong], kings[weak]] + [(row, column) for letter, row, column in own]
+        if strong == 'Black':
+            squares = [(7 - row, column) for row, column in squares]
+        if squares[0][1] > 3:
+            squares = [(row, 7 - column) for row, column in squares]
+
+        strong_to_move = turn == strong
+        index = (0 if strong_to_move else 1) * 32 + HALF_INDEX[squares[0][0] * 8 + squares[0][1]]
+        for row, column in squares[1:]:
+            index = index * 64 + row * 8 + column
+        return name, index, strong_to_move
+
+    def probe_wdl(self, board, turn):
+        """ WIN, DRAW or LOSS for the side to move, None if the position isn't covered """
+        located = Tablebases.locate(board, turn)
+        if located is None:
+            return None
+        name, index, strong_to_move = located
+        if index is None:
+            return DRAW
+        if name not in self.endings:
+            return None
+        if not self.table(name, 'wdl').value(index):
+            return DRAW
+        return WIN if strong_to_move else LOSS
+
+    def probe_dtm(self, board, turn):
+        """ Result and distance to mate of a position
+        :return: (WIN, DRAW or LOSS for the side to move, plies to mate or None if drawn),
+                 None if the position isn't covered
+        """
+        located = Tablebases.locate(board, turn)
+        if located is None:
+            return None
+        name, index, strong_to_move = located
+        if index is None:
+            return DRAW, None
+        if name not in self.endings:
+            return None
+        value = self.table(name, 'dtm').value(index)
+        if not value:
+            return DRAW, None
+        return (WIN if strong_to_move else LOSS), value - 1
@@ -0,0 +1,282 @@
+"""
+Endgame Tablebase Generator
+DS 3500 Final Project
+
+Retrograde analysis of endings where one side has a king and a few pieces and the other a lone king
+(KQK, KRK, KPK, KBNK, ...). Every position is solved at once with NumPy arrays indexed by the squares
+of the pieces: mates are found first, then the positions one ply further from mate, and so on until
+nothing changes. Endings reached by a capture or a promotion are solved first and looked up.
+
+The results are written as two bit-packed files per ending that tablebase.py reads with mmap:
+NAME.wdl (1 bit per position, set when the strong side wins) and NAME.dtm (plies to mate + 1, 0 if drawn).
+"""
+
+from tablebase import HEADER, MAGIC, PIECE_ORDER, HALF_BOARD, DEFAULT_DIRECTORY
+import numpy as np
+import os
+import time
+
+SQUARES = np.arange(64)
+ROWS, COLUMNS = SQUARES // 8, SQUARES % 8
+
+KING_STEPS = ((0, -1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (1, 1), (1, 0), (1, -1))
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (2, 1), (2, -1), (1, -2), (1, 2))
+STRAIGHT_STEPS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+DIAGONAL_STEPS = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+SLIDES = {'Q': STRAIGHT_STEPS + DIAGONAL_STEPS, 'R': STRAIGHT_STEPS, 'B': DIAGONAL_STEPS}
+
+# Chebyshev distance between two squares, kings must stay more than 1 apart
+DISTANCE = np.maximum(abs(ROWS[:, None] - ROWS[None, :]), abs(COLUMNS[:, None] - COLUMNS[None, :]))
+UNSOLVED = -1
+
+
+def step(d_row, d_column, distance=1):
+    """ Square distance steps of (d_row, d_column) away from every square, -1 past the edge """
+    rows = ROWS + d_row * distance
+    columns = COLUMNS + d_column * distance
+    return np.where((rows >= 0) & (rows < 8) & (columns >= 0) & (columns < 8), rows * 8 + columns, -1)
+
+
+def canonical(pieces):
+    """ Pieces sorted the way ending names (and the axes of their tables) are """
+    return ''.join(sorted(pieces, key=PIECE_ORDER.index))
+
+
+class Ending:
+
+    def __init__(self, pieces, solved):
+        """ Solves K + pieces vs K with the strong side as White
+        Positions are arrays over (strong king, weak king, piece 1, piece 2, ...) squares, one for each side to move.
+        Attributes:
+            pieces (str): strong side's pieces besides the king, i.e. 'BN'
+            name (str): i.e. 'KBNK'
+            strong_dtm (array): plies to mate with the strong side to move, UNSOLVED if not won (or illegal)
+            weak_dtm (array): plies to mate with the weak side to move
+            strong_legal (array): legal positions with the strong side to move
+            weak_legal (array): legal positions with the weak side to move
+        """
+        self.pieces = pieces
+        self.name = f'K{pieces}K'
+        self.ndim = 2 + len(pieces)
+        self.shape = (64,) * self.ndim
+        # Endings this one turns into, solved first
+        self.captures = [solve(pieces[:index] + pieces[index + 1:], solved) for index in range(len(pieces))]
+        self.promotions = {index: solve(canonical(pieces[:index] + 'Q' + pieces[index + 1:]), solved)
+                           for index, piece in enumerate(pieces) if piece == 'P'}
+        self.solve()
+
+    def grid(self, axis):
+        """ Square of the piece on axis, shaped to broadcast along that axis """
+        shape = [1] * self.ndim
+        shape[axis] = 64
+        return SQUARES.reshape(shape)
+
+    def occupied(self, squares, skip):
+        """ Whether squares (broadcast against the grid) hold any piece but the one on axis skip """
+        occupied = np.zeros((1,) * self.ndim, dtype=bool)
+        for axis in range(self.ndim):
+            if axis != skip:
+                occupied = occupied | (squares == self.grid(axis))
+        return occupied
+
+    def axes_of(self, ending, removed=None, replaced=None):
+        """ Reorder another ending's arrays into this ending's axes
+        :param removed: index of the piece this ending has and the other doesn't (its axis is added with size 1)
+        :param replaced: index of the pawn that became the other ending's queen
+        :return: function that reorders an array of the other ending
+        """
+        remaining = list(ending.pieces)
+        order = [0, 1]
+        for index, piece in enumerate(self.pieces):
+            if index == removed:
+                continue
+            if index == replaced:
+                piece = 'Q'
+            position = remaining.index(piece)
+            # The same piece can appear twice, take the first one not used yet
+            while 2 + position in order:
+                position = remaining.index(piece, position + 1)
+            order.append(2 + position)
+
+        def reorder(array):
+            array = np.transpose(array, order)
+            if removed is not None:
+                array = np.expand_dims(array, 2 + removed)
+            return array
+        return reorder
+
+    def strong_moves(self):
+        """ Every move of the strong side as (axis, destination squares, valid mask, promoted piece index)
+        The destinations are indexed by the moving piece's square (-1 where there's no move). The mask says where
+        the path is clear; landing on an occupied square is left to the legality of the resulting position.
+        """
+        moves = []
+        for d_row, d_column in KING_STEPS:
+            destination = step(d_row, d_column)
+            moves.append((0, destination, destination[self.grid(0)] >= 0, None))
+        for index, piece in enumerate(self.pieces):
+            axis = 2 + index
+            origin = self.grid(axis)
+            if piece == 'N':
+                for d_row, d_column in KNIGHT_STEPS:
+                    destination = step(d_row, d_column)
+                    moves.append((axis, destination, destination[origin] >= 0, None))
+            elif piece == 'P':
+                # White pawns move up the board, towards row 0, and promote there
+                destination = step(-1, 0)
+                promotes = ROWS[origin] == 1
+                moves.append((axis, destination, (destination[origin] >= 0) & ~promotes, None))
+                moves.append((axis, destination, promotes, index))
+                double = step(-2, 0)
+                moves.append((axis, double, (ROWS[origin] == 6) & ~self.occupied(destination[origin], axis), None))
+            else:
+                for d_row, d_column in SLIDES[piece]:
+                    clear = np.ones((1,) * self.ndim, dtype=bool)
+                    for distance in range(1, 8):
+                        destination = step(d_row, d_column, distance)
+                        valid = clear & (destination[origin] >= 0)
+                        moves.append((axis, destination, valid, None))
+                        clear = valid & ~self.occupied(destination[origin], axis)
+        return moves
+
+    def attacks_weak_king(self, moves):
+        """ Whether the strong side attacks the weak king's square """
+        weak_king = self.grid(1)
+        attacked = DISTANCE[self.grid(0), weak_king] <= 1
+        for axis, destination, valid, promotion in moves:
+            if axis > 1 and self.pieces[axis - 2] != 'P' and promotion is None:
+                attacked = attacked | (valid & (destination[self.grid(axis)] == weak_king))
+        for index, piece in enumerate(self.pieces):
+            if piece == 'P':
+                origin = self.grid(2 + index)
+                for d_column in (-1, 1):
+                    attacked = attacked | (step(-1, d_column)[origin] == weak_king)
+        return np.broadcast_to(attacked, self.shape)
+
+    def solve(self):
+        shape = self.shape
+        # Legal placements: one piece per square, kings apart and no pawns on the first or last row
+        legal = DISTANCE[self.grid(0), self.grid(1)] > 1
+        for axis in range(self.ndim):
+            for other in range(axis + 1, self.ndim):
+                legal = legal & (self.grid(axis) != self.grid(other))
+        for index, piece in enumerate(self.pieces):
+            if piece == 'P':
+                row = ROWS[self.grid(2 + index)]
+                legal = legal & (row > 0) & (row < 7)
+        legal = np.broadcast_to(legal, shape)
+
+        moves = self.strong_moves()
+        check = self.attacks_weak_king(moves)
+        # The side that just moved can't have left its king in check
+        self.strong_legal = legal & ~check
+        self.weak_legal = legal
+
+        # Weak king moves, with captures looked up in the ending that's left
+        captures = [(2 + index, ending, self.axes_of(ending, removed=index))
+                    for index, ending in enumerate(self.captures)]
+        weak_moves = []
+        for d_row, d_column in KING_STEPS:
+            destination = step(d_row, d_column)
+            landing = destination[self.grid(1)]
+            clipped = np.maximum(destination, 0)
+            move_legal = np.take(self.strong_legal, clipped, axis=1) & (landing >= 0)
+            captured = np.zeros(shape, dtype=bool)
+            capture_dtm = np.full(shape, UNSOLVED, dtype=np.int16)
+            for axis, ending, reorder in captures:
+                here = np.broadcast_to(landing == self.grid(axis), shape)
+                move_legal = move_legal | (here & np.take(reorder(ending.strong_legal), clipped, axis=1))
+                capture_dtm = np.where(here, np.take(reorder(ending.strong_dtm), clipped, axis=1), capture_dtm)
+                captured = captured | here
+            weak_moves.append((clipped, move_legal, captured, capture_dtm))
+        has_move = np.zeros(shape, dtype=bool)
+        for clipped, move_legal, captured, capture_dtm in weak_moves:
+            has_move |= move_legal
+
+        promotions = {index: self.axes_of(ending, replaced=index) for index, ending in self.promotions.items()}
+        longest_promotion = max([int(ending.weak_dtm.max()) for ending in self.promotions.values()] + [0])
+
+        self.strong_dtm = np.full(shape, UNSOLVED, dtype=np.int16)
+        self.weak_dtm = np.full(shape, UNSOLVED, dtype=np.int16)
+        self.weak_dtm[self.weak_legal & check & ~has_move] = 0
+
+        plies = 1
+        last_found = 0
+        while plies <= max(last_found, longest_promotion + 1) + 2:
+            if plies % 2:
+                # Strong side to move wins if any move reaches a position lost by the weak side a ply sooner
+                lost = self.weak_dtm == plies - 1
+                found = np.zeros(shape, dtype=bool)
+                for axis, destination, valid, promotion in moves:
+                    if promotion is None:
+                        target = lost
+                    else:
+                        target = promotions[promotion](self.promotions[promotion].weak_dtm) == plies - 1
+                    found |= valid & np.take(target, np.maximum(destination, 0), axis=axis)
+                found &= self.strong_legal & (self.strong_dtm == UNSOLVED)
+                self.strong_dtm[found] = plies
+            else:
+                # Weak side to move loses if every move reaches a position the strong side already wins
+                found = self.weak_legal & has_move & (self.weak_dtm == UNSOLVED)
+                for clipped, move_legal, captured, capture_dtm in weak_moves:
+                    successor = np.where(captured, capture_dtm, np.take(self.strong_dtm, clipped, axis=1))
+                    found &= ~move_legal | ((successor >= 0) & (successor < plies))
+                self.weak_dtm[found] = plies
+            if found.any():
+                last_found = plies
+            plies += 1
+
+    def tables(self):
+        """ (strong king on the a-d files half) WDL and DTM arrays, strong side to move first """
+        dtm = np.stack([self.strong_dtm[HALF_BOARD], self.weak_dtm[HALF_BOARD]])
+        return dtm >= 0, np.where(dtm >= 0, dtm + 1, 0)
+
+    def write(self, directory):
+        """ Write NAME.wdl and NAME.dtm to directory """
+        os.makedirs(directory, exist_ok=True)
+        wdl, dtm = self.tables()
+        bits = max(int(dtm.max()).bit_length(), 1)
+        for extension, values, width in (('wdl', wdl, 1), ('dtm', dtm, bits)):
+            values = values.ravel().astype(np.uint8)
+            # Bit i of entry j is bit j * width + i of the file, least significant bit first
+            packed = ((values[:, None] >> np.arange(width, dtype=np.uint8)) & 1).astype(np.uint8)
+            with open(os.path.join(directory, f'{self.name}.{extension}'), 'wb') as table:
+                table.write(HEADER.pack(MAGIC, width, len(self.pieces) + 2, 0, len(values)))
+                table.write(np.packbits(packed.ravel(), bitorder='little').tobytes())
+
+
+def solve(pieces, solved=None):
+    """ Solve an ending and every ending it can turn into
+    :param pieces: strong side's pieces besides the king, i.e. 'BN' for KBNK
+    :param solved: {pieces: Ending} already solved, shared between calls
+    :return: Ending
+    """
+    solved = solved if solved is not None else {}
+    pieces = canonical(pieces)
+    if pieces not in solved:
+        solved[pieces] = Ending(pieces, solved)
+    return solved[pieces]
+
+
+def generate(names, directory=DEFAULT_DIRECTORY):
+    """ Solve and write endings given by name, i.e. ['KQK', 'KRK', 'KPK', 'KBNK'] """
+    solved = {}
+    for name in names:
+        if len(name) < 3 or name[0] != 'K' or name[-1] != 'K' or any(piece not in PIECE_ORDER for piece in name[1:-1]):
+            raise ValueError(f'Only K + pieces vs K endings can be generated, not {name!r}')
+        start = time.perf_counter()
+        ending = solve(name[1:-1], solved)
+        ending.write(directory)
+        print(f'{ending.name:6} longest mate {int(ending.strong_dtm.max()):3} plies, '
+              f'{int((ending.strong_dtm >= 0).sum()):9} wins with the strong side to move '
+              f'{time.perf_counter() - start:7.1f}s')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate endgame tablebases')
+    parser.add_argument('endings', nargs='*', default=['KQK', 'KRK', 'KPK', 'KBNK'])
+    parser.add_argument('--directory', default=DEFAULT_DIRECTORY)
+    args = parser.parse_args()
+    generate(args.endings, args.directory)
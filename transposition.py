@@ -0,0 +1,141 @@
+"""
+Transposition Table
+DS 3500 Final Project
+"""
+
+# Bound types, whether a stored score is exact or only a lower/upper bound on the real score
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class TranspositionTable:
+    """ Fixed size hash table of searched positions
+
+    Every bucket has two slots. The first keeps the deepest entry the current search stored for the
+    bucket, and is taken over by anything once its entry is left from an older search. The second is
+    always replaced, so the table never grows past the size it was made with.
+    """
+
+    # Rough size of one entry: the list slot, the entry tuple and the ints/move it holds
+    ENTRY_BYTES = 200
+
+    def __init__(self, size_mb=16):
+        """
+        Attributes:
+            size_mb (int): memory budget of the table in MB
+            generation (int): search counter, entries from older searches are replaced first
+            hits, misses, stores, overwrites (int): counters of probes and stores
+        """
+        self.size_mb = size_mb
+        self.buckets = max(1, size_mb * 2 ** 20 // (2 * TranspositionTable.ENTRY_BYTES))
+        self.table = [None] * (2 * self.buckets)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def __len__(self):
+        """ Number of entries in use """
+        return sum(entry is not None for entry in self.table)
+
+    def resize(self, size_mb):
+        """ Change the size of the table, clearing it """
+        self.__init__(size_mb)
+
+    def clear(self):
+        self.table = [None] * (2 * self.buckets)
+        self.generation = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.hits = self.misses = self.stores = self.overwrites = 0
+
+    def new_search(self):
+        """ Age the table so a new search prefers to replace what the previous ones stored """
+        self.generation += 1
+
+    def hit_rate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def stats(self):
+        """ Counters as a dict """
+        return {'size_mb': self.size_mb, 'entries': 2 * self.buckets, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate(), 'stores': self.stores, 'overwrites': self.overwrites}
+
+    def probe(self, key):
+        """ Look up a position
+        :param key: Zobrist key of the position
+        :return: (depth, bound, score, best move) or None
+        """
+        index = 2 * (key % self.buckets)
+        for entry in (self.table[index], self.table[index + 1]):
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1:5]
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        """ Store a searched position
+        :param key: Zobrist key of the position
+        :param depth: depth the position was searched to
+        :param bound: EXACT, LOWER or UPPER
+        :param score: score of the position
+        :param move: best move found, or None
+        """
+        index = 2 * (key % self.buckets)
+        entry = (key, depth, bound, score, move, self.generation)
+        deep = self.table[index]
+        self.stores += 1
+
+        # Depth-preferred slot: take it if it's empty, stale, or not as deep, even from the same position, so a
+        # shallower search of it goes to the other slot instead of overwriting the deeper result
+        if deep is None or deep[5] != self.generation or depth >= deep[1]:
+            if deep is not None and deep[0] != key:
+                self.overwrites += 1
+            self.table[index] = entry
+        else:
+            recent = self.table[index + 1]
+            if recent is not None and recent[0] != key:
+                self.overwrites += 1
+            self.table[index + 1] = entry
+
+
+class PawnHashTable:
+    """ Fixed size cache of pawn structure evaluations keyed by the pawn-only Zobrist key
+
+    The pawns change on few moves, so most positions in a search share a handful of pawn structures.
+    A slot is simply overwritten on a collision.
+    """
+
+    def __init__(self, entries=16384):
+        """
+        Attributes:
+            entries (int): number of slots
+            hits, misses (int): counters of probes
+        """
+        self.entries = entries
+        self.table = [None] * entries
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.table = [None] * self.entries
+        self.hits = self.misses = 0
+
+    def hit_rate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def probe(self, key):
+        """ Return the stored pawn structure of key, or None """
+        entry = self.table[key % self.entries]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def store(self, key, structure):
+        self.table[key % self.entries] = (key, structure)
@@ -0,0 +1,232 @@
+"""
+Texel Tuning
+DS 3500 Final Project
+
+Fits the evaluation weights in weights.py to game results: the evaluation of every labelled position,
+squashed by a sigmoid, should predict how the game ended. Positions are streamed from disk in chunks
+and turned into NumPy feature arrays once, cached in a binary file next to the data, so every later
+pass only reads numbers back. Memory use depends on the chunk size, never on the number of positions.
+
+Each line of the data is a FEN (or EPD) followed by the game's result for White, i.e.
+    rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w - - 0 2 [0.5]
+with the result written as 1-0, 0-1, 1/2-1/2 or a number from 0 to 1 (brackets, quotes and a
+trailing semicolon are allowed). Quiet positions, taken from real games, work best.
+"""
+
+import math
+import os
+import sys
+import time
+import numpy as np
+from batch_eval import PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, features, weight_vector
+from weights import DEFAULT_WEIGHTS, WEIGHTS_FILE, load_weights, save_weights
+
+# Positions read, and cached rows processed, at a time
+CHUNK_SIZE = 65536
+RESULTS = {'1-0': 1.0, '0-1': 0.0, '1/2-1/2': 0.5}
+FEN_CODES = {'P': PAWN, 'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+FEN_CODES.update({letter.lower(): -code for letter, code in list(FEN_CODES.items())})
+# Each cached row: piece-square score, every weighted term, result
+ROW = len(DEFAULT_WEIGHTS) + 2
+# Range the sigmoid's scaling constant is searched in
+SCALE_RANGE = (0.05, 10.0)
+
+# Adam optimiser settings
+BETA1 = 0.9
+BETA2 = 0.999
+EPSILON = 1e-8
+
+
+def parse_line(line):
+    """ Piece placement and result of a labelled position
+    :return: (placement, result for White from 0 to 1)
+    """
+    tokens = line.translate(str.maketrans('[]";', '    ')).split()
+    if len(tokens) < 2:
+        raise ValueError(f'position needs a FEN and a result: {line!r}')
+    label = tokens[-1]
+    if label in RESULTS:
+        result = RESULTS[label]
+    else:
+        try:
+            result = float(label)
+        except ValueError:
+            raise ValueError(f'unknown result {label!r}: {line!r}') from None
+        if not 0 <= result <= 1:
+            raise ValueError(f'result must be between 0 and 1: {line!r}')
+    return tokens[0], result
+
+
+def encode_placement(placement):
+    """ FEN piece placement as a (64,) int8 array, encoded like batch_eval.encode """
+    codes = np.zeros(64, dtype=np.int8)
+    square = 0
+    for character in placement:
+        if character == '/':
+            continue
+        if character.isdigit():
+            square += int(character)
+        elif character in FEN_CODES and square < 64:
+            codes[square] = FEN_CODES[character]
+            square += 1
+        else:
+            raise ValueError(f'bad piece placement {placement!r}')
+    if square != 64:
+        raise ValueError(f'piece placement needs 64 squares: {placement!r}')
+    return codes
+
+
+def labelled_chunks(path, chunk_size=CHUNK_SIZE):
+    """ Yield (positions, results) arrays of up to chunk_size labelled positions at a time
+    Lines that can't be read are skipped and counted on stderr.
+    """
+    positions = np.zeros((chunk_size, 64), dtype=np.int8)
+    results = np.zeros(chunk_size)
+    count = 0
+    skipped = 0
+    with open(path) as data:
+        for line in data:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                placement, result = parse_line(line)
+                positions[count] = encode_placement(placement)
+            except ValueError:
+                skipped += 1
+                continue
+            results[count] = result
+            count += 1
+            if count == chunk_size:
+                yield positions, results
+                count = 0
+    if count:
+        yield positions[:count], results[:count]
+    if skipped:
+        print(f'skipped {skipped} lines that are not labelled positions', file=sys.stderr)
+
+
+def build_cache(data_path, cache_path, chunk_size=CHUNK_SIZE):
+    """ Extract the features of every labelled position into a cache file of float32 rows
+    :return: number of positions
+    """
+    count = 0
+    with open(cache_path, 'wb') as cache:
+        for positions, results in labelled_chunks(data_path, chunk_size):
+            psqt, terms = features(positions)
+            np.column_stack([psqt, terms, results]).astype(np.float32).tofile(cache)
+            count += len(results)
+    return count
+
+
+def cached_chunks(cache_path, chunk_size=CHUNK_SIZE):
+    """ Yield (piece-square scores, terms, results) of up to chunk_size cached positions at a time """
+    rows = os.path.getsize(cache_path) // (ROW * 4)
+    if not rows:
+        return
+    cache = np.memmap(cache_path, dtype=np.float32, mode='r', shape=(rows, ROW))
+    for start in range(0, rows, chunk_size):
+        chunk = np.asarray(cache[start:start + chunk_size], dtype=np.float64)
+        yield chunk[:, 0], chunk[:, 1:-1], chunk[:, -1]
+
+
+def sigmoid(scores, scale):
+    """ Expected result for White of positions evaluated at scores (in pawns) """
+    return 1 / (1 + np.exp(-scale * math.log(10) / 4 * scores))
+
+
+def mean_error(cache_path, weights, scale, chunk_size=CHUNK_SIZE):
+    """ Mean squared difference between the results and what the evaluation predicts """
+    total = 0.0
+    count = 0
+    for psqt, terms, results in cached_chunks(cache_path, chunk_size):
+        total += ((results - sigmoid(psqt + terms @ weights, scale)) ** 2).sum()
+        count += len(results)
+    return total / count if count else 0.0
+
+
+def fit_scale(cache_path, weights, chunk_size=CHUNK_SIZE, iterations=30):
+    """ Sigmoid scaling constant that fits the current weights best, by golden-section search """
+    ratio = (math.sqrt(5) - 1) / 2
+    low, high = SCALE_RANGE
+    for _ in range(iterations):
+        left = high - ratio * (high - low)
+        right = low + ratio * (high - low)
+        if mean_error(cache_path, weights, left, chunk_size) < mean_error(cache_path, weights, right, chunk_size):
+            high = right
+        else:
+            low = left
+    return (low + high) / 2
+
+
+def tune(data_path, output_path=WEIGHTS_FILE, epochs=10, learning_rate=.01, chunk_size=CHUNK_SIZE, scale=None,
+         start_path=WEIGHTS_FILE):
+    """ Fit the evaluation weights to labelled positions and write them to output_path
+    Every chunk takes one Adam step on the gradient of the mean squared error over that chunk.
+    :param data_path: file of labelled positions
+    :param epochs: passes over the data
+    :param learning_rate: Adam step size
+    :param scale: sigmoid scaling constant, fitted to the starting weights when None
+    :param start_path: weights file to start from, the defaults are used where it has none
+    :return: (tuned weights dict, error before, error after)
+    """
+    cache_path = data_path + '.features'
+    if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(data_path):
+        start = time.perf_counter()
+        count = build_cache(data_path, cache_path, chunk_size)
+        print(f'extracted features of {count} positions in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+    weights = weight_vector(load_weights(start_path))
+    if scale is None:
+        scale = fit_scale(cache_path, weights, chunk_size)
+        print(f'sigmoid scale {scale:.4f}', file=sys.stderr)
+    factor = scale * math.log(10) / 4
+    before = mean_error(cache_path, weights, scale, chunk_size)
+
+    moment = np.zeros_like(weights)
+    second_moment = np.zeros_like(weights)
+    steps = 0
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        for psqt, terms, results in cached_chunks(cache_path, chunk_size):
+            predicted = sigmoid(psqt + terms @ weights, scale)
+            gradient = (2 * (predicted - results) * predicted * (1 - predicted) * factor) @ terms / len(results)
+
+            steps += 1
+            moment = BETA1 * moment + (1 - BETA1) * gradient
+            second_moment = BETA2 * second_moment + (1 - BETA2) * gradient ** 2
+            corrected = moment / (1 - BETA1 ** steps)
+            corrected_second = second_moment / (1 - BETA2 ** steps)
+            weights -= learning_rate * corrected / (np.sqrt(corrected_second) + EPSILON)
+        error = mean_error(cache_path, weights, scale, chunk_size)
+        print(f'epoch {epoch}: error {error:.6f} ({time.perf_counter() - start:.1f}s)', file=sys.stderr)
+
+    after = mean_error(cache_path, weights, scale, chunk_size)
+    tuned = {name: round(float(weight), 4) for name, weight in zip(DEFAULT_WEIGHTS, weights)}
+    save_weights(tuned, output_path)
+    return tuned, before, after
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Tune the evaluation weights to game results')
+    parser.add_argument('data', help='labelled positions, a FEN and the result for White per line')
+    parser.add_argument('--output', default=WEIGHTS_FILE, help='weights file to write (default: the one the '
+                                                               'engine loads)')
+    parser.add_argument('--start', default=WEIGHTS_FILE, help='weights file to start from (default: the one the '
+                                                              'engine loads, or the hand-picked weights)')
+    parser.add_argument('--epochs', type=int, default=10, help='passes over the data')
+    parser.add_argument('--rate', type=float, default=.01, help='learning rate')
+    parser.add_argument('--chunk', type=int, default=CHUNK_SIZE, help='positions held in memory at once')
+    parser.add_argument('--scale', type=float, default=None, help='sigmoid scaling constant (default: fitted)')
+    args = parser.parse_args()
+
+    tuned, before, after = tune(args.data, args.output, args.epochs, args.rate, args.chunk, args.scale, args.start)
+    for name, weight in tuned.items():
+        print(f'{name:24} {DEFAULT_WEIGHTS[name]:8.4f} -> {weight:8.4f}')
+    print(f'error {before:.6f} -> {after:.6f}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+"""
+UCI Front End
+DS 3500 Final Project
+
+Speaks the Universal Chess Interface over stdin/stdout so the engine can play in GUIs and
+tournament managers. Searches run on a worker thread, so stop and ponderhit are handled while
+the engine thinks and stop gets a best move back as soon as the search unwinds.
+"""
+
+from chess import Chess, START_FEN
+from engine import MATE, MATE_BOUND
+from parallel import ParallelSearch
+from book import OpeningBook
+from tablebase import Tablebases
+import sys
+import threading
+import time
+
+NAME = 'DS3500 Chess Engine'
+AUTHOR = 'DS 3500 Final Project'
+# Deepest search a timed, infinite or ponder search can go to
+MAX_DEPTH = 64
+# Share of the remaining clock to spend on a move when the GUI doesn't say how many moves are left
+MOVES_TO_GO = 30
+
+# name: (UCI declaration, default)
+OPTIONS = {
+    'Hash': ('type spin default 16 min 1 max 1024', 16),
+    'Threads': ('type spin default 1 min 1 max 64', 1),
+    'Depth': ('type spin default 4 min 1 max 64', 4),
+    'MoveTime': ('type spin default 0 min 0 max 3600000', 0),
+    'Ponder': ('type check default false', False),
+    'BookFile': ('type string default <empty>', ''),
+    'TablebasePath': ('type string default <empty>', ''),
+}
+
+
+def parse_go(tokens):
+    """ Parameters of a go command as a dict, flags (infinite, ponder) map to True """
+    limits = {}
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token in ('infinite', 'ponder'):
+            limits[token] = True
+        elif token == 'searchmoves':
+            # Every token after searchmoves is a move
+            limits[token] = tokens[index + 1:]
+            break
+        elif index + 1 < len(tokens):
+            try:
+                limits[token] = int(tokens[index + 1])
+            except ValueError:
+                pass
+            index += 1
+        index += 1
+    return limits
+
+
+class UCI:
+
+    def __init__(self, output=sys.stdout):
+        """ UCI session driving one Chess game
+        Attributes:
+            game (obj): Chess game holding the position the GUI set up
+            output (file): where responses are written
+            options (dict): current value of every option
+            thread (obj): thread running the current search, if any
+            pondering (bool): whether the current search is pondering on the opponent's time
+        """
+        self.game = Chess()
+        self.output = output
+        self.options = {name: default for name, (declaration, default) in OPTIONS.items()}
+        self.thread = None
+        self.pondering = False
+        self.infinite = False
+        self.ponder_time = None
+        # Set once an infinite or ponder search may report its best move
+        self.released = threading.Event()
+        self.lock = threading.Lock()
+
+    def send(self, line):
+        with self.lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    @staticmethod
+    def move_name(board, move):
+        """ Move in UCI notation, i.e. 'e2e4' or 'e7e8q' """
+        (start_row, start_col), (end_row, end_col) = move
+        name = Chess.uncoordinate(move[0]) + Chess.uncoordinate(move[1])
+        if board[start_row][start_col].name == 'Pawn' and end_row in (0, 7):
+            name += 'q'
+        return name
+
+    @staticmethod
+    def score_name(score):
+        """ Score for the side to move in UCI notation, centipawns or moves to mate """
+        if score >= MATE_BOUND:
+            return f'mate {(MATE - score + 1) // 2}'
+        if score <= -MATE_BOUND:
+            return f'mate {-((MATE + score) // 2)}'
+        return f'cp {round(score * 100)}'
+
+    # %% Commands
+
+    def handle(self, line):
+        """ Carry out one command
+        :return: False after quit, True otherwise
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f'id name {NAME}')
+            self.send(f'id author {AUTHOR}')
+            for name, (declaration, default) in OPTIONS.items():
+                self.send(f'option name {name} {declaration}')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.set_option(arguments)
+        elif command == 'ucinewgame':
+            self.wait()
+            self.game.transposition_table.clear()
+            self.game.engine.orderer.reset()
+        elif command == 'position':
+            self.wait()
+            self.set_position(arguments)
+        elif command == 'go':
+            self.wait()
+            self.go(parse_go(arguments))
+        elif command == 'stop':
+            self.stop()
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'quit':
+            self.stop()
+            return False
+        return True
+
+    def set_option(self, arguments):
+        """ setoption name <name> [value <value>] """
+        if 'name' not in arguments:
+            return
+        value_at = arguments.index('value') if 'value' in arguments else len(arguments)
+        name = ' '.join(arguments[arguments.index('name') + 1:value_at])
+        value = ' '.join(arguments[value_at + 1:])
+        if name not in OPTIONS:
+            self.send(f'info string unknown option {name}')
+            return
+
+        self.wait()
+        default = OPTIONS[name][1]
+        if isinstance(default, bool):
+            value = value.lower() == 'true'
+        elif isinstance(default, int):
+            try:
+                value = int(value)
+            except ValueError:
+                self.send(f'info string {name} needs a number')
+                return
+        self.options[name] = value
+
+        game = self.game
+        if name == 'Hash':
+            game.transposition_table.resize(value)
+        elif name == 'Threads':
+            game.workers = value
+            if game.parallel_search is not None:
+                game.parallel_search.close()
+                game.parallel_search = None
+        elif name == 'BookFile':
+            game.book = OpeningBook(value) if value and value != '<empty>' else None
+        elif name == 'TablebasePath':
+            game.tablebases = Tablebases(value) if value and value != '<empty>' else None
+
+    def set_position(self, arguments):
+        """ position [startpos | fen <fen>] [moves <move> ...] """
+        moves_at = arguments.index('moves') if 'moves' in arguments else len(arguments)
+        if arguments and arguments[0] == 'fen':
+            fen = ' '.join(arguments[1:moves_at])
+        else:
+            fen = START_FEN
+        game = self.game
+        try:
+            game.load_fen(fen)
+        except ValueError as error:
+            self.send(f'info string {error}')
+            return
+
+        for name in arguments[moves_at + 1:]:
+            try:
+                start, end = Chess.coordinate(name[0:2]), Chess.coordinate(name[2:4])
+            except ValueError:
+                start = end = None
+            if end not in game.get_valid_moves().get(start, []):
+                self.send(f'info string illegal move {name}')
+                return
+            game.make_move(start[0], start[1], end[0], end[1], update_status=False)
+
+    def go(self, limits):
+        """ Start searching the current position on the worker thread """
+        game = self.game
+        game.engine_color = game.turn
+        self.pondering = bool(limits.get('ponder'))
+        self.infinite = bool(limits.get('infinite'))
+        if self.pondering or self.infinite:
+            self.released.clear()
+        else:
+            self.released.set()
+
+        # Time to use on this move: movetime, else a share of the clock
+        clock, increment = ('wtime', 'winc') if game.turn == 'White' else ('btime', 'binc')
+        if 'movetime' in limits:
+            time_limit = limits['movetime'] / 1000
+        elif clock in limits:
+            moves_to_go = limits.get('movestogo', MOVES_TO_GO)
+            time_limit = (limits[clock] / max(moves_to_go, 1) + limits.get(increment, 0) / 2) / 1000
+            # Never plan to use more than most of what's left
+            time_limit = min(time_limit, limits[clock] * 0.8 / 1000)
+        elif self.options['MoveTime']:
+            time_limit = self.options['MoveTime'] / 1000
+        else:
+            time_limit = None
+
+        if 'depth' in limits:
+            depth = limits['depth']
+        elif time_limit is not None or self.infinite or self.pondering or 'nodes' in limits:
+            depth = MAX_DEPTH
+        else:
+            depth = self.options['Depth']
+
+        # A ponder search starts without a clock, ponderhit gives it the time it would have had
+        self.ponder_time = time_limit if self.pondering else None
+        if self.pondering or self.infinite:
+            time_limit = None
+
+        # Cleared here rather than in the search, so a stop sent before the thread gets going still counts
+        game.engine.clear_stop()
+        self.thread = threading.Thread(target=self.search, args=(depth, time_limit, limits.get('nodes'),
+                                                                  limits.get('searchmoves')), daemon=True)
+        self.thread.start()
+
+    def search(self, depth, time_limit, node_limit, search_moves):
+        """ Worker thread: search, then report the best move """
+        game = self.game
+        board = game.chess_board.board
+        started = time.perf_counter()
+        result = None
+
+        legal_moves = [(start, end) for start, ends in game.get_valid_moves().items() for end in ends]
+        if search_moves:
+            named = {UCI.move_name(board, move): move for move in legal_moves}
+            legal_moves = [named[name] for name in search_moves if name in named]
+
+        if game.book is not None and not self.pondering and not self.infinite:
+            book_move = game.book.choose(board, game.turn, legal_moves)
+            if book_move is not None:
+                self.send('info string book move')
+                self.finish(book_move, None)
+                return
+
+        def report(iteration, stats):
+            elapsed = time.perf_counter() - started
+            pv = []
+            # Moves are named on the position they're played in, so play the PV out and take it back
+            undos = []
+            for move in iteration.pv:
+                pv.append(UCI.move_name(game.chess_board.board, move))
+                undos.append(game.make_move(move[0][0], move[0][1], move[1][0], move[1][1], update_status=False))
+            for undo in reversed(undos):
+                game.unmake_move(undo)
+            self.send(f'info depth {iteration.depth} seldepth {stats.seldepth} score {UCI.score_name(iteration.score)} '
+                      f'nodes {stats.nodes} nps {round(stats.nps)} time {round(elapsed * 1000)} pv {" ".join(pv)}')
+
+        if game.workers > 1 and time_limit is None and node_limit is None and not search_moves and \
+                not self.pondering and not self.infinite:
+            # The process pool can only search to a fixed depth
+            if game.parallel_search is None:
+                game.parallel_search = ParallelSearch(game, game.workers)
+            result = game.parallel_search.search(depth)
+        elif legal_moves:
+            engine = game.engine
+            engine.on_iteration = report
+            try:
+                result = engine.search(depth, time_limit=time_limit, node_limit=node_limit,
+                                       moves=legal_moves if search_moves else None)
+            finally:
+                engine.on_iteration = None
+
+        # Infinite and ponder searches only report once the GUI says so
+        self.released.wait()
+        move = result.move if result is not None else None
+        ponder = result.pv[1] if result is not None and len(result.pv) > 1 and result.pv[0] == move else None
+        self.finish(move, ponder)
+
+    def finish(self, move, ponder):
+        board = self.game.chess_board.board
+        if move is None:
+            self.send('bestmove 0000')
+        elif ponder is None:
+            self.send(f'bestmove {UCI.move_name(board, move)}')
+        else:
+            # The ponder move is named on the board after the best move
+            undo = self.game.make_move(move[0][0], move[0][1], move[1][0], move[1][1], update_status=False)
+            ponder_name = UCI.move_name(self.game.chess_board.board, ponder)
+            self.game.unmake_move(undo)
+            self.send(f'bestmove {UCI.move_name(board, move)} ponder {ponder_name}')
+
+    def stop(self):
+        """ Stop the search and wait for its best move """
+        if self.thread is not None:
+            self.infinite = self.pondering = False
+            self.game.engine.stop()
+            self.released.set()
+            self.thread.join()
+            self.thread = None
+
+    def ponderhit(self):
+        """ The opponent played the expected move, keep searching as a normal search """
+        if self.thread is None or not self.pondering:
+            return
+        if self.ponder_time is not None:
+            self.game.engine.set_deadline(self.ponder_time)
+        self.pondering = False
+        if not self.infinite:
+            self.released.set()
+
+    def wait(self):
+        """ Let a finite search finish before the position changes under it """
+        if self.thread is not None:
+            if self.infinite or self.pondering:
+                self.stop()
+            else:
+                self.thread.join()
+                self.thread = None
+
+
+def run(input_stream=sys.stdin, output=sys.stdout):
+    """ Read UCI commands until quit or the end of the input """
+    session = UCI(output)
+    for line in input_stream:
+        if not session.handle(line):
+            return
+    session.wait()
+
+
+if __name__ == '__main__':
+    run()
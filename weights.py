@@ -0,0 +1,51 @@
+"""
+Evaluation Weights
+DS 3500 Final Project
+
+Weights of the terms Chess.opening, middle_game and end_game add up. The hand-picked defaults are
+overridden by weights.json next to this file when there is one, which is what tune.py writes.
+"""
+
+import json
+import os
+
+WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'weights.json')
+
+# name: hand-picked weight, in the order batch_eval.features returns the terms
+DEFAULT_WEIGHTS = {
+    'opening_material': 1.0,
+    'opening_center_control': .15,
+    'opening_control': .1,
+    'middle_material': 1.0,
+    'middle_control': .2,
+    'middle_doubled': .1,
+    'middle_isolated': .1,
+    'middle_backward': .05,
+    'middle_open_files': .1,
+    'end_material': 1.2,
+    'end_control': .1,
+    'end_passed': .25,
+}
+
+
+def load_weights(path=WEIGHTS_FILE):
+    """ Default weights updated with those in a JSON file, just the defaults if the file doesn't exist """
+    weights = dict(DEFAULT_WEIGHTS)
+    if os.path.exists(path):
+        with open(path) as file:
+            loaded = json.load(file)
+        unknown = set(loaded) - set(DEFAULT_WEIGHTS)
+        if unknown:
+            raise ValueError(f'unknown evaluation weights in {path}: {", ".join(sorted(unknown))}')
+        weights.update({name: float(value) for name, value in loaded.items()})
+    return weights
+
+
+def save_weights(weights, path=WEIGHTS_FILE):
+    with open(path, 'w') as file:
+        json.dump({name: weights[name] for name in DEFAULT_WEIGHTS}, file, indent=4)
+        file.write('\n')
+
+
+# Loaded once, when the evaluator is first imported
+WEIGHTS = load_weights()
@@ -0,0 +1,49 @@
+"""
+Zobrist Hashing
+DS 3500 Final Project
+"""
+
+import random
+
+# Fixed seed so the same position always gets the same key, between runs and between processes
+_rng = random.Random(3500)
+
+COLORS = ('White', 'Black')
+NAMES = ('Pawn', 'Knight', 'Bishop', 'Rook', 'Queen', 'King')
+
+# One random 64 bit key per (color, piece name) per square, indexed [row][column]
+PIECE_KEYS = {(color, name): [[_rng.getrandbits(64) for _ in range(8)] for _ in range(8)]
+              for color in COLORS for name in NAMES}
+# Xored in when Black is to move
+BLACK_TO_MOVE = _rng.getrandbits(64)
+
+
+def piece_key(piece, row, column):
+    """ Key of a piece standing on (row, column) """
+    return PIECE_KEYS[(piece.color, piece.name)][row][column]
+
+
+def hash_board(board, turn):
+    """ Hash a position from scratch, make_move keeps it up to date after that
+    :param board: 2d list of pieces
+    :param turn: side to move
+    :return: 64 bit key
+    """
+    key = BLACK_TO_MOVE if turn == 'Black' else 0
+    for row in range(8):
+        for column in range(8):
+            piece = board[row][column]
+            if piece != '--':
+                key ^= PIECE_KEYS[(piece.color, piece.name)][row][column]
+    return key
+
+
+def hash_pawns(board):
+    """ Hash only the pawns of a position, make_move keeps it up to date after that """
+    key = 0
+    for row in range(8):
+        for column in range(8):
+            piece = board[row][column]
+            if piece != '--' and piece.name == 'Pawn':
+                key ^= PIECE_KEYS[(piece.color, piece.name)][row][column]
+    return key